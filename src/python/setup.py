@@ -7,5 +7,7 @@ setuptools.setup(
     description='strelka: container-based file analysis at scale',
     license='Apache 2.0',
     packages=setuptools.find_packages(),
-    scripts=['bin/strelka-backend', 'bin/strelka-mmrpc']
+    scripts=['bin/strelka-backend', 'bin/strelka-bench',
+             'bin/strelka-corpus', 'bin/strelka-loadgen',
+             'bin/strelka-mmrpc']
 )
@@ -1 +1,10 @@
-pass
+def scan_bytes(data, name='', config=None, **kwargs):
+    """Scans data in-process without a coordinator (see strelka.local)."""
+    from strelka import local
+    return local.scan_bytes(data, name=name, config=config, **kwargs)
+
+
+def scan_file(path, name=None, config=None, **kwargs):
+    """Scans a file in-process without a coordinator (see strelka.local)."""
+    from strelka import local
+    return local.scan_file(path, name=name, config=config, **kwargs)
@@ -0,0 +1,156 @@
+"""Runs slow external analyzers out of band.
+
+External analyzers (e.g. capa and FLOSS) can take minutes to analyze a file.
+Instead of running them inside the scan, scanners submit them to an
+AnalyzerPool, a bounded queue served by dedicated worker threads, and the
+scan continues with the next scanner. The backend does not wait for
+analyses; their results are emitted as follow-up events when they finish,
+until the request expires (see Backend.emit_deferred). Analyses are given
+the request's expiration date as their deadline.
+
+Results are cached in the coordinator by analyzer, analyzer version, and the
+SHA256 of the file, so later requests for the same file are answered without
+running the analyzer.
+"""
+import concurrent.futures
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+
+# Fingerprints of paths and the time they were computed (see fingerprint).
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def fingerprint(*paths, ttl=60):
+    """Identifies the version of files and directories (e.g. a tool and its rules).
+
+    The fingerprint changes when any file is added, removed, or modified.
+    Directories (e.g. rules) can hold many files, so fingerprints are
+    memoized and changes are noticed within ttl seconds.
+
+    Returns:
+        Hexadecimal string derived from the paths, sizes, and modification
+        times of the files.
+    """
+    now = time.monotonic()
+    with _fingerprints_lock:
+        cached = _fingerprints.get(paths)
+    if cached is not None and now - cached[1] < ttl:
+        return cached[0]
+
+    value = _fingerprint(paths)
+    with _fingerprints_lock:
+        _fingerprints[paths] = (value, now)
+    return value
+
+
+def _fingerprint(paths):
+    h = hashlib.sha1()
+    for path in paths:
+        if os.path.isdir(path):
+            entries = sorted(
+                os.path.join(root, name)
+                for (root, _, names) in os.walk(path)
+                for name in names
+            )
+        else:
+            entries = [path]
+        for entry in entries:
+            try:
+                stat = os.stat(entry)
+            except OSError:
+                continue
+            h.update(f'{entry}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode())
+    return h.hexdigest()[:16]
+
+
+def cached(coordinator, key):
+    """Returns the cached result of an analysis, or None."""
+    data = coordinator.get(f'analysis:{key}')
+    return None if data is None else json.loads(data)
+
+
+def analyze(coordinator, key, ttl, func, *args):
+    """Runs an analysis and caches its result.
+
+    Args:
+        coordinator: Redis client that stores results.
+        key: String that identifies the analyzer, its version, and the file.
+        ttl: Time (in seconds) that results are cached.
+        func: Function that returns a dictionary of event fields; problems
+            are listed under 'flags'.
+        *args: Arguments of func.
+    Returns:
+        Result of func. Results with flags are not cached.
+    """
+    result = func(*args)
+    if not result.get('flags'):
+        coordinator.set(f'analysis:{key}', json.dumps(result), ex=ttl)
+    return result
+
+
+class AnalyzerPool(object):
+    """Bounded queue of analyses served by dedicated worker threads.
+
+    Analyses run external processes, so threads are not limited by the GIL.
+    Workers are started on first use.
+
+    Attributes:
+        workers: Number of analyses that run concurrently.
+        size: Maximum number of queued analyses.
+    """
+    def __init__(self, workers=1, size=16):
+        self.workers = workers
+        self.size = size
+        self.queue = queue.Queue(size)
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def submit(self, expire_at, func, *args):
+        """Queues func(*args) and returns its future.
+
+        Analyses that are still queued at expire_at are cancelled.
+
+        Raises:
+            queue.Full: the queue is full.
+        """
+        with self.lock:
+            if not self.threads:
+                for _ in range(self.workers):
+                    thread = threading.Thread(target=self._work, daemon=True)
+                    thread.start()
+                    self.threads.append(thread)
+
+        future = concurrent.futures.Future()
+        self.queue.put_nowait((future, expire_at, func, args))
+        return future
+
+    def _work(self):
+        while True:
+            (future, expire_at, func, args) = self.queue.get()
+            if time.time() >= expire_at:
+                future.cancel()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name, workers=1, size=16):
+    """Returns the process-wide pool of an analyzer."""
+    with _pools_lock:
+        key = (name, workers, size)
+        if key not in _pools:
+            _pools[key] = AnalyzerPool(workers, size)
+        return _pools[key]
@@ -0,0 +1,215 @@
+"""Per-file memo of values derived from file data.
+
+Several scanners derive the same values from a file (hashes, decoded text,
+parsed containers). Artifacts computes each named value once per file, on
+first request, and shares it with every scanner that runs on the file.
+
+Producers are registered with the artifact decorator. They receive the
+file's Artifacts (its data and other artifacts) and the arguments of the
+request, if any; artifacts requested with different arguments are memoized
+separately:
+
+    @artifacts.artifact('text.utf8')
+    def utf8(artifacts):
+        return artifacts.data.decode()
+
+Scanners request artifacts from the file they are scanning:
+
+    sha256 = file.artifacts.get('digest.sha256')
+    pixmap = file.artifacts.get('pdf.pixmap', 0, 150)
+
+Shared artifacts may be mutable objects (e.g. an open ZipFile); scanners must
+not close or modify them.
+
+Errors raised by producers are memoized, but timeouts that interrupt a
+producer (e.g. the scanner timeout of the scanner that requested it) are not;
+the next request computes the artifact again.
+"""
+import io
+import threading
+import zipfile
+
+from strelka import digests
+from strelka import imagecache
+from strelka import strelka
+
+PRODUCERS = {}
+
+
+def _interrupted(e):
+    """Returns True if an exception is a timeout that interrupted a producer."""
+    return isinstance(e, (
+        strelka.ScannerTimeout,
+        strelka.DistributionTimeout,
+        strelka.RequestTimeout,
+    ))
+
+
+def artifact(name):
+    """Registers a function that produces a named artifact."""
+    def register(func):
+        PRODUCERS[name] = func
+        return func
+    return register
+
+
+class Artifacts(object):
+    """Lazily computes and memoizes named artifacts of file data.
+
+    Artifacts are computed while holding a lock, so concurrent requests for
+    the same artifact compute it once. If a producer raises an exception,
+    then the exception is memoized and raised to every caller.
+
+    Attributes:
+        data: Data that artifacts are derived from.
+        hits: Number of requests that were served from the memo.
+        misses: Number of requests that computed an artifact.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self._values = {}
+
+    def get(self, name, *args):
+        """Returns a named artifact, computing it on first request.
+
+        Args:
+            name: Name of the artifact.
+            *args: Arguments passed to the artifact's producer (e.g. a page
+                number). Each combination of arguments is memoized.
+        Raises:
+            KeyError: no producer is registered for name.
+            Exception: the producer raised an exception (or was interrupted
+                by a timeout, which is not memoized).
+        """
+        key = (name, *args) if args else name
+        with self._lock:
+            if key in self._values:
+                self.hits += 1
+            else:
+                producer = PRODUCERS[name]
+                self.misses += 1
+                try:
+                    self._values[key] = (producer(self, *args), None)
+                except Exception as e:
+                    if _interrupted(e):
+                        raise
+                    self._values[key] = (None, e)
+            (value, error) = self._values[key]
+        if error is not None:
+            raise error
+        return value
+
+    def cached(self, name, default=None):
+        """Returns a named artifact only if it was already computed or stored.
+
+        Failed artifacts return default.
+        """
+        with self._lock:
+            (value, error) = self._values.get(name, (default, None))
+        return default if error is not None else value
+
+    def put(self, name, value):
+        """Stores an artifact that was computed as a side effect of other work."""
+        with self._lock:
+            self._values.setdefault(name, (value, None))
+
+    def digests(self, names):
+        """Returns digests of the data, computing missing digests in one pass.
+
+        Args:
+            names: List of digest names (see strelka.digests). Each digest is
+                memoized as the artifact 'digest.<name>'.
+        Returns:
+            Dictionary of digest names to hex digests.
+        Raises:
+            Exception: a digest could not be computed.
+        """
+        with self._lock:
+            missing = [n for n in names if f'digest.{n}' not in self._values]
+            if missing:
+                try:
+                    computed = digests.digest(self.data, missing)
+                except Exception as e:
+                    if _interrupted(e):
+                        raise
+                    # Digests are computed (and fail) individually below.
+                    computed = {}
+                if computed:
+                    self.misses += 1
+                for (name, value) in computed.items():
+                    self._values[f'digest.{name}'] = (value, None)
+        return {name: self.get(f'digest.{name}') for name in names}
+
+    def stats(self):
+        """Returns hit and miss counts."""
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+@artifact('digest.md5')
+def _md5(artifacts):
+    return digests.digest(artifacts.data, ['md5'])['md5']
+
+
+@artifact('digest.sha1')
+def _sha1(artifacts):
+    return digests.digest(artifacts.data, ['sha1'])['sha1']
+
+
+@artifact('digest.sha256')
+def _sha256(artifacts):
+    return digests.digest(artifacts.data, ['sha256'])['sha256']
+
+
+@artifact('digest.ssdeep')
+def _ssdeep(artifacts):
+    return digests.digest(artifacts.data, ['ssdeep'])['ssdeep']
+
+
+@artifact('digest.tlsh')
+def _tlsh(artifacts):
+    return digests.digest(artifacts.data, ['tlsh'])['tlsh']
+
+
+@artifact('image.digest')
+def _image_digest(artifacts):
+    return imagecache.pixel_digest(artifacts.data)
+
+
+@artifact('text.utf8')
+def _utf8(artifacts):
+    return artifacts.data.decode()
+
+
+@artifact('zip.index')
+def _zip_index(artifacts):
+    return zipfile.ZipFile(io.BytesIO(artifacts.data))
+
+
+@artifact('ole.container')
+def _ole_container(artifacts):
+    import olefile
+    return olefile.OleFileIO(artifacts.data)
+
+
+@artifact('pdf.document')
+def _pdf_document(artifacts):
+    import fitz
+    return fitz.open(stream=artifacts.data, filetype='pdf')
+
+
+@artifact('pdf.pixmap')
+def _pdf_pixmap(artifacts, page, dpi):
+    return artifacts.get('pdf.document').get_page_pixmap(page, dpi=dpi)
+
+
+@artifact('pdf.image')
+def _pdf_image(artifacts, page, dpi):
+    # The image wraps the pixmap's pixels without copying them.
+    from PIL import Image
+    pixmap = artifacts.get('pdf.pixmap', page, dpi)
+    mode = {1: 'L', 3: 'RGB', 4: 'RGBA'}[pixmap.n]
+    return Image.frombuffer(mode, (pixmap.width, pixmap.height),
+                            pixmap.samples_mv, 'raw', mode, pixmap.stride, 1)
@@ -0,0 +1,906 @@
+"""Backend that distributes files from the coordinator through scanners."""
+import collections
+from datetime import datetime
+import functools
+import hashlib
+import importlib
+import io
+import json
+import logging
+import math
+import os
+import re
+import string
+import tempfile
+import threading
+import time
+
+import inflection
+import interruptingcow
+import magic
+import yaml
+import yara
+
+from strelka import artifacts, rules, strelka, yara_extern
+
+shutdown_event = threading.Event()
+
+# Number of compiled custom YARA rule sets kept loaded by each backend.
+YARA_CACHE_SIZE = 32
+
+
+def trace(msg, extra=None):
+    if 'ENABLE_TRACE_LOGGING' in os.environ:
+        logging.info(f'[TRACE] {msg}', extra=extra)
+
+
+def trace_scanner(scanner, msg, extra=None):
+    if 'ENABLE_SCANNER_TRACE_LOGGING' in os.environ:
+        logging.info(f'[TRACE][SCANNER] {msg}', extra={
+            'scanner': scanner,
+            **extra
+        })
+
+
+class Backend(object):
+
+    def __init__(self, backend_cfg, coordinator):
+        self.scanner_cache = {}
+        self.deferred = []
+        self.yara_cache = collections.OrderedDict()
+        self.merged_base_hashes = {}
+        self.backend_cfg = backend_cfg
+        self.coordinator = coordinator
+        self.limits = backend_cfg.get('limits')
+
+        scanners = backend_cfg.get('scanners')
+        if isinstance(scanners, str):
+            logging.info(f'found scanners as string {scanners}')
+            with open(scanners) as f:
+                self.scanners = yaml.safe_load(f.read()).get('scanners')
+        else:
+            self.scanners = backend_cfg.get('scanners')
+
+        self.compiled_magic = magic.Magic(
+            magic_file=backend_cfg.get('tasting').get('mime_db'),
+            mime=True,
+        )
+
+        yara_cfg = backend_cfg.get('yara') or {}
+        self.yara_reload_interval = yara_cfg.get('reload_interval', 0)
+        self.yara_cache_directory = yara_cfg.get('cache_directory')
+
+        yara_rules = backend_cfg.get('tasting').get('yara_rules')
+        self.taste_rules = rules.RuleSet(
+            [(yara_rules, 'namespace')],
+            cache_directory=self.yara_cache_directory,
+        )
+        self.taste_rules.watch(self.yara_reload_interval)
+
+        self.combined_yara = None
+        self.combined_yara_location = None
+        if backend_cfg.get('tasting').get('combine_scan_yara'):
+            self.compile_combined_yara(yara_rules)
+
+    def scan_yara_options(self):
+        """Returns the options of the ScanYara mapping for all flavors ('*')."""
+        for mapping in self.scanners.get('ScanYara') or []:
+            if '*' in mapping.get('positive', {}).get('flavors', []):
+                return mapping.get('options', {})
+        return None
+
+    def compile_combined_yara(self, taste_rules):
+        """Compiles taste rules and ScanYara base rules into one rule set.
+
+        Taste rules are compiled into 'taste' namespaces and the rules of the
+        ScanYara mapping that applies to all files ('*') into 'scan_yara'
+        namespaces, so one match yields both the file's flavors and the
+        ScanYara matches (see taste_yara).
+        """
+        options = self.scan_yara_options()
+        location = None
+        if options is not None:
+            location = options.get('location', '/etc/yara/')
+        if location is None or not os.path.exists(location):
+            logging.warning('combined YARA tasting requires a ScanYara'
+                            ' mapping for all flavors with existing rules')
+            return
+
+        try:
+            self.combined_yara = rules.RuleSet(
+                [(taste_rules, 'taste'), (location, 'scan_yara')],
+                externals=yara_extern.EXTERNAL_VARS,
+                cache_directory=self.yara_cache_directory,
+            )
+            self.combined_yara.watch(self.yara_reload_interval)
+            self.combined_yara_location = location
+        except (yara.Error, yara.SyntaxError) as e:
+            logging.warning(f'unable to compile combined YARA rules ({e})')
+
+    def work(self):
+        logging.info('starting up')
+
+        count = 0
+        synced = 0
+
+        work_start = time.time()
+        work_expire = work_start + self.limits.get('time_to_live')
+
+        while not shutdown_event.is_set():
+            if self.limits.get('max_files') != 0:
+                if count >= self.limits.get('max_files'):
+                    break
+            if self.limits.get('time_to_live') != 0:
+                if time.time() >= work_expire:
+                    break
+
+            start_pop_time = datetime.now()
+            task = self.coordinator.bzpopmin(['tasks', 'tasks_compile_yara', 'tasks_compile_and_sync_yara'], timeout=5)
+            end_pop_time = datetime.now()
+            receive_time_ms = (end_pop_time - start_pop_time).total_seconds() * 1000
+            if task is None:
+                continue
+
+            (queue_name, root_id, expire_at) = task
+            root_id = root_id.decode()
+            expire_at = math.ceil(expire_at)
+            timeout = math.ceil(expire_at - time.time())
+
+            if timeout <= 0:
+                trace('received expired task', extra={
+                    'strelka_id': root_id,
+                    'deadline': expire_at,
+                    'receive_time_ms': receive_time_ms
+                })
+                continue
+
+            if shutdown_event.is_set():
+                trace(f'Received task after shutdown signal, re-queuing {task}.', extra={
+                    'strelka_id': root_id
+                })
+                # We picked up a task after shutdown_event was set. We'll put it back on the queue for another worker
+                self.coordinator.zadd(queue_name, {root_id: expire_at})
+                break
+
+            if queue_name == b'tasks':
+                trace('received scan file task', extra={
+                    'strelka_id': root_id,
+                    'deadline': expire_at,
+                    'receive_time_ms': receive_time_ms
+                })
+                file = strelka.File(pointer=root_id)
+
+                try:
+                    with interruptingcow.timeout(timeout,
+                                                 strelka.RequestTimeout):
+                        start_scan_time = datetime.now()
+                        files_scanned = self.distribute(root_id, file, expire_at)
+                        end_scan_time = datetime.now()
+                        trace('full scan complete', extra={
+                            'strelka_id': root_id,
+                            'deadline': expire_at,
+                            'files_scanned': files_scanned,
+                            'full_scan_took_ms': (end_scan_time - start_scan_time).total_seconds() * 1000
+                        })
+
+                        start_send_fin_time = datetime.now()
+                        p = self.coordinator.pipeline(transaction=False)
+                        p.rpush(f'event:{root_id}', 'FIN')
+                        p.expireat(f'event:{root_id}', expire_at)
+                        p.execute()
+                        end_send_fin_time = datetime.now()
+                        trace('FIN event emitted', extra={
+                            'strelka_id': root_id,
+                            'deadline': expire_at,
+                            'fin_emit_took_ms': (end_send_fin_time - start_send_fin_time).total_seconds() * 1000
+                        })
+
+                except strelka.RequestTimeout:
+                    trace('scan timed out', extra={
+                        'strelka_id': root_id
+                    })
+                except Exception as e:
+                    trace('scan encountered an error', extra={
+                        'strelka_id': root_id,
+                        'error': str(e)
+                    })
+
+                count += 1
+
+            elif queue_name == b'tasks_compile_yara':
+                try:
+                    with interruptingcow.timeout(timeout,
+                                                 strelka.RequestTimeout):
+                        errMsg = self.compile_yara(root_id)
+
+                        if errMsg:
+                            logging.error(errMsg)
+                            self.coordinator.lpush(f'yara:compile:done:{root_id}', 'ERROR:' + errMsg)
+                        else:
+                            self.coordinator.lpush(f'yara:compile:done:{root_id}', 'FIN')
+
+                except strelka.RequestTimeout:
+                    logging.debug(f'request {root_id}:compile timed out')
+                except Exception:
+                    logging.exception('unknown exception')
+
+            elif queue_name == b'tasks_compile_and_sync_yara':
+                trace('received compile and sync yara task', extra={
+                    'strelka_id': root_id,
+                    'deadline': expire_at,
+                })
+                try:
+                    with interruptingcow.timeout(timeout,
+                                                 strelka.RequestTimeout):
+                        yara_cache_key = self.coordinator.get(f'yara_cache_key:{root_id}')
+                        if not yara_cache_key:
+                            continue
+                        yara_cache_key = yara_cache_key.decode()
+                        errMsg, nSynced = self.compile_and_sync_yara(yara_cache_key, root_id)
+                        synced += nSynced
+                        logging.info('synced:' + str(nSynced))
+
+                        if errMsg:
+                            self.coordinator.lpush(f'yara:compile_and_sync:done:{root_id}', 'ERROR:' + errMsg)
+                        else:
+                            self.coordinator.lpush(f'yara:compile_and_sync:done:{root_id}', 'FIN')
+
+                except strelka.RequestTimeout:
+                    trace('compile and sync yara task timed out', extra={
+                        'strelka_id': root_id,
+                        'deadline': expire_at,
+                    })
+                except Exception as e:
+                    trace('unexpected error during yara compile and sync', extra={
+                        'strelka_id': root_id,
+                        'deadline': expire_at,
+                        'error': str(e)
+                    })
+
+        logging.info(f'shutdown after scanning {count} file(s),'
+                     f' syncing {synced} yara files, and'
+                     f' {time.time() - work_start} second(s)'
+                     f' should shutdown trigger: {shutdown_event.is_set()}')
+
+    def compile_yara(self, root_id):
+        data = b''
+        errMsg = ''
+
+        try:
+            while 1:
+                pop = self.coordinator.lpop(f'yara:compile:{root_id}')
+                if not pop:
+                    break
+                data += pop
+
+            try:
+                yara.compile(source=data.decode(), externals=yara_extern.EXTERNAL_VARS)
+            except (yara.Error, yara.SyntaxError) as e:
+                errMsg = 'compiling yara: ' + str(e)
+                logging.error(errMsg)
+            except Exception as e2:
+                errMsg = 'compiling yara: ' + str(e2)
+                logging.error(errMsg)
+        except Exception as e3:
+            errMsg = 'retrieving yara: ' + str(e3)
+            logging.error(errMsg)
+
+        return errMsg
+
+    def compile_and_sync_yara(self, yara_cache_key, root_id):
+        start_compile_and_sync = datetime.now()
+        synced = 0
+
+        start_delete_keys = datetime.now()
+        self.coordinator.delete(f'yara:compiled_all:{yara_cache_key}')
+        self.coordinator.delete(f'yara:compiled_merged:{yara_cache_key}')
+        self.coordinator.delete(f'yara:merged_base:{yara_cache_key}')
+        self.coordinator.delete(f'yara:hash:{yara_cache_key}')
+        end_delete_keys = datetime.now()
+
+        hash = hashlib.sha256()
+        errMsg = ''
+        yara_src = ''
+
+        lpop_time = 0
+        load_time = 0
+        compile_time = 0
+        while 1:
+            start_pop = datetime.now()
+            pop = self.coordinator.lpop(f'yara:compile_and_sync:{root_id}')
+            end_pop = datetime.now()
+            lpop_time += (end_pop - start_pop).total_seconds() * 1000
+            if not pop:
+                break
+
+            data = {}
+            try:
+                start_load = datetime.now()
+                data = json.loads(pop.decode())
+                stop_load = datetime.now()
+                load_time += (stop_load - start_load).total_seconds() * 1000
+            except Exception as e:
+                trace('error loading yara data', extra={
+                    'strelka_id': root_id,
+                    'yara_cache_key': yara_cache_key,
+                    'error': str(e)
+                })
+                errMsg = 'loading json: ' + str(e)
+                continue
+
+            start_compile = datetime.now()
+            try:
+                # compile single signature for validation
+                compiled_yara = yara.compile(source=data['data'], externals=yara_extern.EXTERNAL_VARS)
+
+                # append to source if compilation succeeds
+                yara_src += data['data']
+                synced += 1
+            except (yara.Error, yara.SyntaxError) as e:
+                errMsg = 'compiling yara: ' + str(e)
+                trace('yara compilation error', extra={
+                    'strelka_id': root_id,
+                    'yara_cache_key': yara_cache_key,
+                    'error': str(e)
+                })
+            except Exception as e2:
+                errMsg = 'compiling yara: ' + str(e2)
+                trace('unexpected yara compilation error', extra={
+                    'strelka_id': root_id,
+                    'yara_cache_key': yara_cache_key,
+                    'error': str(e2)
+                })
+            finally:
+                stop_compile = datetime.now()
+                compile_time += (stop_compile - start_compile).total_seconds() * 1000
+
+
+        compile_all_ms = 0
+        if yara_src:
+            # compile all valid signatures into single object for faster execution
+            start_compile_all = datetime.now()
+            try:
+                compiled_yara = yara.compile(source=yara_src, externals=yara_extern.EXTERNAL_VARS)
+                buf = io.BytesIO()
+                compiled_yara.save(file=buf)
+
+                hash.update(yara_src.encode())
+
+                self.coordinator.set(f'yara:compiled_all:{yara_cache_key}', buf.getvalue())
+
+                merged_yara = self.compile_merged_yara(yara_src, root_id, yara_cache_key)
+                if merged_yara is not None:
+                    self.coordinator.set(f'yara:compiled_merged:{yara_cache_key}', merged_yara[0])
+                    self.coordinator.set(f'yara:merged_base:{yara_cache_key}', merged_yara[1])
+            except (yara.Error, yara.SyntaxError) as e:
+                errMsg = 'compiling yara: ' + str(e)
+                trace('yara all compilation error', extra={
+                    'strelka_id': root_id,
+                    'yara_cache_key': yara_cache_key,
+                    'error': str(e)
+                })
+                synced = 0
+            except Exception as e2:
+                errMsg = 'compiling yara: ' + str(e2)
+                trace('unexpected yara all compilation error', extra={
+                    'strelka_id': root_id,
+                    'yara_cache_key': yara_cache_key,
+                    'error': str(e2)                    
+                })
+                synced = 0
+            finally:
+                stop_compile_all = datetime.now()
+                compile_all_ms = (stop_compile_all - start_compile_all).total_seconds() * 1000
+        else:
+            trace('no yara source data found', extra={
+                'strelka_id': root_id,
+                'yara_cache_key': yara_cache_key,
+            })
+
+        start_emit_results = datetime.now()
+        self.coordinator.set(f'yara:hash:{yara_cache_key}', hash.hexdigest())
+        self.coordinator.set(f'yara:synced:{root_id}', synced)
+        stop_emit_results = datetime.now()
+
+        stop_compile_and_sync = datetime.now()
+        trace('yara compilation and sync complete', extra={
+            'strelka_id': root_id,
+            'yara_cache_key': yara_cache_key,
+            'delete_keys_took_ms': (end_delete_keys - start_delete_keys).total_seconds() * 1000,
+            'yara_retrieval_took_ms': lpop_time,
+            'yara_load_took_ms': load_time,
+            'yara_compile_took_ms': compile_time,
+            'yara_compile_all_took_ms': compile_all_ms,
+            'emit_results_took_ms': (stop_emit_results - start_emit_results).total_seconds() * 1000,
+            'synced': synced,
+            'error': errMsg,
+            'yara_compile_and_sync_took_ms': (stop_compile_and_sync - start_compile_and_sync).total_seconds() * 1000
+        })
+
+        return errMsg, synced
+
+    def compile_merged_yara(self, yara_src, root_id, yara_cache_key):
+        """Compiles ScanYara base rules and custom rules into one rule set.
+
+        Merged rules are only compiled when the ScanYara mapping for all
+        flavors enables the 'merged' option. Base rules are compiled into
+        'base_N' namespaces and custom rules into the 'custom' namespace.
+
+        Returns:
+            Saved compiled rules and the source hash of the base rules (see
+            merged_base_hash), or None.
+        """
+        options = self.scan_yara_options()
+        if not options or not options.get('merged'):
+            return None
+        location = options.get('location', '/etc/yara/')
+        if not os.path.exists(location):
+            return None
+
+        try:
+            # Base rules are compiled from their files so that includes
+            # resolve relative to them.
+            filepaths = rules.yara_filepaths([(location, 'base')])
+            base_hash = rules.hash_sources(filepaths, yara_extern.EXTERNAL_VARS)
+            with tempfile.NamedTemporaryFile('w', suffix='.yar') as f:
+                f.write(yara_src)
+                f.flush()
+                compiled_yara = yara.compile(
+                    filepaths={**filepaths, 'custom': f.name},
+                    externals=yara_extern.EXTERNAL_VARS,
+                )
+            buf = io.BytesIO()
+            compiled_yara.save(file=buf)
+            return buf.getvalue(), base_hash
+        except (yara.Error, yara.SyntaxError) as e:
+            trace('yara merged compilation error', extra={
+                'strelka_id': root_id,
+                'yara_cache_key': yara_cache_key,
+                'error': str(e)
+            })
+            return None
+
+    def merged_base_hash(self, location):
+        """Returns the source hash of the base rules in a location.
+
+        Merged rules compiled from other base rules (e.g. before the base
+        rules were reloaded) are not used. Rule files are checked for
+        changes at most every 'reload_interval' seconds, as ScanYara does.
+        """
+        now = time.time()
+        checked = self.merged_base_hashes.get(location)
+        if checked is not None and (not self.yara_reload_interval
+                                    or now - checked[0] < self.yara_reload_interval):
+            return checked[2]
+
+        filepaths = rules.yara_filepaths([(location, 'base')])
+        fingerprint = rules.fingerprint(filepaths)
+        if checked is not None and checked[1] == fingerprint:
+            base_hash = checked[2]
+        else:
+            base_hash = rules.hash_sources(filepaths, yara_extern.EXTERNAL_VARS)
+        self.merged_base_hashes[location] = (now, fingerprint, base_hash)
+        return base_hash
+
+    def load_custom_yara(self, yara_cache_key, kind, base_hash=None):
+        """Loads compiled custom YARA rules from the coordinator.
+
+        Loaded rules are cached per cache key and validated against
+        'yara:hash:{yara_cache_key}', so rules are only retrieved and loaded
+        again when they are recompiled.
+
+        Args:
+            yara_cache_key: Cache key of the custom rules.
+            kind: 'compiled_all' (custom rules) or 'compiled_merged'
+                (base and custom rules).
+            base_hash: Source hash of the current base rules (see
+                merged_base_hash). Merged rules compiled from other base
+                rules are not loaded.
+        Returns:
+            Compiled rules (or None), number of rules, and a boolean that
+            is True if the rules were served from the cache.
+        """
+        yara_hash = self.coordinator.get(f'yara:hash:{yara_cache_key}')
+        cache_key = (kind, yara_cache_key, base_hash)
+        cached = self.yara_cache.get(cache_key)
+        if cached is not None and yara_hash is not None and cached[0] == yara_hash:
+            self.yara_cache.move_to_end(cache_key)
+            return cached[1], cached[2], True
+
+        if base_hash is not None:
+            merged_base = self.coordinator.get(f'yara:merged_base:{yara_cache_key}')
+            if merged_base is None or merged_base.decode() != base_hash:
+                return None, 0, False
+
+        yara_data = self.coordinator.get(f'yara:{kind}:{yara_cache_key}')
+        if not yara_data:
+            return None, 0, False
+
+        compiled_yara = yara.load(file=io.BytesIO(yara_data))
+        rule_count = sum(1 for _ in compiled_yara)
+        if yara_hash is not None:
+            self.yara_cache[cache_key] = (yara_hash, compiled_yara, rule_count)
+            while len(self.yara_cache) > YARA_CACHE_SIZE:
+                self.yara_cache.popitem(last=False)
+        return compiled_yara, rule_count, False
+
+    def taste_mime(self, data):
+        """Tastes file data with libmagic."""
+        return [self.compiled_magic.from_buffer(data)]
+
+    def taste_yara(self, data, file=None, expire_at=None):
+        """Tastes file data with YARA.
+
+        If combined YARA tasting is enabled, then ScanYara's base rules are
+        matched in the same pass and their matches are stored in the file's
+        artifacts as 'yara.combined'. Taste rules match data with leading
+        whitespace stripped while ScanYara matches the original data, so
+        data with leading whitespace is tasted separately.
+        """
+        combined_yara = self.combined_yara.rules if self.combined_yara else None
+        if (combined_yara is not None and file is not None
+                and not data[:1].isspace()):
+            try:
+                timeout = max(math.ceil(expire_at - time.time()), 1)
+                yara_matches = combined_yara.match(
+                    data=data,
+                    externals=yara_extern.file_externals(file),
+                    timeout=timeout,
+                )
+                file.artifacts.put('yara.combined', (
+                    self.combined_yara_location,
+                    [m for m in yara_matches if m.namespace.startswith('scan_yara_')],
+                ))
+                return [m.rule for m in yara_matches if m.namespace.startswith('taste_')]
+            except (yara.Error, yara.TimeoutError):
+                pass
+
+        compiled_yara = self.taste_rules.rules
+        if compiled_yara is None:
+            return []
+        encoded_whitespace = string.whitespace.encode()
+        stripped_data = data.lstrip(encoded_whitespace)
+        yara_matches = compiled_yara.match(data=stripped_data)
+        return [match.rule for match in yara_matches]
+
+    def distribute(self, root_id, file, expire_at):
+        """Distributes a file through scanners."""
+        try:
+            files = []
+            if file.depth == 0:
+                self.deferred = []
+
+            try:
+                with interruptingcow.timeout(self.limits.get('distribution'),
+                                             exception=strelka.DistributionTimeout):
+                    start_file_scan_time = datetime.now()
+                    if file.depth > self.limits.get('max_depth'):
+                        logging.info(f'request {root_id} exceeded maximum depth', extra={
+                            'strelka_id': root_id
+                        })
+                        return 0
+
+                    data = b''
+                    legacy_yara_data = b''
+
+                    start_pop_data_time = datetime.now()
+                    while 1:
+                        pop = self.coordinator.lpop(f'data:{file.pointer}')
+                        if pop is None:
+                            break
+                        data += pop
+
+                        # We use the root_id to locate custom yara for this document,
+                        # since both the parent document and all child documents will
+                        # take this path, and we wish to evaluate each against the
+                        # same set of yara rules.
+                        legacy_yara_data = self.coordinator.get(f'yara:{root_id}') # backcompat
+                    end_pop_data_time = datetime.now()
+                    file.artifacts = artifacts.Artifacts(data)
+
+                    start_taste_time = datetime.now()
+                    file.add_flavors({'mime': self.taste_mime(data)})
+                    file.add_flavors({'yara': self.taste_yara(data, file, expire_at)})
+                    flavors = (
+                        file.flavors.get('external', [])
+                        + file.flavors.get('mime', [])
+                        + file.flavors.get('yara', [])
+                    )
+                    end_taste_time = datetime.now()
+
+                    scanner_list = []
+                    for name in self.scanners:
+                        mappings = self.scanners.get(name, {})
+                        assigned = self.assign_scanner(
+                            name,
+                            mappings,
+                            flavors,
+                            file,
+                        )
+                        if assigned is not None:
+                            scanner_list.append(assigned)
+                    scanner_list.sort(
+                        key=lambda k: k.get('priority', 5),
+                        reverse=True,
+                    )
+
+                    p = self.coordinator.pipeline(transaction=False)
+                    tree_dict = {
+                        'node': file.uid,
+                        'parent': file.parent,
+                        'root': root_id,
+                    }
+
+                    if file.depth == 0:
+                        tree_dict['node'] = root_id
+                    if file.depth == 1:
+                        tree_dict['parent'] = root_id
+
+                    file_dict = {
+                        'depth': file.depth,
+                        'name': file.name,
+                        'flavors': file.flavors,
+                        'scanners': [s.get('name') for s in scanner_list],
+                        'size': len(data),
+                        'source': file.source,
+                        'tree': tree_dict,
+                    }
+                    scan = {}
+
+                    for scanner in scanner_list:
+                        name = scanner['name']
+                        start_scanner_time = datetime.now()
+                        try:
+                            # Options are copied so that per-file options do not
+                            # persist in the scanner configuration.
+                            options = dict(scanner.get('options', {}))
+                            options['strelka_id'] = root_id
+                            if name == 'ScanYara':
+                                start_yara_retrieval = datetime.now()
+                                yara_load_took_ms = 0
+                                yara_rule_count = 0
+                                yara_cached = False
+                                yara_cache_key = self.coordinator.get(f'yara_cache_key:{root_id}')
+                                yara_data = None
+                                if yara_cache_key:
+                                    yara_cache_key = yara_cache_key.decode()
+                                    start_yara_load = datetime.now()
+
+                                    # Merged rules include the base rules, which are not
+                                    # needed when they were matched during tasting.
+                                    location = options.get('location', '/etc/yara/')
+                                    if options.get('merged') \
+                                            and file.artifacts.cached('yara.combined') is None \
+                                            and location == \
+                                            (self.scan_yara_options() or {}).get('location', '/etc/yara/'):
+                                        (yara_data, yara_rule_count, yara_cached) = \
+                                            self.load_custom_yara(yara_cache_key, 'compiled_merged',
+                                                                  self.merged_base_hash(location))
+                                        if yara_data is not None:
+                                            options['compiled_merged_yara'] = yara_data
+
+                                    if yara_data is None:
+                                        (yara_data, yara_rule_count, yara_cached) = \
+                                            self.load_custom_yara(yara_cache_key, 'compiled_all')
+                                        if yara_data is not None:
+                                            options['compiled_custom_yara_all'] = yara_data
+
+                                    end_yara_load = datetime.now()
+                                    yara_load_took_ms = (end_yara_load - start_yara_load).total_seconds() * 1000
+
+                                if legacy_yara_data: # backcompat
+                                    options['source'] = legacy_yara_data.decode()
+
+                                end_yara_retrieval = datetime.now()
+                                trace_scanner(name, 'yara data retrieved', extra={
+                                    'strelka_id': root_id,
+                                    'deadline': expire_at,
+                                    'yara_retrieval_took_ms': (end_yara_retrieval - start_yara_retrieval).total_seconds() * 1000,
+                                    'yara_load_took_ms': yara_load_took_ms,
+                                    'yara_cache_key_found': yara_cache_key is not None,
+                                    'yara_data_found': yara_data is not None,
+                                    'yara_rule_count': yara_rule_count,
+                                    'yara_cached': yara_cached,
+                                })
+
+                            und_name = inflection.underscore(name)
+                            scanner_import = f'strelka.scanners.{und_name}'
+                            module = importlib.import_module(scanner_import)
+                            if und_name not in self.scanner_cache:
+                                attr = getattr(module, name)(self.backend_cfg, self.coordinator)
+                                self.scanner_cache[und_name] = attr
+                            plugin = self.scanner_cache[und_name]
+                            (f, s) = plugin.scan_wrapper(
+                                data,
+                                file,
+                                options,
+                                expire_at,
+                            )
+                            files.extend(f)
+                            for future in plugin.deferred:
+                                self.deferred.append((file_dict, plugin.key, future))
+
+                            scan = {
+                                **scan,
+                                **s,
+                            }
+
+                        except ModuleNotFoundError:
+                            trace_scanner(name, 'scanner not found', extra={
+                                'strelka_id': root_id,
+                                'deadline': expire_at,
+                            })
+                        except strelka.RequestTimeout:
+                            trace_scanner(name, 'scanner timed out', extra={
+                                'strelka_id': root_id,
+                                'deadline': expire_at
+                            })
+                        except Exception as e:
+                            trace_scanner(name, 'scanner encountered an error', extra={
+                                'strelka_id': root_id,
+                                'deadline': expire_at,
+                                'error': str(e)
+                            })
+                        finally:
+                            end_scanner_time = datetime.now()
+                            scanner_took_secs = (end_scanner_time - start_scanner_time).total_seconds()
+                            scanner_limit_secs = self.limits.get('scanner')
+                            runaway_scanner = False
+                            if scanner_limit_secs:
+                                runaway_scanner = (scanner_limit_secs - scanner_took_secs) <= 0
+
+                            trace_scanner(name, 'scan completed', extra={
+                                'strelka_id': root_id,
+                                'deadline': expire_at,
+                                'scanner_took_ms': scanner_took_secs * 1000,
+                                'runaway_scanner': runaway_scanner
+                            })
+
+                    event = {
+                        **{'file': file_dict},
+                        **{'scan': scan},
+                        **{'backend': {'release_version': os.environ.get('RELEASE_VERSION', '')}},
+                    }
+                    end_scan_file_time = datetime.now()
+
+                    start_emit_result_time = datetime.now()
+                    p.rpush(f'event:{root_id}', strelka.format_event(event))
+                    p.expireat(f'event:{root_id}', expire_at)
+                    p.execute()
+                    end_emit_result_time = datetime.now()
+                    trace('file scan complete', extra={
+                        'strelka_id': root_id,
+                        'deadline': expire_at,
+                        'scanner_count': len(scanner_list),
+                        'tasting_took_ms': (end_taste_time - start_taste_time).total_seconds() * 1000,
+                        'data_collection_took_ms': (end_pop_data_time - start_pop_data_time).total_seconds() * 1000,
+                        'file_scan_took_ms': (end_scan_file_time - start_file_scan_time).total_seconds() * 1000,
+                        'result_emit_took_ms': (end_emit_result_time - start_emit_result_time).total_seconds() * 1000,
+                        'artifact_hits': file.artifacts.hits,
+                        'artifact_misses': file.artifacts.misses,
+                    })
+
+            except strelka.DistributionTimeout:
+                trace('file scan timed out', extra={
+                    'strelka_id': root_id
+                })
+
+            # Artifacts are only shared by scanners of this file, release
+            # them before distributing its children.
+            file.artifacts = None
+
+            nested_file_counts = 0
+            for f in files:
+                f.parent = file.uid
+                f.depth = file.depth + 1
+                nested_file_counts += self.distribute(root_id, f, expire_at)
+
+            if file.depth == 0:
+                self.emit_deferred(root_id, expire_at)
+
+            return 1 + len(files) + nested_file_counts
+
+        except strelka.RequestTimeout:
+            raise
+
+    def emit_deferred(self, root_id, expire_at):
+        """Emits results of deferred analyses as follow-up events.
+
+        Analyses that scanners submitted to analyzer pools (see
+        Scanner.run_analyzer) are not waited for, so FIN is sent as soon as
+        the files are scanned. Each result is pushed to the request's events
+        when its analysis finishes (usually after FIN) as an event with the
+        file of the analysis and the scanner's metadata. Analyses that are
+        cancelled or finish after the request expires are not emitted; their
+        results are cached for later requests.
+        """
+        (deferred, self.deferred) = (self.deferred, [])
+        for (file_dict, key, future) in deferred:
+            future.add_done_callback(functools.partial(
+                self.emit_analysis,
+                root_id,
+                expire_at,
+                file_dict,
+                key,
+            ))
+
+    def emit_analysis(self, root_id, expire_at, file_dict, key, future):
+        """Emits the result of a finished analysis (runs in the analyzer's thread)."""
+        if future.cancelled() or time.time() >= expire_at:
+            return
+        if future.exception() is not None:
+            trace(f'{key} analysis encountered an error', extra={
+                'strelka_id': root_id,
+                'error': str(future.exception()),
+            })
+            result = {'flags': ['uncaught_exception']}
+        else:
+            result = future.result()
+
+        event = {
+            **{'file': file_dict},
+            **{'scan': {key: result}},
+            **{'backend': {'release_version': os.environ.get('RELEASE_VERSION', '')}},
+        }
+        try:
+            p = self.coordinator.pipeline(transaction=False)
+            p.rpush(f'event:{root_id}', strelka.format_event(event))
+            p.expireat(f'event:{root_id}', expire_at)
+            p.execute()
+        except Exception as e:
+            trace(f'{key} analysis could not be emitted', extra={
+                'strelka_id': root_id,
+                'error': str(e),
+            })
+
+    def assign_scanner(self, scanner, mappings, flavors, file):
+        """Assigns scanners based on mappings and file data.
+
+        Performs the task of assigning scanners based on the scan configuration
+        mappings and file flavors, filename, and source. Assignment supports
+        positive and negative matching: scanners are assigned if any positive
+        categories are matched and no negative categories are matched. Flavors are
+        literal matches, filename and source matches uses regular expressions.
+
+        Args:
+            scanner: Name of the scanner to be assigned.
+            mappings: List of dictionaries that contain values used to assign
+                the scanner.
+            flavors: List of file flavors to use during scanner assignment.
+            filename: Filename to use during scanner assignment.
+            source: File source to use during scanner assignment.
+        Returns:
+            Dictionary containing the assigned scanner or None.
+        """
+        for mapping in mappings:
+            negatives = mapping.get('negative', {})
+            positives = mapping.get('positive', {})
+            neg_flavors = negatives.get('flavors', [])
+            neg_filename = negatives.get('filename', None)
+            neg_source = negatives.get('source', [])
+            pos_flavors = positives.get('flavors', [])
+            pos_filename = positives.get('filename', None)
+            pos_source = positives.get('source', [])
+            assigned = {'name': scanner,
+                        'priority': mapping.get('priority', 5),
+                        'options': mapping.get('options', {})}
+
+            for neg_flavor in neg_flavors:
+                if neg_flavor in flavors:
+                    return None
+            if neg_filename:
+                if re.search(neg_filename, file.name):
+                    return None
+            if neg_source:
+                if file.source in neg_source:
+                    return None
+            for pos_flavor in pos_flavors:
+                if pos_flavor == '*' or pos_flavor in flavors:
+                    return assigned
+            if pos_filename:
+                if re.search(pos_filename, file.name):
+                    return assigned
+            if pos_source:
+                if file.source in pos_source:
+                    return assigned
+        return None
@@ -0,0 +1,93 @@
+"""Computes several digests of data in one chunked pass.
+
+Data (bytes, mmap, or memoryview) is read in chunks and every chunk is fed
+to every digest before the next chunk is read, so the data is read from
+memory once regardless of the number of digests. For large inputs, each
+chunk is fed to the digests on worker threads; hashlib, ssdeep, and TLSH
+release the GIL while hashing, so digests are computed in parallel.
+"""
+import concurrent.futures
+import hashlib
+
+try:
+    import ssdeep
+except ImportError:
+    ssdeep = None
+
+try:
+    import tlsh
+except ImportError:
+    tlsh = None
+
+CHUNK_SIZE = 1024 * 1024
+# Inputs at least this large are hashed on worker threads.
+PARALLEL_SIZE = 32 * 1024 * 1024
+
+
+class _Ssdeep(object):
+    def __init__(self):
+        if ssdeep is None:
+            raise ImportError('ssdeep is not installed')
+        self.h = ssdeep.Hash()
+
+    def update(self, chunk):
+        self.h.update(bytes(chunk))
+
+    def hexdigest(self):
+        return self.h.digest()
+
+
+class _Tlsh(object):
+    def __init__(self):
+        if tlsh is None:
+            raise ImportError('tlsh is not installed')
+        self.h = tlsh.Tlsh()
+
+    def update(self, chunk):
+        self.h.update(bytes(chunk))
+
+    def hexdigest(self):
+        self.h.final()
+        digest = self.h.hexdigest()
+        # TLSH requires a minimum amount of data and variance.
+        return None if digest == 'TNULL' else digest
+
+
+HASHERS = {
+    'md5': hashlib.md5,
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+    'ssdeep': _Ssdeep,
+    'tlsh': _Tlsh,
+}
+
+
+def digest(data, names, chunk_size=CHUNK_SIZE, parallel_size=PARALLEL_SIZE):
+    """Computes digests of data in one pass.
+
+    Args:
+        data: Bytes-like object (bytes, mmap, or memoryview).
+        names: List of digest names (see HASHERS).
+        chunk_size: Size of chunks fed to the digests.
+        parallel_size: Minimum size of data hashed on worker threads.
+    Returns:
+        Dictionary of digest names to hex digests.
+    Raises:
+        ImportError: the module required by a digest is not installed.
+    """
+    hashers = {name: HASHERS[name]() for name in names}
+    view = memoryview(data).cast('B')
+    chunks = (view[i:i + chunk_size] for i in range(0, len(view), chunk_size))
+
+    if len(view) >= parallel_size and len(hashers) > 1:
+        with concurrent.futures.ThreadPoolExecutor(len(hashers)) as pool:
+            for chunk in chunks:
+                for future in [pool.submit(h.update, chunk)
+                               for h in hashers.values()]:
+                    future.result()
+    else:
+        for chunk in chunks:
+            for h in hashers.values():
+                h.update(chunk)
+
+    return {name: h.hexdigest() for (name, h) in hashers.items()}
@@ -0,0 +1,111 @@
+"""Caches scanner results by the decoded pixels of images.
+
+Images that are sent again and again (logos, banners, and signature
+images) are often re-encoded or carry different metadata, so their bytes
+differ while their pixels are identical. ResultCache stores scanner results
+keyed by pixel_digest, the SHA256 of an image's decoded pixels, and serves
+them only to images with identical pixels. Images that differ in any pixel
+are scanned, since small details (e.g. the payload of a QR code) can change
+a scanner's result.
+
+Results are cached in two tiers, an in-process LRU and the coordinator
+(Redis), and are scoped by the caller (e.g. per scanner and options).
+"""
+import base64
+import collections
+import hashlib
+import io
+import json
+
+
+def pixel_digest(data):
+    """Computes the SHA256 of the decoded pixels of an image.
+
+    Images with identical pixels have the same digest regardless of their
+    format, metadata, or compression.
+
+    Args:
+        data: Image data.
+    Returns:
+        Hexadecimal digest of the mode, size, and pixels of every frame.
+    Raises:
+        Exception: data is not an image that PIL can open.
+    """
+    from PIL import Image
+    from PIL import ImageSequence
+
+    h = hashlib.sha256()
+    with Image.open(io.BytesIO(data)) as image:
+        for frame in ImageSequence.Iterator(image):
+            # Palette indices are only meaningful with their palette.
+            if frame.mode in ('P', 'PA'):
+                frame = frame.convert('RGBA')
+            h.update(f'{frame.mode}:{frame.size}\n'.encode())
+            h.update(frame.tobytes())
+    return h.hexdigest()
+
+
+def _encode(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {'$b64': base64.b64encode(value).decode()}
+    raise TypeError(f'{type(value).__name__} is not serializable')
+
+
+def _decode(value):
+    if len(value) == 1 and '$b64' in value:
+        return base64.b64decode(value['$b64'])
+    return value
+
+
+def dumps(value):
+    """Serializes a result as JSON (bytes are base64 encoded)."""
+    return json.dumps(value, default=_encode)
+
+
+def loads(data):
+    """Deserializes a result serialized by dumps."""
+    return json.loads(data, object_hook=_decode)
+
+
+class ResultCache(object):
+    """Two-tier cache of results keyed by pixel digest.
+
+    Attributes:
+        coordinator: Redis client used as the shared tier (or None).
+        size: Maximum number of results in the in-process tier.
+        ttl: Time (in seconds) that results live in the coordinator.
+    """
+    def __init__(self, coordinator=None, size=1024, ttl=86400):
+        self.coordinator = coordinator
+        self.size = size
+        self.ttl = ttl
+        self._values = collections.OrderedDict()
+
+    def get(self, scope, digest):
+        """Returns the cached result of a digest, or None."""
+        data = self._values.get((scope, digest))
+        if data is not None:
+            self._values.move_to_end((scope, digest))
+            return loads(data)
+
+        if self.coordinator is None:
+            return None
+        data = self.coordinator.get(f'imagecache:{scope}:{digest}')
+        if data is None:
+            return None
+        self._put_local(scope, digest, data)
+        return loads(data)
+
+    def put(self, scope, digest, result):
+        """Caches the result of a digest in both tiers."""
+        # Results are stored serialized, so callers get their own copy.
+        data = dumps(result)
+        self._put_local(scope, digest, data)
+        if self.coordinator is not None:
+            self.coordinator.set(f'imagecache:{scope}:{digest}', data, ex=self.ttl)
+
+    def _put_local(self, scope, digest, data):
+        self._values[(scope, digest)] = data
+        self._values.move_to_end((scope, digest))
+        while len(self._values) > self.size:
+            self._values.popitem(last=False)
@@ -0,0 +1,309 @@
+"""In-process scanning without Redis, the frontend, or a backend server.
+
+This module provides an in-memory implementation of the subset of the Redis
+API that the backend and scanners use to exchange data (LocalCoordinator) and
+a thin wrapper that runs Backend.distribute against it (LocalBackend). The
+module-level scan_bytes and scan_file functions reuse a warm LocalBackend per
+configuration.
+
+Scanner timeouts are enforced with signals, so scanning must happen on the
+main thread of the process.
+"""
+import json
+import threading
+import time
+import uuid
+
+import interruptingcow
+import yaml
+
+from strelka import strelka
+
+DEFAULT_BACKEND_CFG = '/etc/strelka/backend.yaml'
+
+
+def _encode(value):
+    """Encodes a value the same way Redis stores it."""
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, (bytearray, memoryview)):
+        return bytes(value)
+    if isinstance(value, str):
+        return value.encode()
+    return str(value).encode()
+
+
+class LocalPipeline(object):
+    """Buffers coordinator commands until execute is called."""
+    def __init__(self, coordinator):
+        self.coordinator = coordinator
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.coordinator, name)
+
+        def command(*args, **kwargs):
+            self.commands.append((method, args, kwargs))
+            return self
+        return command
+
+    def execute(self):
+        results = [method(*args, **kwargs)
+                   for (method, args, kwargs) in self.commands]
+        self.commands = []
+        return results
+
+
+class LocalCoordinator(object):
+    """In-memory coordinator that mimics the Redis commands used by Strelka.
+
+    Values are stored and returned as bytes, matching redis-py without
+    decode_responses. Key expiration is applied lazily when keys are read.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.data = {}
+        self.expires = {}
+
+    def _get(self, key, default=None):
+        key = _encode(key)
+        expire_at = self.expires.get(key)
+        if expire_at is not None and expire_at <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key, default)
+
+    def pipeline(self, transaction=True):
+        return LocalPipeline(self)
+
+    def ping(self):
+        return True
+
+    def flushdb(self):
+        with self.lock:
+            self.data.clear()
+            self.expires.clear()
+        return True
+
+    def get(self, key):
+        with self.lock:
+            value = self._get(key)
+            return value if isinstance(value, bytes) else None
+
+    def set(self, key, value, ex=None, nx=False):
+        with self.lock:
+            if nx and self._get(key) is not None:
+                return None
+            self.data[_encode(key)] = _encode(value)
+            self.expires.pop(_encode(key), None)
+            if ex is not None:
+                self.expire(key, ex)
+            return True
+
+    def setnx(self, key, value):
+        return bool(self.set(key, value, nx=True))
+
+    def delete(self, *keys):
+        with self.lock:
+            deleted = 0
+            for key in keys:
+                if self._get(key) is not None:
+                    deleted += 1
+                self.data.pop(_encode(key), None)
+                self.expires.pop(_encode(key), None)
+            return deleted
+
+    def exists(self, *keys):
+        with self.lock:
+            return sum(1 for key in keys if self._get(key) is not None)
+
+    def expire(self, key, seconds):
+        return self.expireat(key, time.time() + seconds)
+
+    def expireat(self, key, when):
+        with self.lock:
+            if self._get(key) is None:
+                return False
+            self.expires[_encode(key)] = when
+            return True
+
+    def rpush(self, key, *values):
+        with self.lock:
+            items = self._get(key)
+            if items is None:
+                items = self.data[_encode(key)] = []
+            items.extend(_encode(v) for v in values)
+            return len(items)
+
+    def lpush(self, key, *values):
+        with self.lock:
+            items = self._get(key)
+            if items is None:
+                items = self.data[_encode(key)] = []
+            for value in values:
+                items.insert(0, _encode(value))
+            return len(items)
+
+    def lpop(self, key):
+        with self.lock:
+            items = self._get(key)
+            if not items:
+                return None
+            value = items.pop(0)
+            if not items:
+                self.delete(key)
+            return value
+
+    def lrange(self, key, start, end):
+        with self.lock:
+            items = self._get(key) or []
+            end = len(items) if end == -1 else end + 1
+            return list(items[start:end])
+
+    def llen(self, key):
+        with self.lock:
+            return len(self._get(key) or [])
+
+    def zadd(self, key, mapping):
+        with self.lock:
+            members = self._get(key)
+            if members is None:
+                members = self.data[_encode(key)] = {}
+            added = sum(1 for m in mapping if _encode(m) not in members)
+            members.update({_encode(m): s for (m, s) in mapping.items()})
+            return added
+
+    def zcard(self, key):
+        with self.lock:
+            return len(self._get(key) or {})
+
+    def sadd(self, key, *values):
+        with self.lock:
+            members = self._get(key)
+            if members is None:
+                members = self.data[_encode(key)] = set()
+            added = sum(1 for v in values if _encode(v) not in members)
+            members.update(_encode(v) for v in values)
+            return added
+
+    def smembers(self, key):
+        with self.lock:
+            return set(self._get(key) or ())
+
+
+class LocalBackend(object):
+    """Scans data in-process by running Backend.distribute locally.
+
+    Attributes:
+        backend_cfg: Dictionary that contains the parsed backend configuration.
+        coordinator: LocalCoordinator shared by the backend and its scanners.
+        backend: Backend instance (taste rules and scanners stay warm
+            between scans).
+    """
+    def __init__(self, backend_cfg=None):
+        # Imported here so that importing strelka does not require the
+        # backend's dependencies (libmagic, YARA).
+        from strelka.backend import Backend
+
+        self.backend_cfg = load_config(backend_cfg)
+        self.coordinator = LocalCoordinator()
+        self.backend = Backend(self.backend_cfg, self.coordinator)
+
+    def scan_bytes(self, data, name='', source='', flavors=None,
+                   timeout=None, raw=False):
+        """Scans data and returns its events (one per file, root first).
+
+        Args:
+            data: Bytes of the file to scan.
+            name: Filename assigned to the file.
+            source: Source assigned to the file.
+            flavors: List of external flavors assigned to the file.
+            timeout: Amount of time (in seconds) the scan may take.
+                Defaults to the backend's distribution limit.
+            raw: Boolean that determines if events are returned as JSON
+                strings instead of dictionaries.
+        Returns:
+            List of events.
+        Raises:
+            RequestTimeout: the scan did not finish within timeout.
+        """
+        timeout = timeout or self.backend.limits.get('distribution')
+        root_id = str(uuid.uuid4())
+        expire_at = int(time.time()) + timeout
+
+        file = strelka.File(pointer=root_id, name=name, source=source)
+        if flavors:
+            file.add_flavors({'external': list(flavors)})
+
+        try:
+            # Data is stored as a single item (there is no network hop to
+            # chunk for), so the backend reads it back without copying.
+            self.coordinator.rpush(f'data:{root_id}', data)
+            self.coordinator.expireat(f'data:{root_id}', expire_at)
+
+            with interruptingcow.timeout(timeout, strelka.RequestTimeout):
+                self.backend.distribute(root_id, file, expire_at)
+
+            events = []
+            while True:
+                event = self.coordinator.lpop(f'event:{root_id}')
+                if event is None:
+                    break
+                events.append(event.decode() if raw else json.loads(event))
+            return events
+        finally:
+            self.coordinator.flushdb()
+
+    def scan_file(self, path, name=None, **kwargs):
+        """Scans a file from disk (see scan_bytes)."""
+        with open(path, 'rb') as f:
+            data = f.read()
+        return self.scan_bytes(data, name=path if name is None else name,
+                               **kwargs)
+
+
+def load_config(backend_cfg=None):
+    """Loads a backend configuration from a path or returns it unchanged.
+
+    Scanners that are configured as a path are loaded by the Backend.
+    """
+    if backend_cfg is None:
+        backend_cfg = DEFAULT_BACKEND_CFG
+    if isinstance(backend_cfg, str):
+        with open(backend_cfg) as f:
+            backend_cfg = yaml.safe_load(f.read())
+    return backend_cfg
+
+
+_backends = {}
+
+
+def _get_backend(config):
+    """Returns a cached LocalBackend for a configuration."""
+    if config is None or isinstance(config, str):
+        key = config
+    else:
+        key = json.dumps(config, sort_keys=True, default=str)
+    if key not in _backends:
+        _backends[key] = LocalBackend(config)
+    return _backends[key]
+
+
+def scan_bytes(data, name='', config=None, **kwargs):
+    """Scans data in-process and returns its events.
+
+    Args:
+        data: Bytes of the file to scan.
+        name: Filename assigned to the file.
+        config: Path to a backend configuration file or a parsed backend
+            configuration. Defaults to /etc/strelka/backend.yaml.
+        **kwargs: See LocalBackend.scan_bytes.
+    Returns:
+        List of events (one per file, root first).
+    """
+    return _get_backend(config).scan_bytes(data, name=name, **kwargs)
+
+
+def scan_file(path, name=None, config=None, **kwargs):
+    """Scans a file from disk in-process and returns its events."""
+    return _get_backend(config).scan_file(path, name=name, **kwargs)
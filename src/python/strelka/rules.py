@@ -0,0 +1,201 @@
+"""Compiled YARA rule sets that are reloaded when their files change.
+
+A RuleSet compiles the YARA files found in one or more locations (files or
+directories) into a single yara.Rules object. When watching is enabled, a
+background thread polls the files' modification times and sizes, recompiles
+the rules when they change, and swaps the compiled rules in atomically;
+scanning keeps using the previous rules until the new rules are ready and a
+failed compilation keeps the previous rules.
+
+If a cache directory is configured, then compiled rules are saved there
+(with yara.Rules.save) keyed by a hash of the rule sources and fresh workers
+load them instead of compiling. Compilation then happens in a child process
+so that it does not hold up scanning.
+"""
+import glob
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+import yara
+
+
+def _compile_to_file(filepaths, externals, path):
+    """Compiles rules and saves them to path (runs in a child process)."""
+    compiled_yara = yara.compile(filepaths=filepaths, externals=externals)
+    (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(path))
+    os.close(fd)
+    compiled_yara.save(filepath=tmp_path)
+    os.replace(tmp_path, path)
+
+
+def yara_filepaths(locations):
+    """Maps namespaces to YARA files.
+
+    Args:
+        locations: List of (location, namespace prefix) tuples. Files in each
+            location (a file or directory) are mapped to namespaces named
+            prefix_N.
+    Returns:
+        Dictionary of namespaces to file paths.
+    """
+    filepaths = {}
+    for (location, prefix) in locations:
+        if os.path.isdir(location):
+            entries = sorted(glob.iglob(f'{location}/**/*.yar*',
+                                        recursive=True))
+        elif os.path.exists(location):
+            entries = [location]
+        else:
+            entries = []
+        for (i, entry) in enumerate(entries):
+            filepaths[f'{prefix}_{i}'] = entry
+    return filepaths
+
+
+def fingerprint(filepaths):
+    """Returns a cheap fingerprint of file names, sizes, and mtimes."""
+    stats = []
+    for (namespace, path) in sorted(filepaths.items()):
+        st = os.stat(path)
+        stats.append((namespace, path, st.st_size, st.st_mtime_ns))
+    return stats
+
+
+def hash_sources(filepaths, externals):
+    """Hashes rule sources, externals, and the YARA version.
+
+    Rules compiled from sources with the same hash are identical (see
+    RuleSet.source_hash).
+    """
+    h = hashlib.sha256(yara.__version__.encode())
+    h.update(repr(sorted(externals.items())).encode())
+    for (namespace, path) in sorted(filepaths.items()):
+        h.update(namespace.encode())
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class RuleSet(object):
+    """Compiles YARA files and keeps the compiled rules current.
+
+    Attributes:
+        locations: List of (location, namespace prefix) tuples. Files in each
+            location are compiled into namespaces named prefix_N.
+        externals: Dictionary of external variables defined at compilation.
+        cache_directory: Directory where compiled rules are saved and loaded
+            from (optional).
+        rules: Current compiled rules (None if there are no YARA files).
+        compilation_ms: Time spent compiling or loading the current rules.
+        source_hash: SHA256 of the current rule sources.
+    """
+    def __init__(self, locations, externals=None, cache_directory=None):
+        self.locations = locations
+        self.externals = externals or {}
+        self.cache_directory = cache_directory
+        self.rules = None
+        self.compilation_ms = 0
+        self.source_hash = None
+
+        self._fingerprint = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.reload()
+
+    def filepaths(self):
+        """Maps namespaces to the YARA files in each location."""
+        return yara_filepaths(self.locations)
+
+    def fingerprint(self, filepaths):
+        """Returns a cheap fingerprint of file names, sizes, and mtimes."""
+        return fingerprint(filepaths)
+
+    def hash_sources(self, filepaths):
+        """Hashes rule sources, externals, and the YARA version."""
+        return hash_sources(filepaths, self.externals)
+
+    def reload(self):
+        """Recompiles the rules if their files changed.
+
+        Returns:
+            True if the rules were replaced.
+        Raises:
+            yara.Error: the rules could not be compiled.
+        """
+        filepaths = self.filepaths()
+        fingerprint = self.fingerprint(filepaths)
+        if fingerprint == self._fingerprint:
+            return False
+
+        source_hash = self.hash_sources(filepaths)
+        if source_hash == self.source_hash:
+            self._fingerprint = fingerprint
+            return False
+
+        start = time.time()
+        try:
+            if not filepaths:
+                rules = None
+            elif self.cache_directory:
+                rules = self._load_cached(filepaths, source_hash)
+            else:
+                rules = yara.compile(filepaths=filepaths,
+                                     externals=self.externals)
+        except Exception:
+            # Failed sources are not retried until their files change again.
+            self._fingerprint = fingerprint
+            raise
+
+        self.rules = rules
+        self.compilation_ms = (time.time() - start) * 1000
+        self.source_hash = source_hash
+        self._fingerprint = fingerprint
+        return True
+
+    def _load_cached(self, filepaths, source_hash):
+        """Loads compiled rules from the cache, compiling them if needed."""
+        os.makedirs(self.cache_directory, exist_ok=True)
+        path = os.path.join(self.cache_directory, f'{source_hash}.yarc')
+        if not os.path.exists(path):
+            # The compiler is spawned because the backend may be running
+            # threads (e.g. the rule watcher) that hold locks.
+            process = multiprocessing.get_context('spawn').Process(
+                target=_compile_to_file,
+                args=(filepaths, self.externals, path),
+                daemon=True,
+            )
+            process.start()
+            process.join()
+            if not os.path.exists(path):
+                # Compile in-process to surface the compilation error.
+                yara.compile(filepaths=filepaths, externals=self.externals)
+                raise yara.Error(f'unable to compile rules into {path}')
+        return yara.load(filepath=path)
+
+    def watch(self, interval):
+        """Starts polling the rule files every interval seconds."""
+        if self._thread is not None or not interval:
+            return
+        self._thread = threading.Thread(target=self._watch,
+                                        args=(interval,),
+                                        daemon=True)
+        self._thread.start()
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                if self.reload():
+                    logging.info(f'reloaded YARA rules from {self.locations}'
+                                 f' in {self.compilation_ms:.0f} ms')
+            except Exception as e:
+                logging.warning(f'unable to reload YARA rules from'
+                                f' {self.locations} ({e})')
+
+    def stop(self):
+        """Stops polling the rule files."""
+        self._stop.set()
@@ -3,74 +3,111 @@ import os
 import json
 import subprocess
 import tempfile
+import time
 
+from strelka import analyzers
 from strelka import strelka
 
+CAPA = '/tmp/capa-linux'
+
+
+def _capa(data, location, tmp_directory, timeout, deadline):
+    """Runs CAPA and returns its matches (see strelka.analyzers.analyze)."""
+    result = {'flags': []}
+    try:
+        with tempfile.NamedTemporaryFile(dir=tmp_directory) as tmp_data:
+            tmp_data.write(data)
+            tmp_data.flush()
+
+            try:
+                stdout = subprocess.run(
+                    [CAPA, tmp_data.name, '-r', location, '-j'],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    timeout=max(0, min(timeout, deadline - time.time())),
+                ).stdout
+            except subprocess.TimeoutExpired:
+                result['flags'].append('analyzer_timed_out')
+                return result
+            except:
+                result['flags'].append('error_processing')
+                return result
+
+            if stdout:
+                # Observed extraneous data in stdout requiring string trimming. Parse out JSON response.
+                # This can be fixed when CAPA is aviailable as a Python 3 library.
+                try:
+                    stdout = stdout[stdout.find(b'{'):]
+                    stdout = stdout[:stdout.rfind(b'}')]
+                    stdout += b'}'
+                    capa_json = json.loads(stdout)
+                except:
+                    result['flags'].append('error_parsing')
+                    return result
+
+                try:
+                    # Sets are used to remove duplicative values
+                    matches = set()
+                    mitre_techniques = set()
+                    mitre_ids = set()
+
+                    for k, v in capa_json['rules'].items():
+                        matches.add(k)
+                        if 'att&ck' in v['meta']:
+                            match = re.search(r'^([^:]+)::([^\[)]+)\s\[([^\]]+)\]', v['meta']['att&ck'][0])
+                            mitre_techniques.add(match.group(2))
+                            mitre_ids.add(match.group(3))
+                    # For consistency, convert sets to list
+                    result['matches'] = list(matches)
+                    result['mitre_techniques'] = list(mitre_techniques)
+                    result['mitre_ids'] = list(mitre_ids)
+                except:
+                    result['flags'].append('error_collection')
+    except:
+        result['flags'].append('error_execution')
+    return result
+
 
 class ScanCapa(strelka.Scanner):
     """Executes FireEye CAPA with versioned rules and provides known capabilities and MITRE ATT&CK matches.
 
+    CAPA runs out of band and its results are cached by CAPA and rules
+    version (see strelka.Scanner.run_analyzer).
+
     Options:
         tmp_directory: Location where tempfile writes temporary files.
             Defaults to '/tmp/'.
         location: Location of the CAPA rules file or directory.
             Defaults to '/etc/capa/'
+        timeout: Maximum time (in seconds) that CAPA can spend analyzing
+            a file; analyses also stop when the request expires (or, if
+            they are not deferred, when the scanner times out).
+            Defaults to 300.
+        deferred: Boolean that determines if CAPA runs out of band; results
+            are emitted as a follow-up event.
+            Defaults to True.
+        analyzer_workers: Number of files analyzed concurrently.
+            Defaults to 1.
+        analyzer_queue_size: Maximum number of files waiting for analysis.
+            Defaults to 16.
+        analyzer_cache_ttl: Time (in seconds) that results are cached.
+            Defaults to 86400.
     """
 
     def scan(self, data, file, options, expire_at):
         tmp_directory = options.get('tmp_directory', '/tmp/')
         location = options.get('location', '/etc/capa/')
+        timeout = options.get('timeout', 300)
 
         # Only run if rules file exists, otherwise return no rules error
         if len(os.listdir(location)) != 0:
-            try:
-                with tempfile.NamedTemporaryFile(dir=tmp_directory) as tmp_data:
-                    tmp_data.write(data)
-                    tmp_data.flush()
-
-                    try:
-                        (stdout, stderr) = subprocess.Popen(
-                            ['/tmp/capa-linux', tmp_data.name, '-r', location, '-j'],
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.DEVNULL
-                        ).communicate()
-                    except:
-                        self.flags.append('error_processing')
-                        return
-
-                    if stdout:
-                        # Observed extraneous data in stdout requiring string trimming. Parse out JSON response.
-                        # This can be fixed when CAPA is aviailable as a Python 3 library.
-                        try:
-                            stdout = stdout[stdout.find(b'{'):]
-                            stdout = stdout[:stdout.rfind(b'}')]
-                            stdout += b'}'
-                            capa_json = json.loads(stdout)
-                        except:
-                            self.flags.append('error_parsing')
-                            return
-
-                        try:
-                            # Sets are used to remove duplicative values
-                            self.event['matches'] = set()
-                            self.event['mitre_techniques'] = set()
-                            self.event['mitre_ids'] = set()
-
-                            for k, v in capa_json['rules'].items():
-                                self.event['matches'].add(k)
-                                if 'att&ck' in v['meta']:
-                                    result = re.search(r'^([^:]+)::([^\[)]+)\s\[([^\]]+)\]', v['meta']['att&ck'][0])
-                                    self.event['mitre_techniques'].add(result.group(2))
-                                    self.event['mitre_ids'].add(result.group(3))
-                            # For consistency, convert sets to list
-                            self.event['matches'] = list(self.event['matches'])
-                            self.event['mitre_techniques'] = list(self.event['mitre_techniques'])
-                            self.event['mitre_ids'] = list(self.event['mitre_ids'])
-                        except:
-                            self.flags.append('error_collection')
-            except:
-                self.flags.append('error_execution')
+            self.run_analyzer(
+                _capa,
+                (data, location, tmp_directory, timeout),
+                analyzers.fingerprint(CAPA, location),
+                file,
+                options,
+                expire_at,
+            )
         else:
             self.flags.append('error_norules')
-
-
@@ -1,7 +1,6 @@
 import olefile
 import re
 import struct
-from io import BytesIO
 
 from strelka import strelka
 
@@ -30,16 +29,13 @@ class ScanDocExtractImages(strelka.Scanner):
         self.event["total"] = {"extracted": 0, "images": 0, "ole_objects": 0}
         
         try:
-            # Create a BytesIO object to open the OLE file
-            ole_data = BytesIO(data)
-            
             # Check if this is an OLE file
-            if not olefile.isOleFile(ole_data):
+            if not olefile.isOleFile(data):
                 self.flags.append('not_ole_file')
                 return
                 
-            # Open the OLE file
-            ole = olefile.OleFileIO(ole_data)
+            # Open the OLE file (shared with other scanners, not closed here)
+            ole = file.artifacts.get('ole.container')
             
             # Add basic OLE metadata
             self.event['ole_streams'] = ole.listdir()
@@ -254,9 +250,6 @@ class ScanDocExtractImages(strelka.Scanner):
                     except Exception as e:
                         self.flags.append(f'object_extraction_error')
             
-            # Close the OLE file
-            ole.close()
-            
             # Report status
             if not word_document_found:
                 self.flags.append('no_word_document_stream')
@@ -1,9 +1,106 @@
 import entropy
+import numpy
 
 from strelka import strelka
 
 
 class ScanEntropy(strelka.Scanner):
-    """Calculates entropy of files."""
+    """Calculates entropy of files.
+
+    Options:
+        windowed: Boolean that determines if the entropy of fixed-size
+            windows is calculated, summarized as statistics, a histogram,
+            and high entropy regions.
+            Defaults to False.
+        window_size: Size of windows in bytes.
+            Defaults to 4096.
+        max_windows: Maximum number of windows that are calculated. Larger
+            files are sampled with evenly spaced windows.
+            Defaults to 4096.
+        threshold: Entropy (bits per byte) at or above which a window is
+            considered high entropy.
+            Defaults to 7.2.
+        max_regions: Maximum number of high entropy regions to report.
+            Defaults to 16.
+    """
     def scan(self, data, file, options, expire_at):
         self.event['entropy'] = entropy.shannon_entropy(data)
+
+        if options.get('windowed', False) and data:
+            self.event['windows'] = self._windows(
+                data,
+                options.get('window_size', 4096),
+                options.get('max_windows', 4096),
+                options.get('threshold', 7.2),
+                options.get('max_regions', 16),
+            )
+
+    @staticmethod
+    def _windows(data, window_size, max_windows, threshold, max_regions):
+        """Calculates the entropy of fixed-size windows.
+
+        Windows are a strided view of the data (a file smaller than one
+        window is one window). If the data is not a multiple of the window
+        size, then the last window ends at the end of the data (overlapping
+        the previous window), so trailing bytes are always measured. Byte
+        counts are calculated with one bincount per batch of windows,
+        offsetting each window's bytes into its own range of 256 bins.
+        """
+        view = numpy.frombuffer(data, dtype=numpy.uint8)
+        window_size = min(window_size, len(view))
+        starts = numpy.arange(0, len(view) - window_size + 1, window_size)
+        if starts[-1] + window_size < len(view):
+            starts = numpy.append(starts, len(view) - window_size)
+        count = len(starts)
+
+        if count > max_windows:
+            starts = starts[numpy.linspace(0, count - 1, max_windows).astype(numpy.int64)]
+        windows = numpy.lib.stride_tricks.sliding_window_view(view, window_size)
+
+        # Batches bound the size of the offset bytes passed to bincount.
+        batch = max(1, (1024 * 1024) // window_size)
+        entropies = numpy.empty(len(starts))
+        offsets = (numpy.arange(batch, dtype=numpy.int64) * 256)[:, None]
+        for start in range(0, len(starts), batch):
+            rows = windows[starts[start:start + batch]]
+            counts = numpy.bincount(
+                (rows + offsets[:len(rows)]).ravel(),
+                minlength=len(rows) * 256,
+            ).reshape(len(rows), 256)
+            p = counts / window_size
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                h = 0.0 - numpy.where(p > 0, p * numpy.log2(p), 0).sum(axis=1)
+            entropies[start:start + len(rows)] = h
+
+        (histogram, _) = numpy.histogram(entropies, bins=8, range=(0, 8))
+
+        # High entropy windows that touch or overlap are merged into
+        # regions; sampled windows separated by unsampled data are not.
+        regions = []
+        high = numpy.flatnonzero(entropies >= threshold)
+        if len(high):
+            breaks = numpy.flatnonzero(
+                (numpy.diff(high) != 1)
+                | (numpy.diff(starts[high]) > window_size)
+            ) + 1
+            for group in numpy.split(high, breaks)[:max_regions]:
+                offset = int(starts[group[0]])
+                end = int(starts[group[-1]]) + window_size
+                regions.append({
+                    'offset': offset,
+                    'size': end - offset,
+                    'entropy': round(float(entropies[group].mean()), 4),
+                })
+
+        return {
+            'size': window_size,
+            'total': count,
+            'sampled': bool(count > max_windows),
+            'min': round(float(entropies.min()), 4),
+            'max': round(float(entropies.max()), 4),
+            'mean': round(float(entropies.mean()), 4),
+            'stdev': round(float(entropies.std()), 4),
+            'histogram': histogram.tolist(),
+            'high_entropy_windows': len(high),
+            'high_entropy_regions': regions,
+        }
@@ -1,43 +1,131 @@
 import ast
 import json
+import os
+import select
 import subprocess
 import tempfile
+import time
 
 from strelka import strelka
 
 
+class ExiftoolSession(object):
+    """Long-lived exiftool process that runs commands with -stay_open.
+
+    Arguments are written to exiftool's standard input (one per line) and
+    each command ends with a numbered -execute; its output ends with a
+    matching {ready} marker. A session that fails or times out is closed
+    and restarted on the next command.
+    """
+    def __init__(self):
+        self.process = None
+        self.count = 0
+
+    def start(self):
+        self.process = subprocess.Popen(
+            ['exiftool', '-stay_open', 'True', '-@', '-'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.write(b'-stay_open\nFalse\n')
+            self.process.stdin.flush()
+            self.process.wait(timeout=1)
+        except Exception:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def execute(self, args, timeout):
+        """Runs a command and returns its output.
+
+        Raises:
+            TimeoutError: the command did not finish within timeout seconds.
+            OSError: exiftool exited or could not be started.
+        """
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+
+        self.count += 1
+        marker = f'{{ready{self.count}}}\n'.encode()
+        command = ''.join(f'{arg}\n' for arg in args) + f'-execute{self.count}\n'
+
+        try:
+            self.process.stdin.write(command.encode())
+            self.process.stdin.flush()
+
+            fd = self.process.stdout.fileno()
+            deadline = time.time() + timeout
+            output = b''
+            while not output.endswith(marker):
+                remaining = deadline - time.time()
+                if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                    raise TimeoutError(f'exiftool did not finish within {timeout} seconds')
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    raise OSError('exiftool exited')
+                output += chunk
+        except BaseException:
+            # Output of an unfinished command would be read by the next one.
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+            raise
+
+        return output[:-len(marker)]
+
+
 class ScanExiftool(strelka.Scanner):
     """Collects metadata parsed by Exiftool.
 
+    Files are parsed by a long-lived exiftool process (see ExiftoolSession)
+    instead of starting exiftool for every file.
+
     Options:
-        keys: exiftool key values to log in the event.
+        keys: exiftool key values to log in the event. Only these tags are
+            requested from exiftool.
             Defaults to all.
         tmp_directory: Location where tempfile writes temporary files.
+            A tmpfs (e.g. '/dev/shm/') avoids writing files to disk.
             Defaults to '/tmp/'.
+        timeout: Maximum time (in seconds) that exiftool can spend parsing
+            a file.
+            Defaults to 30.
     """
+    def init(self):
+        self.session = ExiftoolSession()
+
     def scan(self, data, file, options, expire_at):
         keys = options.get('keys', [])
         tmp_directory = options.get('tmp_directory', '/tmp/')
+        timeout = options.get('timeout', 30)
 
         with tempfile.NamedTemporaryFile(dir=tmp_directory) as tmp_data:
             tmp_data.write(data)
             tmp_data.flush()
 
-            (stdout, stderr) = subprocess.Popen(
-                ['exiftool', '-d', '"%s"', '-j', tmp_data.name],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.DEVNULL,
-            ).communicate()
+            try:
+                stdout = self.session.execute(
+                    ['-d', '"%s"', '-j', *[f'-{k}' for k in keys], tmp_data.name],
+                    timeout,
+                )
+            except TimeoutError:
+                self.flags.append('exiftool_timeout')
+                return
+            except OSError:
+                self.flags.append('exiftool_error')
+                return
 
             if stdout:
                 exiftool_dictionary = json.loads(stdout)[0]
 
                 self.event['keys'] = []
                 for k, v in exiftool_dictionary.items():
-                    # Include all, at least to start and see what's available.
-                    # if keys and k not in keys:
-                    #     continue
-
                     if isinstance(v, str):
                         v = v.strip()
                         v = v.strip('\'"')
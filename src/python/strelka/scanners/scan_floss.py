@@ -1,57 +1,92 @@
 import json
 import subprocess
 import tempfile
+import time
 
+from strelka import analyzers
 from strelka import strelka
 
+FLOSS = '/tmp/floss'
+
+
+def _floss(data, limit, tmp_directory, timeout, deadline):
+    """Runs FLOSS and returns its strings (see strelka.analyzers.analyze)."""
+    result = {'flags': [], 'decoded': [], 'stack': []}
+    try:
+        with tempfile.NamedTemporaryFile(dir=tmp_directory) as tmp_data:
+            # Write out the sample to a temporary file
+            tmp_data.write(data)
+            tmp_data.flush()
+
+            try:
+                # Write out floss results to a temporary file for processing
+                with tempfile.NamedTemporaryFile(dir=tmp_directory) as tmp_output:
+                    try:
+                        subprocess.run(
+                            [FLOSS, '-q', '--no-static-strings', '-o', tmp_output.name, tmp_data.name],
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL,
+                            timeout=max(0, min(timeout, deadline - time.time())),
+                        )
+                        floss_json = json.load(tmp_output)
+                    except subprocess.TimeoutExpired:
+                        result['flags'].append('analyzer_timed_out')
+                        return result
+                    except:
+                        result['flags'].append('error_processing')
+                        return result
+
+                    try:
+                        if floss_json['strings']['decoded_strings']:
+                            result['decoded'] = floss_json['strings']['decoded_strings'][:limit]
+                        if floss_json['strings']['stack_strings']:
+                            result['stack'] = floss_json['strings']['stack_strings'][:limit]
+                    except:
+                        result['flags'].append('error_parsing')
+                        return result
+            except:
+                result['flags'].append('error_execution')
+    except:
+        result['flags'].append('error_execution')
+    return result
+
 
 class ScanFloss(strelka.Scanner):
     """Executes FireEye FLOSS.
 
+    FLOSS runs out of band and its results are cached by FLOSS version
+    (see strelka.Scanner.run_analyzer).
+
     Options:
         tmp_directory: Location where tempfile writes temporary files.
             Defaults to '/tmp/'.
         limit: Maximum amount of strings to collect.
             Defaults to 100.
+        timeout: Maximum time (in seconds) that FLOSS can spend analyzing
+            a file; analyses also stop when the request expires (or, if
+            they are not deferred, when the scanner times out).
+            Defaults to 300.
+        deferred: Boolean that determines if FLOSS runs out of band; results
+            are emitted as a follow-up event.
+            Defaults to True.
+        analyzer_workers: Number of files analyzed concurrently.
+            Defaults to 1.
+        analyzer_queue_size: Maximum number of files waiting for analysis.
+            Defaults to 16.
+        analyzer_cache_ttl: Time (in seconds) that results are cached.
+            Defaults to 86400.
     """
 
     def scan(self, data, file, options, expire_at):
         tmp_directory = options.get('tmp_directory', '/tmp/')
         limit = options.get('limit', 100)
+        timeout = options.get('timeout', 300)
 
-        self.event['decoded'] = []
-        self.event['stack'] = []
-
-        try:
-            with tempfile.NamedTemporaryFile(dir=tmp_directory) as tmp_data:
-                # Write out the sample to a temporary file
-                tmp_data.write(data)
-
-                try:
-                    # Write out floss results to a temporary file for processing
-                    with tempfile.NamedTemporaryFile(dir=tmp_directory) as tmp_output:
-                        try:
-                            subprocess.Popen(
-                                ['/tmp/floss', '-q', '--no-static-strings', '-o', tmp_output.name, tmp_data.name],
-                                stdout=subprocess.DEVNULL,
-                                stderr=subprocess.DEVNULL
-                            ).communicate()
-                            floss_json = json.load(tmp_output)
-                        except:
-                            self.flags.append('error_processing')
-                            return
-
-                        try:
-                            if floss_json['strings']['decoded_strings']:
-                                self.event['decoded'] = floss_json['strings']['decoded_strings'][:limit]
-                            if floss_json['strings']['stack_strings']:
-                                self.event['stack'] = floss_json['strings']['stack_strings'][:limit]
-                        except:
-                            self.flags.append('error_parsing')
-                            return
-                except:
-                    self.flags.append('error_execution')
-        except:
-            self.flags.append('error_execution')
-
-
+        self.run_analyzer(
+            _floss,
+            (data, limit, tmp_directory, timeout),
+            f'{analyzers.fingerprint(FLOSS)}:{limit}',
+            file,
+            options,
+            expire_at,
+        )
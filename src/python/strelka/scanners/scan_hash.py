@@ -1,15 +1,21 @@
-import hashlib
-import ssdeep
-
-import redis
-
 from strelka import strelka
 
 
 class ScanHash(strelka.Scanner):
-    """Calculates file hash values."""
+    """Calculates file hash values.
+
+    Hash values are calculated in one pass over the file (see
+    strelka.digests); large files are hashed on worker threads.
+
+    Options:
+        tlsh: Boolean that determines if the TLSH hash is calculated. Files
+            that are too small or uniform to hash have a TLSH of None.
+            Defaults to False.
+    """
     def scan(self, data, file, options, expire_at):
-        self.event['md5'] = hashlib.md5(data).hexdigest()
-        self.event['sha1'] = hashlib.sha1(data).hexdigest()
-        self.event['sha256'] = hashlib.sha256(data).hexdigest()
-        self.event['ssdeep'] = ssdeep.hash(data)
+        names = ['md5', 'sha1', 'sha256', 'ssdeep']
+        if options.get('tlsh', False):
+            names.append('tlsh')
+
+        for (name, value) in file.artifacts.digests(names).items():
+            self.event[name] = value
@@ -1,19 +1,121 @@
 import bs4
 import re
 
+from lxml import etree
+
 from strelka import strelka
 
 base64Re = re.compile("^([A-Za-z0-9+/]{4})*([A-Za-z0-9+/]{3}=|[A-Za-z0-9+/]{2}==)?$")
 
+# Tags whose attributes (or text) are collected.
+TAGS = ['a', 'img', 'form', 'frame', 'iframe', 'input', 'script', 'span', 'div']
+
+
+def _text(data):
+    """Joins text like bs4, which collapses whitespace-only text."""
+    text = ''.join(data)
+    if text and not text.strip(' \t\n\r\f'):
+        return '\n' if '\n' in text else ' '
+    return text
+
+
+class _Collector(object):
+    """Collects tags from lxml parser events without building a tree.
+
+    Attributes:
+        title: Text of the first title tag.
+        tags: Dictionary of tag names (see TAGS) to lists of attribute
+            dictionaries in document order. Scripts are (attributes, text)
+            tuples and divs are their string (see bs4.Tag.string).
+    """
+    def __init__(self):
+        self.title = None
+        self.tags = {name: [] for name in TAGS}
+        # Open elements: [tag, index in tags, text, number of children,
+        # string of the last child]
+        self._stack = []
+        self._in_title = False
+
+    def start(self, tag, attrib):
+        if tag == 'title' and self.title is None:
+            self._in_title = True
+            self.title = ''
+
+        index = None
+        if tag in self.tags:
+            attrs = dict(attrib)
+            if 'class' in attrs:
+                # Matches bs4, which splits multi-valued attributes.
+                attrs['class'] = attrs['class'].split()
+            if (tag != 'a' or 'href' in attrs) and (tag != 'img' or 'src' in attrs):
+                index = len(self.tags[tag])
+                self.tags[tag].append(attrs)
+        self._stack.append([tag, index, [], 0, None])
+
+    def data(self, data):
+        if self._in_title:
+            self.title += data
+        if self._stack:
+            self._stack[-1][2].append(data)
+
+    def comment(self, text):
+        if self._stack:
+            self._stack[-1][3] += 1
+            self._stack[-1][4] = text
+
+    def end(self, tag):
+        if tag == 'title':
+            self._in_title = False
+        (tag, index, text, children, child_string) = self._stack.pop()
+
+        string = None
+        if not children and text:
+            string = _text(text)
+        elif children == 1 and not text:
+            string = child_string
+        if self._stack:
+            self._stack[-1][3] += 1
+            self._stack[-1][4] = string
+
+        if tag == 'script':
+            self.tags[tag][index] = (self.tags[tag][index], _text(text))
+        elif tag == 'div':
+            self.tags[tag][index] = string
+
+    def close(self):
+        pass
+
+
+def _unique(entries):
+    """Removes duplicate dictionaries, preserving order."""
+    unique = {}
+    for entry in entries:
+        key = tuple(
+            (k, tuple(v) if isinstance(v, list) else v)
+            for (k, v) in entry.items()
+        )
+        unique.setdefault(key, entry)
+    return list(unique.values())
+
+
 class ScanHtml(strelka.Scanner):
     """Collects metadata and extracts embedded scripts from HTML files.
 
     Options:
-        parser: Sets the HTML parser used during scanning.
+        engine: Engine used to parse HTML, 'soup' (builds a BeautifulSoup
+            tree with parser) or 'lxml' (tokenizes HTML in chunks with lxml
+            and collects tags from parser events without building a tree).
+            Defaults to 'soup'.
+        parser: Sets the HTML parser used during scanning by the 'soup'
+            engine.
             Defaults to 'html.parser'.
+        chunk_size: Size of chunks fed to the parser by the 'lxml' engine.
+            Defaults to 1048576 (1 MB).
     """
     def scan(self, data, file, options, expire_at):
+        engine = options.get('engine', 'soup')
         parser = options.get('parser', 'html.parser')
+        chunk_size = options.get('chunk_size', 1024 * 1024)
 
         self.event['total'] = {
             'scripts': 0,
@@ -24,150 +126,165 @@ class ScanHtml(strelka.Scanner):
         }
 
         try:
-            soup = bs4.BeautifulSoup(data, parser)
-
-            if soup.title:
-                self.event['title'] = soup.title.text
-
-            hyperlinks = []
-            hyperlinks.extend(soup.find_all('a', href=True))
-            hyperlinks.extend(soup.find_all('img', src=True))
-            self.event.setdefault('hyperlinks', [])
-            for hyperlink in hyperlinks:
-                link = hyperlink.get('href') or hyperlink.get('src')
-
-                if link and link.startswith('data:') and ';base64,' in link:
-                    hyperlink_data = link.split(';base64,')[1]
-                    extract_file = strelka.File(
-                        name='base64_hyperlink',
-                        source=self.name,
-                    )
-                    extract_file.add_flavors({'external': ['base64']})
-
-                    for c in strelka.chunk_string(hyperlink_data):
-                        self.upload_to_coordinator(
-                            extract_file.pointer,
-                            c,
-                            expire_at,
-                        )
-
-                    self.files.append(extract_file)
-                    self.event['total']['extracted'] += 1
-
-                else:
-                    if link not in self.event['hyperlinks']:
-                        self.event['hyperlinks'].append(link)
-
-            forms = soup.find_all('form')
-            self.event['total']['forms'] = len(forms)
-            self.event.setdefault('forms', [])
-            for form in forms:
-                form_entry = {
-                    'action': form.get('action'),
-                    'method': form.get('method'),
-                }
-                if form_entry not in self.event['forms']:
-                    self.event['forms'].append(form_entry)
-
-            frames = []
-            frames.extend(soup.find_all('frame'))
-            frames.extend(soup.find_all('iframe'))
-            self.event['total']['frames'] = len(frames)
-            self.event.setdefault('frames', [])
-            for frame in frames:
-                frame_entry = {
-                    'src': frame.get('src'),
-                    'name': frame.get('name'),
-                    'height': frame.get('height'),
-                    'width': frame.get('width'),
-                    'border': frame.get('border'),
-                    'id': frame.get('id'),
-                    'style': frame.get('style'),
-                }
-                if frame_entry not in self.event['frames']:
-                    self.event['frames'].append(frame_entry)
-
-            inputs = soup.find_all('input')
-            self.event['total']['inputs'] = len(inputs)
-            self.event.setdefault('inputs', [])
-            for html_input in inputs:
-                input_entry = {
-                    'type': html_input.get('type'),
-                    'name': html_input.get('name'),
-                    'value': html_input.get('value'),
-                }
-                if input_entry not in self.event['inputs']:
-                    self.event['inputs'].append(input_entry)
-
-            scripts = soup.find_all('script')
-            self.event['total']['scripts'] = len(scripts)
-            self.event.setdefault('scripts', [])
-            for (index, script) in enumerate(scripts):
-                script_flavors = [
-                    script.get('language', '').lower(),
-                    script.get('type', '').lower(),
-                    'text/javascript',
-                ]
-                script_entry = {
-                    'src': script.get('src'),
-                    'language': script.get('language'),
-                    'type': script.get('type'),
-                }
-                if script_entry not in self.event['scripts']:
-                    self.event['scripts'].append(script_entry)
-
-                if script.text:
-                    extract_file = strelka.File(
-                        name=f'script_{index}',
-                        source=self.name,
+            if engine == 'lxml':
+                (title, tags) = self._parse_lxml(data, chunk_size)
+            else:
+                (title, tags) = self._parse_soup(data, parser)
+        except TypeError:
+            self.flags.append('type_error')
+            return
+        except etree.LxmlError:
+            self.flags.append('lxml_error')
+            return
+
+        if title is not None:
+            self.event['title'] = title
+
+        self.event.setdefault('hyperlinks', [])
+        hyperlinks = {}
+        for hyperlink in tags['a'] + tags['img']:
+            link = hyperlink.get('href') or hyperlink.get('src')
+
+            if link and link.startswith('data:') and ';base64,' in link:
+                hyperlink_data = link.split(';base64,')[1]
+                extract_file = strelka.File(
+                    name='base64_hyperlink',
+                    source=self.name,
+                )
+                extract_file.add_flavors({'external': ['base64']})
+
+                for c in strelka.chunk_string(hyperlink_data):
+                    self.upload_to_coordinator(
+                        extract_file.pointer,
+                        c,
+                        expire_at,
                     )
-                    extract_file.add_flavors({'external': script_flavors})
-
-                    for c in strelka.chunk_string(script.text):
-                        self.upload_to_coordinator(
-                            extract_file.pointer,
-                            c,
-                            expire_at,
-                        )
-
-                    self.files.append(extract_file)
-                    self.event['total']['extracted'] += 1
-
-            spans = soup.find_all('span')
-            self.event['total']['spans'] = len(spans)
-            self.event.setdefault('spans', [])
-            for span in spans:
-                span_entry = {
-                    'class': span.get('class'),
-                    'style': span.get('style'),
-                }
-                if span_entry not in self.event['spans']:
-                    self.event['spans'].append(span_entry)
-
-            divs = soup.find_all('div')
-            for div in divs:
-                div_content = div.string
-                if div_content is None:
-                    continue
-
-                maybeBase64 = base64Re.search(div_content)
-
-                if maybeBase64:
-                    extract_file = strelka.File(
-                        name='base64_div',
-                        source=self.name,
+
+                self.files.append(extract_file)
+                self.event['total']['extracted'] += 1
+
+            else:
+                hyperlinks.setdefault(link, None)
+        self.event['hyperlinks'] = list(hyperlinks)
+
+        forms = tags['form']
+        self.event['total']['forms'] = len(forms)
+        self.event['forms'] = _unique({
+            'action': form.get('action'),
+            'method': form.get('method'),
+        } for form in forms)
+
+        frames = tags['frame'] + tags['iframe']
+        self.event['total']['frames'] = len(frames)
+        self.event['frames'] = _unique({
+            'src': frame.get('src'),
+            'name': frame.get('name'),
+            'height': frame.get('height'),
+            'width': frame.get('width'),
+            'border': frame.get('border'),
+            'id': frame.get('id'),
+            'style': frame.get('style'),
+        } for frame in frames)
+
+        inputs = tags['input']
+        self.event['total']['inputs'] = len(inputs)
+        self.event['inputs'] = _unique({
+            'type': html_input.get('type'),
+            'name': html_input.get('name'),
+            'value': html_input.get('value'),
+        } for html_input in inputs)
+
+        scripts = tags['script']
+        self.event['total']['scripts'] = len(scripts)
+        self.event['scripts'] = _unique({
+            'src': script.get('src'),
+            'language': script.get('language'),
+            'type': script.get('type'),
+        } for (script, _) in scripts)
+        for (index, (script, text)) in enumerate(scripts):
+            if not text:
+                continue
+
+            script_flavors = [
+                script.get('language', '').lower(),
+                script.get('type', '').lower(),
+                'text/javascript',
+            ]
+            extract_file = strelka.File(
+                name=f'script_{index}',
+                source=self.name,
+            )
+            extract_file.add_flavors({'external': script_flavors})
+
+            for c in strelka.chunk_string(text):
+                self.upload_to_coordinator(
+                    extract_file.pointer,
+                    c,
+                    expire_at,
+                )
+
+            self.files.append(extract_file)
+            self.event['total']['extracted'] += 1
+
+        spans = tags['span']
+        self.event['total']['spans'] = len(spans)
+        self.event['spans'] = _unique({
+            'class': span.get('class'),
+            'style': span.get('style'),
+        } for span in spans)
+
+        for div_content in tags['div']:
+            if div_content is None:
+                continue
+
+            maybeBase64 = base64Re.search(div_content)
+
+            if maybeBase64:
+                extract_file = strelka.File(
+                    name='base64_div',
+                    source=self.name,
+                )
+                extract_file.add_flavors({'external': ['base64']})
+
+                for c in strelka.chunk_string(div_content):
+                    self.upload_to_coordinator(
+                        extract_file.pointer,
+                        c,
+                        expire_at,
                     )
-                    extract_file.add_flavors({'external': ['base64']})
 
-                    for c in strelka.chunk_string(div_content):
-                        self.upload_to_coordinator(
-                            extract_file.pointer,
-                            c,
-                            expire_at,
-                        )
+                self.files.append(extract_file)
+                self.event['total']['extracted'] += 1
 
-                    self.files.append(extract_file)
-                    self.event['total']['extracted'] += 1
+    @staticmethod
+    def _parse_soup(data, parser):
+        """Collects tags in one traversal of a BeautifulSoup tree."""
+        soup = bs4.BeautifulSoup(data, parser)
+        title = soup.title.text if soup.title else None
 
-        except TypeError:
-            self.flags.append('type_error')
+        tags = {name: [] for name in TAGS}
+        for tag in soup.find_all(TAGS):
+            if tag.name == 'a' and not tag.has_attr('href') \
+                    or tag.name == 'img' and not tag.has_attr('src'):
+                continue
+            if tag.name == 'script':
+                tags['script'].append((tag, tag.text))
+            elif tag.name == 'div':
+                tags['div'].append(tag.string)
+            else:
+                tags[tag.name].append(tag)
+        return title, tags
+
+    @staticmethod
+    def _parse_lxml(data, chunk_size):
+        """Collects tags from lxml parser events, parsing data in chunks."""
+        collector = _Collector()
+        if not data:
+            return collector.title, collector.tags
+
+        parser = etree.HTMLParser(target=collector, huge_tree=True)
+        view = memoryview(data)
+        for i in range(0, len(view), chunk_size):
+            parser.feed(bytes(view[i:i + chunk_size]))
+        parser.close()
+        return collector.title, collector.tags
@@ -1,8 +1,105 @@
+import re
+
 import esprima
 import jsbeautifier
 
 from strelka import strelka
 
+# Keywords as classified by esprima.
+KEYWORDS = frozenset([
+    'break', 'case', 'catch', 'class', 'const', 'continue', 'debugger',
+    'default', 'delete', 'do', 'else', 'enum', 'export', 'extends',
+    'finally', 'for', 'function', 'if', 'import', 'in', 'instanceof', 'let',
+    'new', 'return', 'super', 'switch', 'this', 'throw', 'try', 'typeof',
+    'var', 'void', 'while', 'with', 'yield',
+])
+
+_TOKEN = (
+    r'(?P<LineComment>//[^\n\r\u2028\u2029]*)'
+    r'|(?P<BlockComment>/\*[\s\S]*?(?:\*/|\Z))'
+    r'|(?P<String>"(?:[^"\\\n\r]|\\[\s\S])*"?|\'(?:[^\'\\\n\r]|\\[\s\S])*\'?)'
+    r'|(?P<Template>`)'
+    r'|(?P<Name>[A-Za-z_$\u0080-\uffff][\w$\u0080-\uffff]*)'
+    r'|(?P<Numeric>0[xX][0-9a-fA-F]+|0[oO][0-7]+|0[bB][01]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)'
+    r'{regex}'
+    r'|(?P<Punctuator>>>>=|\.\.\.|===|!==|\*\*=|<<=|>>=|>>>|&&|\|\||=>|==|!=|<=|>=|\+\+|--|<<|>>|\+=|-=|\*=|/=|%=|&=|\|=|\^=|\*\*|[{{}}()\[\];,<>+\-*/%&|^!~?:=.])'
+    r'|(?P<Unknown>.)'
+)
+_REGEX = r'|(?P<RegularExpression>/(?:[^\\/\[\n\r]|\\.|\[(?:[^\]\\\n\r]|\\.)*\])+/[A-Za-z]*)'
+# Lexers used where a slash starts a regular expression or is division.
+_REGEX_LEXER = re.compile(r'\s*(?:' + _TOKEN.format(regex=_REGEX) + ')', re.S)
+_DIVISION_LEXER = re.compile(r'\s*(?:' + _TOKEN.format(regex='') + ')', re.S)
+_TEMPLATE = re.compile(r'(?:[^`\\$]|\\[\s\S]|\$(?!\{))*(?:`|\$\{)?')
+# Tokens after which a slash is division (see tokenize).
+_OPERANDS = frozenset(['Identifier', 'Numeric', 'String', 'Boolean', 'Null',
+                       'RegularExpression', 'Template'])
+
+
+def tokenize(js):
+    """Tokenizes JavaScript with a compiled regex.
+
+    Tokens are typed like esprima tokens. A slash after an operand, ')', or
+    ']' is division, otherwise it starts a regular expression (esprima
+    also considers the tokens that precede parentheses and braces).
+
+    Args:
+        js: JavaScript (string).
+    Returns:
+        Generator of (type, value) tuples.
+    """
+    pos = 0
+    regex_allowed = True
+    # Open braces, True for template substitutions (${ ... }).
+    braces = []
+    while True:
+        match = (_REGEX_LEXER if regex_allowed else _DIVISION_LEXER).match(js, pos)
+        if match is None:
+            return
+        kind = match.lastgroup
+        value = match.group(kind)
+        pos = match.end()
+
+        if kind in ('LineComment', 'BlockComment'):
+            yield kind, value[2:-2] if kind == 'BlockComment' and value.endswith('*/') else value[2:]
+            continue
+        if kind == 'Unknown':
+            continue
+
+        if kind == 'Template' or (kind == 'Punctuator' and value == '}' and braces and braces[-1]):
+            if kind == 'Punctuator':
+                braces.pop()
+            template = _TEMPLATE.match(js, pos)
+            value += template.group()
+            pos = template.end()
+            kind = 'Template'
+            if value.endswith('${'):
+                braces.append(True)
+                regex_allowed = True
+                yield kind, value
+                continue
+        elif kind == 'Name':
+            if value in KEYWORDS:
+                kind = 'Keyword'
+            elif value in ('true', 'false'):
+                kind = 'Boolean'
+            elif value == 'null':
+                kind = 'Null'
+            else:
+                kind = 'Identifier'
+        elif kind == 'Punctuator':
+            if value == '{':
+                braces.append(False)
+            elif value == '}' and braces:
+                braces.pop()
+
+        if kind == 'Keyword':
+            regex_allowed = value not in ('this', 'super')
+        elif kind == 'Punctuator':
+            regex_allowed = value not in (')', ']')
+        else:
+            regex_allowed = kind not in _OPERANDS
+        yield kind, value
+
 
 class ScanJavascript(strelka.Scanner):
     """Collects metadata from JavaScript files.
@@ -11,9 +108,18 @@ class ScanJavascript(strelka.Scanner):
         beautify: Boolean that determines if JavaScript should be
             deobfuscated.
             Defaults to True.
+        max_beautify_size: Maximum size (in characters) of JavaScript that
+            is beautified. Larger scripts are tokenized as is.
+            Defaults to 262144 (256 KB).
+        lexer_size: Size (in characters) of JavaScript at or above which
+            it is tokenized with a compiled-regex lexer instead of esprima.
+            If this value is 0, then the lexer is always used.
+            Defaults to 262144 (256 KB).
     """
     def scan(self, data, file, options, expire_at):
         beautify = options.get('beautify', True)
+        max_beautify_size = options.get('max_beautify_size', 256 * 1024)
+        lexer_size = options.get('lexer_size', 256 * 1024)
 
         self.event.setdefault('tokens', [])
         self.event.setdefault('keywords', [])
@@ -23,37 +129,51 @@ class ScanJavascript(strelka.Scanner):
         self.event['beautified'] = False
 
         js = None
+        text = file.artifacts.get('text.utf8')
 
         try:
-            if beautify:
-                js = jsbeautifier.beautify(data.decode())
+            if beautify and len(text) <= max_beautify_size:
+                js = jsbeautifier.beautify(text)
                 self.event['beautified'] = True
         except:  # noqa
             self.flags.append('beautify_failed')
 
         if js is None:
-            js = data.decode()
-
-        tokens = esprima.tokenize(
-            js,
-            options={
-                'comment': True,
-                'tolerant': True,
-            }
-        )
-        for t in tokens:
-            if t.type not in self.event['tokens']:
-                self.event['tokens'].append(t.type)
-            if t.type == 'String':
-                stripped_val = t.value.strip('"\'')
-                if stripped_val not in self.event['strings']:
-                    self.event['strings'].append(stripped_val)
-            if t.type == 'Keyword':
-                if t.value not in self.event['keywords']:
-                    self.event['keywords'].append(t.value)
-            if t.type == 'Identifier':
-                if t.value not in self.event['identifiers']:
-                    self.event['identifiers'].append(t.value)
-            if t.type == 'RegularExpression':
-                if t.value not in self.event['regular_expressions']:
-                    self.event['regular_expressions'].append(t.value)
+            js = text
+
+        if len(js) >= lexer_size:
+            tokens = tokenize(js)
+        else:
+            tokens = (
+                (t.type, t.value)
+                for t in esprima.tokenize(
+                    js,
+                    options={
+                        'comment': True,
+                        'tolerant': True,
+                    }
+                )
+            )
+
+        # Dictionaries deduplicate values and preserve their order.
+        types = {}
+        keywords = {}
+        strings = {}
+        identifiers = {}
+        regular_expressions = {}
+        for (token_type, value) in tokens:
+            types.setdefault(token_type)
+            if token_type == 'String':
+                strings.setdefault(value.strip('"\''))
+            elif token_type == 'Keyword':
+                keywords.setdefault(value)
+            elif token_type == 'Identifier':
+                identifiers.setdefault(value)
+            elif token_type == 'RegularExpression':
+                regular_expressions.setdefault(value)
+
+        self.event['tokens'] = list(types)
+        self.event['keywords'] = list(keywords)
+        self.event['strings'] = list(strings)
+        self.event['identifiers'] = list(identifiers)
+        self.event['regular_expressions'] = list(regular_expressions)
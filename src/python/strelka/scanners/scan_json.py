@@ -9,7 +9,7 @@ class ScanJson(strelka.Scanner):
         self.event.setdefault('keys', [])
 
         try:
-            self._get_keys(self, json.loads(data.decode()))
+            self._get_keys(self, json.loads(file.artifacts.get('text.utf8')))
 
         except UnicodeDecodeError:
             self.flags.append('unicode_decode_error')
@@ -1,68 +1,189 @@
-import os
+import concurrent.futures
+import io
+import queue
 import subprocess
-import tempfile
 
-import fitz
+from PIL import Image
+
 from strelka import strelka
 
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+
+def _downscale(image, max_dimension):
+    """Returns a copy of image that fits in max_dimension, or the image."""
+    if max_dimension and max(image.size) > max_dimension:
+        image = image.copy()
+        image.thumbnail((max_dimension, max_dimension))
+    return image
+
+
+def _normalize(text):
+    """Strips trailing whitespace per line and converts line endings."""
+    return b'\n'.join([line.rstrip() for line in text.rstrip().splitlines()])
+
 
 class ScanOcr(strelka.Scanner):
     """Collects metadata and extracts optical text from image files.
 
+    Images are recognized by a pool of warm tesseract engines (tesserocr)
+    that keep their language models loaded between scans. If tesserocr is
+    not installed or the engine is 'cli', then images are piped to a
+    tesseract process. Neither engine writes temporary files.
+
     Options:
         extract_text: Boolean that determines if optical text should be
             extracted as a child file.
             Defaults to False.
-        tmp_directory: Location where tempfile writes temporary files.
-            Defaults to '/tmp/'.
+        pdf_to_png: Boolean that determines if pages of PDF files are
+            rendered and recognized.
+            Defaults to False.
+        pdf_pages: Maximum number of PDF pages that are recognized. If this
+            value is 0, then all pages are recognized. Files with more pages
+            are flagged with 'pages_truncated' only if this option is set.
+            Defaults to 1.
+        max_dimension: Maximum width or height (in pixels) of images;
+            larger images are downscaled before recognition. If this value
+            is 0, then images are not downscaled.
+            Defaults to 4096.
+        engine: Engine used to recognize text ('api' or 'cli').
+            Defaults to 'api'.
+        lang: Tesseract language(s) used to recognize text.
+            Defaults to 'eng'.
+        threads: Number of engines (and pages recognized concurrently).
+            Defaults to 1.
     """
 
+    def init(self):
+        self.apis = None
+        self.apis_key = None
+        self.pool = None
+        self.pool_threads = 0
+
     def scan(self, data, file, options, expire_at):
         extract_text = options.get('extract_text', False)
-        tmp_directory = options.get('tmp_directory', '/tmp/')
         pdf_to_png = options.get('pdf_to_png', False)
+        pdf_pages = options.get('pdf_pages')
+        max_dimension = options.get('max_dimension', 4096)
+        engine = options.get('engine', 'api')
+        lang = options.get('lang', 'eng')
+        threads = options.get('threads', 1)
 
         if pdf_to_png and 'application/pdf' in file.flavors.get('mime', []):
             # TODO: Use fitz builtin OCR support which also wraps tesseract
-            doc = fitz.open(stream=data, filetype='pdf')
-            data = doc.get_page_pixmap(0, dpi=150).tobytes('png')
-
-        with tempfile.NamedTemporaryFile(dir=tmp_directory) as tmp_data:
-            tmp_data.write(data)
-            tmp_data.flush()
-
-            with tempfile.NamedTemporaryFile(dir=tmp_directory) as tmp_tess:
-                tess_return = subprocess.call(
-                    ['tesseract', tmp_data.name, tmp_tess.name],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
+            # Pages rendered for ScanPdf are recognized from their pixels.
+            page_count = file.artifacts.get('pdf.document').page_count
+            if pdf_pages is None:
+                # Only the first page is recognized by default.
+                page_count = min(page_count, 1)
+            elif pdf_pages and page_count > pdf_pages:
+                page_count = pdf_pages
+                self.flags.append('pages_truncated')
+            # Pages are (image, data) tuples; rendered pages have no data.
+            pages = [(file.artifacts.get('pdf.image', i, 150), None) for i in range(page_count)]
+        else:
+            try:
+                image = Image.open(io.BytesIO(data))
+            except Exception:
+                # Tesseract may still read formats that PIL does not.
+                image = None
+            pages = [(image, data)]
+
+        if engine == 'api' and tesserocr is not None:
+            recognize = self._recognize_api
+            self._start_apis(lang, threads)
+        else:
+            recognize = self._recognize_cli
+
+        if len(pages) > 1 and threads > 1:
+            if self.pool_threads != threads:
+                if self.pool is not None:
+                    self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = concurrent.futures.ThreadPoolExecutor(threads)
+                self.pool_threads = threads
+            futures = [
+                self.pool.submit(recognize, *page, max_dimension, lang)
+                for page in pages
+            ]
+            try:
+                results = [future.result() for future in futures]
+            finally:
+                # Pages that are still queued when scanning stops early
+                # (e.g. when the scanner times out) are not recognized and
+                # pages that are still running are ignored.
+                cancelled = [future.cancel() for future in futures]
+                if any(cancelled):
+                    self.flags.append('pages_truncated')
+                for future in futures:
+                    if future.done() and not future.cancelled() and future.exception() is None:
+                        self.flags.extend(future.result()[1])
+        else:
+            results = [recognize(*page, max_dimension, lang) for page in pages]
+            for (_, flags) in results:
+                self.flags.extend(flags)
+        texts = [text for (text, _) in results]
+
+        ocr_file = b'\n'.join(text for text in map(_normalize, texts) if text)
+        if ocr_file:
+            self.event['raw'] = ocr_file
+
+            if extract_text:
+                extract_file = strelka.File(
+                    name='text',
+                    source=self.name,
                 )
-                tess_txt_name = f'{tmp_tess.name}.txt'
-                if tess_return == 0:
-                    with open(tess_txt_name, 'rb') as tess_txt:
-                        ocr_file = tess_txt.read().rstrip()
-
-                        # Convert line endings and strip trailing whitespace per line
-                        ocr_file = b'\n'.join([line.rstrip() for line in ocr_file.splitlines()])
-
-                        if ocr_file:
-                            self.event['raw'] = ocr_file
-
-                            if extract_text:
-                                extract_file = strelka.File(
-                                    name='text',
-                                    source=self.name,
-                                )
-
-                                for c in strelka.chunk_string(ocr_file):
-                                    self.upload_to_coordinator(
-                                        extract_file.pointer,
-                                        c,
-                                        expire_at,
-                                    )
-
-                                self.files.append(extract_file)
-
-                else:
-                    self.flags.append(f'return_code_{tess_return}')
-                os.remove(tess_txt_name)
+
+                for c in strelka.chunk_string(ocr_file):
+                    self.upload_to_coordinator(
+                        extract_file.pointer,
+                        c,
+                        expire_at,
+                    )
+
+                self.files.append(extract_file)
+
+    def _start_apis(self, lang, threads):
+        """Starts the pool of tesseract engines if needed."""
+        if self.apis is not None and self.apis_key == (lang, threads):
+            return
+        if self.apis is not None:
+            while not self.apis.empty():
+                self.apis.get().End()
+        self.apis = queue.Queue()
+        for _ in range(threads):
+            self.apis.put(tesserocr.PyTessBaseAPI(lang=lang))
+        self.apis_key = (lang, threads)
+
+    def _recognize_api(self, image, data, max_dimension, lang):
+        """Returns the text and flags of an image."""
+        if image is None:
+            return (b'', ['unidentified_image'])
+        api = self.apis.get()
+        try:
+            api.SetImage(_downscale(image, max_dimension))
+            return (api.GetUTF8Text().encode(), [])
+        finally:
+            api.Clear()
+            self.apis.put(api)
+
+    def _recognize_cli(self, image, data, max_dimension, lang):
+        """Returns the text and flags of an image."""
+        # File data is piped as is unless it is a rendered page or too large.
+        if data is None or (image is not None and max_dimension
+                            and max(image.size) > max_dimension):
+            with io.BytesIO() as f:
+                _downscale(image, max_dimension).convert('RGB').save(f, format='PPM')
+                data = f.getvalue()
+
+        tess = subprocess.run(
+            ['tesseract', 'stdin', 'stdout', '-l', lang],
+            input=data,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        if tess.returncode != 0:
+            return (b'', [f'return_code_{tess.returncode}'])
+        return (tess.stdout, [])
@@ -1,6 +1,5 @@
 import re
 
-import olefile
 import oletools
 import sys
 
@@ -13,50 +12,52 @@ class ScanOle(strelka.Scanner):
         self.event['total'] = {'streams': 0, 'extracted': 0}
 
         try:
-            with olefile.OleFileIO(data) as ole:
-                ole_streams = ole.listdir(streams=True)
-                self.event['total']['streams'] = len(ole_streams)
-                for stream in ole_streams:
-                    file = ole.openstream(stream)
-                    extract_data = file.read()
-                    extract_name = f'{"_".join(stream)}'
-                    extract_name = re.sub(r'[\x00-\x1F]', '', extract_name)
-                    if extract_name.endswith('Ole10Native'):
-                        native_stream = oletools.oleobj.OleNativeStream(
-                            bindata=extract_data,
-                        )
-                        if native_stream.filename:
-                            extract_name = extract_name + f'_{str(native_stream.filename)}'
-                        else:
-                            extract_name = extract_name + '_native_data'
+            # The container is shared with other scanners through the
+            # file's artifacts and must not be closed here.
+            ole = file.artifacts.get('ole.container')
+            ole_streams = ole.listdir(streams=True)
+            self.event['total']['streams'] = len(ole_streams)
+            for stream in ole_streams:
+                file = ole.openstream(stream)
+                extract_data = file.read()
+                extract_name = f'{"_".join(stream)}'
+                extract_name = re.sub(r'[\x00-\x1F]', '', extract_name)
+                if extract_name.endswith('Ole10Native'):
+                    native_stream = oletools.oleobj.OleNativeStream(
+                        bindata=extract_data,
+                    )
+                    if native_stream.filename:
+                        extract_name = extract_name + f'_{str(native_stream.filename)}'
+                    else:
+                        extract_name = extract_name + '_native_data'
+
+                    extract_file = strelka.File(
+                        name=extract_name,
+                        source=self.name,
+                    )
 
-                        extract_file = strelka.File(
-                            name=extract_name,
-                            source=self.name,
+                    for c in strelka.chunk_string(native_stream.data):
+                        self.upload_to_coordinator(
+                            extract_file.pointer,
+                            c,
+                            expire_at,
                         )
 
-                        for c in strelka.chunk_string(native_stream.data):
-                            self.upload_to_coordinator(
-                                extract_file.pointer,
-                                c,
-                                expire_at,
-                            )
+                else:
+                    extract_file = strelka.File(
+                        name=extract_name,
+                        source=self.name,
+                    )
 
-                    else:
-                        extract_file = strelka.File(
-                            name=extract_name,
-                            source=self.name,
+                    for c in strelka.chunk_string(extract_data):
+                        self.upload_to_coordinator(
+                            extract_file.pointer,
+                            c,
+                            expire_at,
                         )
 
-                        for c in strelka.chunk_string(extract_data):
-                            self.upload_to_coordinator(
-                                extract_file.pointer,
-                                c,
-                                expire_at,
-                            )
-
-                    self.files.append(extract_file)
-                    self.event['total']['extracted'] += 1
+                self.files.append(extract_file)
+                self.event['total']['extracted'] += 1
 
         except OSError:
             type, value, traceback = sys.exc_info()
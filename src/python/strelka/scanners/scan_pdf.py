@@ -1,176 +1,335 @@
-import io
+import concurrent.futures
+import contextlib
+import hashlib
+import multiprocessing
 import re
-import sys
+import tempfile
 import traceback
+from concurrent.futures.process import BrokenProcessPool
 
 import fitz
 
 from strelka import strelka
 
+# Documents opened by pool workers, keyed by path (see _open).
+_documents = {}
+
+
+def _open(path):
+    """Opens the shared copy of a document in a pool worker.
+
+    A worker processes several ranges of the same document, so the last
+    document it opened is kept open.
+    """
+    doc = _documents.get(path)
+    if doc is None:
+        fitz.TOOLS.mupdf_display_errors(False)
+        _documents.clear()
+        doc = _documents[path] = fitz.open(path, filetype='pdf')
+    return doc
+
+
+def _run(path, func, start, stop, option):
+    """Runs func over a range of a shared document in a pool worker."""
+    return func(_open(path), start, stop, option)
+
+
+def _scan_xrefs(doc, start, stop, extract_objects):
+    """Collects flags, URLs, and objects from a range of xrefs.
+
+    Returns:
+        List of (flags, URLs, stream, image) tuples, one per xref. Streams
+        and images are None if the xref is not one or objects are not
+        extracted.
+    """
+    results = []
+    for xref in range(start, stop):
+        flags = []
+        # PDF Annotation Flags
+        xref_object = doc.xref_object(xref, compressed=False)
+        if any(obj in xref_object for obj in ["/AA", "/OpenAction"]):
+            flags.append("auto_action")
+        if any(obj in xref_object for obj in ["/JS", "/JavaScript"]):
+            flags.append("javascript_embedded")
+
+        # Extract URLs from xref object content using regex
+        urls = re.findall(r"https?://[^\s)>]+", xref_object)
+
+        stream = None
+        image = None
+        if extract_objects:
+            # PDF Object Resubmission
+            # If xref is a stream, add that object back into the analysis pipeline
+            if doc.xref_is_stream(xref):
+                try:
+                    stream = doc.xref_stream(xref)
+                except Exception:
+                    traceback.print_exc()
+                    flags.append("stream_read_exception")
+
+            # Older PyMuPDF versions return a false value for objects that
+            # are not images, newer versions raise ValueError.
+            try:
+                as_image = doc.extract_image(xref)
+            except ValueError:
+                as_image = None
+            if as_image:
+                image = as_image["image"]
+
+        results.append((flags, urls, stream, image))
+    return results
+
+
+def _scan_pages(doc, start, stop, extract_text):
+    """Collects link URIs and text from a range of pages.
+
+    Returns:
+        List of (URIs, text) tuples, one per page. Text is empty if it is
+        not extracted.
+    """
+    results = []
+    for number in range(start, stop):
+        page = doc.load_page(number)
+        # PDF Link Extraction
+        uris = [link["uri"] for link in page.get_links() if "uri" in link]
+        results.append((uris, page.get_text() if extract_text else ""))
+    return results
+
 
 class ScanPdf(strelka.Scanner):
     """Collects metadata and extracts files from PDF files.
 
+    Xrefs and pages are processed in ranges. Large documents can be
+    processed in a pool of worker processes, each of which opens a shared
+    temporary copy of the document; results are collected in document
+    order, so events do not depend on the number of processes.
+
     Options:
         extract_text: Boolean that determines if document text should be
-            extracted as a child file.
+            extracted as a child file. Text is uploaded as pages are
+            processed.
             Defaults to False.
         limit: Maximum number of files to extract.
             Defaults to 2000.
+        max_duplicates: Maximum number of duplicate files that are listed.
+            All duplicates are counted.
+            Defaults to 100.
+        max_xrefs: Maximum number of xrefs that are processed. If this
+            value is 0, then all xrefs are processed.
+            Defaults to 100000.
+        max_pages: Maximum number of pages that are processed. If this
+            value is 0, then all pages are processed.
+            Defaults to 2000.
+        processes: Number of worker processes that process documents with
+            more than one range of xrefs or pages. If this value is 0, then
+            documents are processed in the scanner's process.
+            Defaults to 0.
+        range_size: Number of xrefs or pages in each range.
+            Defaults to 250.
+        tmp_directory: Location where the shared copy of documents is
+            written for worker processes.
+            Defaults to '/tmp/'.
     """
     def init(self):
         fitz.TOOLS.mupdf_display_errors(False)
+        self.pool = None
+        self.pool_processes = 0
 
     def scan(self, data, file, options, expire_at):
         extract_text = options.get("extract_text", False)
         file_limit = options.get("limit", 2000)
+        max_xrefs = options.get("max_xrefs", 100000)
+        max_pages = options.get("max_pages", 2000)
+        self.max_duplicates = options.get("max_duplicates", 100)
+        processes = options.get("processes", 0)
+        range_size = options.get("range_size", 250)
+        tmp_directory = options.get("tmp_directory", "/tmp/")
 
-        self.event["total"] = {"objects": 0, "extracted": 0}
-        extracted_objects = set()
+        self.event["total"] = {"objects": 0, "extracted": 0, "duplicates": 0}
+        self.event["duplicates"] = []
+        # Names of extracted files, keyed by the digest of their data
+        self.extracted = {}
 
         pdf_to_png = options.get('pdf_to_png', False)
 
         try:
             if pdf_to_png:
-                doc = fitz.open(stream=data, filetype='pdf')
+                # The document and rendered pages are shared with other
+                # scanners (e.g. ScanQr and ScanOcr render page 0 at 150 dpi).
+                doc = file.artifacts.get('pdf.document')
 
                 for i in range(0, min(3, doc.page_count)):
-                    png_data = doc.get_page_pixmap(i, dpi=150).tobytes('png')
-
-                    extract_file = strelka.File(
-                        name=f"pdf_2_png_{i}",
-                        source=self.name,
-                    )
-                    for c in strelka.chunk_string(png_data):
-                        self.upload_to_coordinator(
-                            extract_file.pointer,
-                            c,
-                            expire_at,
-                        )
-
-                    self.files.append(extract_file)
-                    self.event['total']['extracted'] += 1
+                    png_data = file.artifacts.get('pdf.pixmap', i, 150).tobytes('png')
+                    self._extract(f"pdf_2_png_{i}", png_data, expire_at)
         except:
             self.flags.append('pdf_2_png_error')
 
         try:
-            with io.BytesIO(data) as pdf_io:
+            pdf_reader = file.artifacts.get('pdf.document')
 
-                # Open file as with PyMuPDF as file object
-                pdf_reader = fitz.open(stream=pdf_io, filetype="pdf")
+            no_object_extraction = options.get('no_object_extraction', False)
 
-                no_object_extraction = options.get('no_object_extraction', False)
+            # Get length of xrefs to be used in xref / annotation iteration
+            xreflen = pdf_reader.xref_length()
+            xref_stop = xreflen
+            if max_xrefs and xreflen - 1 > max_xrefs:
+                xref_stop = max_xrefs + 1
+                self.flags.append("xrefs_truncated")
+            page_stop = pdf_reader.page_count
+            if max_pages and page_stop > max_pages:
+                page_stop = max_pages
+                self.flags.append("pages_truncated")
 
-                # Get length of xrefs to be used in xref / annotation iteration
-                xreflen = pdf_reader.xref_length()
+            # Initialize annotated_uris array for URL collection
+            self.event.setdefault("annotated_uris", [])
 
-                # Initialize annotated_uris array for URL collection
-                self.event.setdefault("annotated_uris", [])
+            with contextlib.ExitStack() as stack:
+                path = None
+                if processes > 0 and max(xref_stop - 1, page_stop) > range_size:
+                    tmp_data = stack.enter_context(
+                        tempfile.NamedTemporaryFile(dir=tmp_directory)
+                    )
+                    tmp_data.write(data)
+                    tmp_data.flush()
+                    path = tmp_data.name
+                    self._start_pool(processes)
 
                 # Iterate through xrefs and collect annotations
-                i = 0
-                for xref in range(1, xreflen):
-                    # PDF Annotation Flags
-                    xref_object = pdf_reader.xref_object(i, compressed=False)
-                    if any(obj in xref_object for obj in ["/AA", "/OpenAction"]):
-                        self.flags.append("auto_action")
-                    if any(obj in xref_object for obj in ["/JS", "/JavaScript"]):
-                        self.flags.append("javascript_embedded")
-
-                    # Extract URLs from xref object content using regex
-                    urls_in_xref = re.findall(r"https?://[^\s)>]+", xref_object)
-                    if urls_in_xref:
+                xrefs = self._ranges(
+                    _scan_xrefs, pdf_reader, path, 1, xref_stop, range_size,
+                    not no_object_extraction,
+                )
+                for (xref, (flags, urls, stream, image)) in enumerate(xrefs, 1):
+                    self.flags.extend(flags)
+                    if urls:
                         # TODO: return these into it's own array
                         #    these urls aren't technically "annotated", but we're using this annotated_uris
                         #    because it enables a quick for these URL be output
-                        self.event["annotated_uris"].extend(urls_in_xref)
-
-                    # Skip object extraction if disabled
-                    if no_object_extraction:
-                        i += 1
-                        continue
-
-                    # PDF Object Resubmission
-                    # If xref is a stream, add that object back into the analysis pipeline
-                    if pdf_reader.xref_is_stream(xref):
-                        try:
-                            if xref not in extracted_objects:
-                                extract_file = strelka.File(
-                                    name=f"object_{xref}",
-                                    source=self.name,
-                                )
-
-                                for c in strelka.chunk_string(pdf_reader.xref_stream(xref)):
-                                    self.upload_to_coordinator(
-                                        extract_file.pointer,
-                                        c,
-                                        expire_at,
-                                    )
-
-                                self.files.append(extract_file)
-                                self.event["total"]["extracted"] += 1
-                                extracted_objects.add(xref)
-
-                        except Exception:
-                            traceback.print_exc()
-                            self.flags.append("stream_read_exception")
-
-                    as_image = pdf_reader.extract_image(xref)
-                    if as_image is not None and as_image is not False:
-                        extract_file = strelka.File(
-                            name=f"object_{xref}",
-                            source=self.name,
-                        )
-                        for c in strelka.chunk_string(as_image["image"]):
-                            self.upload_to_coordinator(
-                                extract_file.pointer,
-                                c,
-                                expire_at,
-                            )
+                        self.event["annotated_uris"].extend(urls)
 
-                        self.files.append(extract_file)
-                        self.event['total']['extracted'] += 1
-                    i += 1
+                    if stream is not None:
+                        self._extract(f"object_{xref}", stream, expire_at)
+                    if image is not None:
+                        self._extract(f"object_{xref}_image", image, expire_at)
 
                 # Iterate through pages and collect links and text
-                if extract_text:
-                    extracted_text = ""
-
                 try:
-                    for page in pdf_reader:
-                        # PDF Link Extraction
-                        links = page.get_links()
-                        if links:
-                            for link in links:
-                                if "uri" in link:
-                                    self.event["annotated_uris"].append(link["uri"])
-                        if extract_text and hasattr(page, "getText"):
-                            extracted_text += page.getText()
-                        if extract_text and hasattr(page, "get_text"):
-                            extracted_text += page.get_text()
-
-                    # PDF Text Extraction
-                    # Caution: Will increase time and object storage size
                     if extract_text:
                         extract_file = strelka.File(
                             name="text",
                             source=self.name,
                         )
-                        for c in strelka.chunk_string(extracted_text):
-                            self.upload_to_coordinator(
-                                extract_file.pointer,
-                                c,
-                                expire_at,
-                            )
+                        # The file is listed before its first batch is
+                        # uploaded, so uploaded text is scanned even if
+                        # the scanner times out.
                         self.files.append(extract_file)
+                        # Text is uploaded in batches of pages
+                        # Caution: Will increase time and object storage size
+                        pending = []
+                        pending_size = 0
+
+                    pages = self._ranges(
+                        _scan_pages, pdf_reader, path, 0, page_stop, range_size,
+                        extract_text,
+                    )
+                    for (uris, text) in pages:
+                        self.event["annotated_uris"].extend(uris)
+                        if extract_text and text:
+                            pending.append(text)
+                            pending_size += len(text)
+                            if pending_size >= 1024 * 1024:
+                                self._upload(extract_file, "".join(pending), expire_at)
+                                pending = []
+                                pending_size = 0
+
+                    # PDF Text Extraction
+                    if extract_text:
+                        self._upload(extract_file, "".join(pending), expire_at)
                         self.flags.append("extracted_text")
+                except BrokenProcessPool:
+                    raise
                 except Exception:
                     traceback.print_exc()
                     self.flags.append("page_parsing_failure")
 
-                # Deduplicate and clean annotated URIs array
-                if "annotated_uris" in self.event:
-                    self.event["annotated_uris"] = list(set(filter(None, self.event["annotated_uris"])))
+            # Deduplicate and clean annotated URIs array
+            if "annotated_uris" in self.event:
+                self.event["annotated_uris"] = list(set(filter(None, self.event["annotated_uris"])))
+        except BrokenProcessPool:
+            # A worker exited (e.g. MuPDF crashed); the pool is replaced
+            # on the next scan.
+            self.pool = None
+            self.flags.append("pool_error")
         except Exception:
             traceback.print_exc()
             self.flags.append("pdf_load_error")
+
+    def _start_pool(self, processes):
+        """Starts the pool of worker processes if needed."""
+        if self.pool is not None and self.pool_processes == processes:
+            return
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        # Workers are spawned because the scanner's process may be running
+        # threads (e.g. the YARA rule watcher).
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            processes,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+        self.pool_processes = processes
+
+    def _ranges(self, func, doc, path, start, stop, range_size, option):
+        """Yields the results of func over ranges of items, in order.
+
+        If path is set, then ranges are submitted to the pool of worker
+        processes; pending ranges are cancelled if scanning stops early
+        (e.g. when the scanner times out).
+        """
+        ranges = [(i, min(i + range_size, stop)) for i in range(start, stop, range_size)]
+        if path is None:
+            for (i, j) in ranges:
+                yield from func(doc, i, j, option)
+            return
+
+        futures = [self.pool.submit(_run, path, func, i, j, option) for (i, j) in ranges]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _extract(self, name, data, expire_at):
+        """Extracts data as a child file.
+
+        Data that was already extracted from the document (e.g. an image
+        reused across pages, or an image stream that is also extracted as
+        an image) is not extracted again; a reference to the first file is
+        recorded instead.
+        """
+        digest = hashlib.sha256(data).digest()
+        original = self.extracted.get(digest)
+        if original is not None:
+            if self.event["total"]["duplicates"] < self.max_duplicates:
+                self.event["duplicates"].append({"name": name, "duplicate_of": original})
+            elif self.event["total"]["duplicates"] == self.max_duplicates:
+                self.flags.append("duplicates_truncated")
+            self.event["total"]["duplicates"] += 1
+            return
+        self.extracted[digest] = name
+
+        extract_file = strelka.File(
+            name=name,
+            source=self.name,
+        )
+        self._upload(extract_file, data, expire_at)
+        self.files.append(extract_file)
+        self.event["total"]["extracted"] += 1
+
+    def _upload(self, extract_file, data, expire_at):
+        for c in strelka.chunk_string(data):
+            self.upload_to_coordinator(
+                extract_file.pointer,
+                c,
+                expire_at,
+            )
@@ -1,10 +1,13 @@
+import concurrent.futures
 import io
+import itertools
 import re
+import threading
+import time
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterator, Optional
 
 import cv2
-import fitz
 import numpy as np
 from numpy.typing import NDArray
 from PIL import Image
@@ -20,6 +23,16 @@ ASPECT_RATIO_LOWER_BOUND = 0.75
 ASPECT_RATIO_UPPER_BOUND = 1.33
 ASPECT_RATIO_MAX_NORMALISED_DIM = 1024
 
+# Finder patterns smaller than this many pixels are found at higher levels
+# of the pyramid, if at all.
+_FINDER_MIN_AREA = 60
+_FINDER_MAX_CANDIDATES = 64
+_PREFILTER_MAX_DIM = 4096
+_PREFILTER_MIN_DIM = 128
+
+# The WeChat detector is not safe to share between threads.
+_WECHAT_LOCK = threading.Lock()
+
 
 def _zxing_decode(arr: NDArray[Any]) -> set[str]:
     results = zxingcpp.read_barcodes(arr, formats=_ZXING_FORMATS, try_rotate=True)
@@ -27,24 +40,131 @@ def _zxing_decode(arr: NDArray[Any]) -> set[str]:
 
 
 def _wechat_decode(bgr: NDArray[Any], detector: cv2.wechat_qrcode.WeChatQRCode) -> set[str]:
-    texts, _ = detector.detectAndDecode(bgr)
+    with _WECHAT_LOCK:
+        texts, _ = detector.detectAndDecode(bgr)
     return {t for t in texts if t}
 
 
-def _preprocess_variants(bgr: NDArray[Any]) -> list[NDArray[Any]]:
-    variants: list[NDArray[Any]] = []
+def _finder_candidates(binary: NDArray[Any]) -> tuple[NDArray[Any], NDArray[Any]]:
+    """Finds finder pattern candidates, square rings around a square core.
 
-    variants.extend(cv2.split(bgr))
+    A finder pattern is a dark 7x7 module square around a light 5x5 ring
+    around a dark 3x3 core, so its outer contour has a hole with exactly
+    one contour inside. The areas of the three contours are in the
+    ratio 49:25:9 (loosely, to allow for blur), the pattern fills its
+    bounding rectangle, and the core sits at the pattern's center. Noise,
+    text, and checkerboards rarely nest contours this way.
+
+    Returns:
+        Centers (x, y) and widths of candidates.
+    """
+    (contours, hierarchy) = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    centers = []
+    widths = []
+    if hierarchy is None:
+        return np.zeros((0, 2)), np.zeros(0)
+    # Each entry is (next, previous, first child, parent).
+    hierarchy = hierarchy[0]
+    for (i, contour) in enumerate(contours):
+        hole = hierarchy[i][2]
+        if hole < 0:
+            continue
+        core = hierarchy[hole][2]
+        if core < 0 or hierarchy[core][0] >= 0:
+            continue
+        outer_area = cv2.contourArea(contour)
+        if outer_area < _FINDER_MIN_AREA:
+            continue
+        hole_area = cv2.contourArea(contours[hole])
+        core_area = cv2.contourArea(contours[core])
+        if not (hole_area > 0 and core_area > 0
+                and 1.4 < outer_area / hole_area < 3
+                and 3 < outer_area / core_area < 10):
+            continue
+        (_, (w, h), _) = cv2.minAreaRect(contour)
+        if outer_area < 0.8 * w * h or max(w, h) > 1.5 * min(w, h):
+            continue
+        outer_moments = cv2.moments(contour)
+        core_moments = cv2.moments(contours[core])
+        center = np.array([outer_moments['m10'], outer_moments['m01']]) / outer_moments['m00']
+        core_center = np.array([core_moments['m10'], core_moments['m01']]) / core_moments['m00']
+        width = np.sqrt(outer_area)
+        if np.hypot(*(center - core_center)) > 0.15 * width:
+            continue
+        centers.append(center)
+        widths.append(width)
+    return np.array(centers).reshape(-1, 2), np.array(widths)
+
+
+def _finder_triangle(centers: NDArray[Any], widths: NDArray[Any]) -> bool:
+    """Checks if three candidates are placed like a QR code's finder patterns.
+
+    Finder patterns of similar size sit at the corners of a right isosceles
+    triangle (loosely, to allow for perspective) without overlapping.
+    Patterns are at least two widths apart, but widths measured across
+    rotated codes are up to sqrt(2) times larger, so the spacing is only
+    checked loosely. Images with few or many candidates (e.g. repeated
+    patterns) do not match.
+    """
+    if not 3 <= len(centers) <= _FINDER_MAX_CANDIDATES:
+        return False
+    triples = np.array(list(itertools.combinations(range(len(centers)), 3)))
+    points = centers[triples]
+    sizes = widths[triples]
+    sides = np.stack([
+        np.hypot(*(points[:, 1] - points[:, 2]).T),
+        np.hypot(*(points[:, 0] - points[:, 2]).T),
+        np.hypot(*(points[:, 0] - points[:, 1]).T),
+    ], axis=1)
+    sides.sort(axis=1)
+    (short, middle, long) = sides.T
+    found = (
+        (sizes.max(axis=1) < 1.5 * sizes.min(axis=1))
+        & (short >= 1.2 * sizes.max(axis=1))
+        & (short > 0.6 * middle)
+        & (np.abs(long ** 2 - short ** 2 - middle ** 2) < 0.3 * long ** 2)
+    )
+    return bool(found.any())
+
+
+def _qr_likely(gray: NDArray[Any]) -> bool:
+    """Checks if an image likely contains a QR code.
+
+    Finder patterns are searched for in both polarities on a pyramid of
+    the locally binarized image, halving it down to _PREFILTER_MIN_DIM.
+    The threshold window is small so that the rings of blurred finder
+    patterns with small modules are kept; patterns with large modules are
+    found at lower levels of the pyramid.
+    """
+    if max(gray.shape) > _PREFILTER_MAX_DIM:
+        scale = _PREFILTER_MAX_DIM / max(gray.shape)
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    while True:
+        binary = cv2.adaptiveThreshold(gray, 1, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                       cv2.THRESH_BINARY, 15, 2)
+        # Dark codes on a light background are the common case.
+        for polarity in (1 - binary, binary):
+            if _finder_triangle(*_finder_candidates(polarity)):
+                return True
+        if max(gray.shape) // 2 < _PREFILTER_MIN_DIM:
+            return False
+        gray = cv2.pyrDown(gray)
+
+
+def _preprocess_variants(bgr: NDArray[Any]) -> Iterator[NDArray[Any]]:
+    """Yields preprocessed variants of an image, computing each when needed."""
+    yield from cv2.split(bgr)
 
     gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
 
     clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    variants.append(clahe.apply(gray))
+    yield clahe.apply(gray)
 
     _, otsu = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    variants.append(otsu)
+    yield otsu
 
-    variants.append(255 - bgr)
+    yield 255 - bgr
 
     # Recover QR codes rendered with heavily squished proportions
     h, w = bgr.shape[:2]
@@ -52,13 +172,13 @@ def _preprocess_variants(bgr: NDArray[Any]) -> list[NDArray[Any]]:
     if aspect < ASPECT_RATIO_LOWER_BOUND or aspect > ASPECT_RATIO_UPPER_BOUND:
         sq = min(max(h, w), ASPECT_RATIO_MAX_NORMALISED_DIM)
         normalized = cv2.resize(bgr, (sq, sq), interpolation=cv2.INTER_LINEAR)
-        variants.append(normalized)
+        yield normalized
         if sq < 512:
-            variants.append(cv2.resize(normalized, (512, 512), interpolation=cv2.INTER_CUBIC))
+            yield cv2.resize(normalized, (512, 512), interpolation=cv2.INTER_CUBIC)
 
     if max(h, w) < 512:
         scale = 512 / max(h, w)
-        variants.append(cv2.resize(bgr, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC))
+        yield cv2.resize(bgr, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
 
     hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
     sat_mask = (hsv[:, :, 1] > 100).astype(np.uint8) * 255
@@ -68,45 +188,100 @@ def _preprocess_variants(bgr: NDArray[Any]) -> list[NDArray[Any]]:
         if bw * bh < 0.8 * h * w and min(bw, bh) > 50:
             pad = 10
             crop = bgr[max(0, by - pad) : by + bh + pad, max(0, bx - pad) : bx + bw + pad]
-            variants.extend(cv2.split(crop))
+            yield from cv2.split(crop)
 
-    return variants
 
+def _aspect_normal(bgr: NDArray[Any]) -> bool:
+    h, w = bgr.shape[:2]
+    return ASPECT_RATIO_LOWER_BOUND <= w / h <= ASPECT_RATIO_UPPER_BOUND
 
-def _decode_qr(img: Image.Image, detector: cv2.wechat_qrcode.WeChatQRCode) -> set[str]:
-    rgb = np.asarray(img.convert("RGB"), dtype=np.uint8)
 
-    results = _zxing_decode(rgb)
-    if results:
-        return results
+def _attempts(rgb: NDArray[Any], detector: cv2.wechat_qrcode.WeChatQRCode) -> Iterator[tuple[Callable, tuple]]:
+    """Yields decoding attempts (function and arguments), cheapest first."""
+    yield _zxing_decode, (rgb,)
 
     bgr = rgb[:, :, ::-1]
-
-    results = _wechat_decode(bgr, detector)
-    if results:
-        return results
+    yield _wechat_decode, (bgr, detector)
 
     for variant in _preprocess_variants(bgr):
         if variant.ndim == 2:
             variant = cv2.cvtColor(variant, cv2.COLOR_GRAY2BGR)
+        yield _zxing_decode, (variant,)
+        yield _wechat_decode, (variant, detector)
+
+
+def _decode_qr(
+    img: Image.Image,
+    detector: cv2.wechat_qrcode.WeChatQRCode,
+    prefilter: bool = True,
+    pool: Optional[concurrent.futures.Executor] = None,
+    window: int = 1,
+    deadline: Optional[float] = None,
+) -> set[str]:
+    """Decodes QR codes with a cascade of decoders and image variants.
+
+    If prefilter is set, then images that do not look like they contain a
+    QR code are skipped (images with unusual aspect ratios are always
+    decoded, as their codes may be squished). Attempts are generated lazily and, with a pool, up to window
+    attempts run concurrently; the result of the first successful attempt
+    in cascade order is returned.
+
+    Raises:
+        concurrent.futures.TimeoutError: the deadline passed before an
+            attempt succeeded.
+    """
+    rgb = np.asarray(img.convert("RGB"), dtype=np.uint8)
 
-        results = _zxing_decode(variant)
-        if results:
-            return results
-
-        results = _wechat_decode(variant, detector)
-        if results:
-            return results
-
-    return set()
+    if prefilter and _aspect_normal(rgb) and not _qr_likely(cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)):
+        return set()
+
+    attempts = _attempts(rgb, detector)
+    if pool is None:
+        for (func, args) in attempts:
+            if deadline is not None and time.time() > deadline:
+                raise concurrent.futures.TimeoutError
+            results = func(*args)
+            if results:
+                return results
+        return set()
+
+    # Attempts are submitted as earlier ones finish.
+    pending = [pool.submit(func, *args) for (func, args) in itertools.islice(attempts, window)]
+    try:
+        while pending:
+            timeout = None if deadline is None else max(0, deadline - time.time())
+            results = pending.pop(0).result(timeout=timeout)
+            if results:
+                return results
+            for (func, args) in itertools.islice(attempts, 1):
+                pending.append(pool.submit(func, *args))
+        return set()
+    finally:
+        for future in pending:
+            future.cancel()
 
 
 class ScanQr(strelka.Scanner):
     """
     Collects QR code metadata from image files.
+
+    Options:
+        pdf_to_png: Boolean that determines if the first page of PDF files
+            is decoded.
+            Defaults to False.
+        prefilter: Boolean that determines if images are only decoded when
+            they likely contain a QR code (finder patterns are found).
+            Defaults to True.
+        threads: Number of decoding attempts that run concurrently. If this
+            value is 0, then attempts run in the scanner's thread.
+            Defaults to 2.
+        budget: Maximum time (in seconds) spent decoding an image.
+            Defaults to 5.
     """
 
     def init(self):
+        self.pool = None
+        self.pool_threads = 0
         self.detector = cv2.wechat_qrcode.WeChatQRCode(
             str(_WECHAT_MODELS_DIR / "detect.prototxt"),
             str(_WECHAT_MODELS_DIR / "detect.caffemodel"),
@@ -116,14 +291,30 @@ class ScanQr(strelka.Scanner):
 
     def scan(self, data, file, options, expire_at):
         pdf_to_png = options.get('pdf_to_png', False)
+        prefilter = options.get('prefilter', True)
+        threads = options.get('threads', 2)
+        budget = options.get('budget', 5)
+
+        if threads and self.pool_threads != threads:
+            if self.pool is not None:
+                self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = concurrent.futures.ThreadPoolExecutor(threads)
+            self.pool_threads = threads
 
         try:
             if pdf_to_png and 'application/pdf' in file.flavors.get('mime', []):
-                doc = fitz.open(stream=data, filetype='pdf')
-                data = doc.get_page_pixmap(0, dpi=150).tobytes()
-
-            img = Image.open(io.BytesIO(data))
-            decoded = _decode_qr(img, self.detector)
+                # Pixels of the page rendered for ScanPdf are used directly.
+                img = file.artifacts.get('pdf.image', 0, 150)
+            else:
+                img = Image.open(io.BytesIO(data))
+            decoded = _decode_qr(
+                img,
+                self.detector,
+                prefilter=prefilter,
+                pool=self.pool if threads else None,
+                window=threads,
+                deadline=time.time() + budget,
+            )
 
             if not decoded:
                 return
@@ -144,5 +335,7 @@ class ScanQr(strelka.Scanner):
             else:
                 self.event['type'] = 'undefined'
 
+        except concurrent.futures.TimeoutError:
+            self.flags.append('budget_exceeded')
         except Exception:
             self.flags.append('general error')
@@ -1,76 +1,53 @@
 import re
 
+import numpy
+
 from strelka import strelka
 
+# Byte classes used to find and filter strings.
+PRINTABLE = numpy.zeros(256, dtype=bool)
+PRINTABLE[0x20:0x7F] = True
+CLASSES = numpy.zeros(256, dtype=numpy.uint8)
+CLASSES[ord('a'):ord('z') + 1] = 1
+CLASSES[ord('A'):ord('Z') + 1] = 1
+CLASSES[ord('0'):ord('9') + 1] = 2
+# Bytes that end both ASCII and UTF-16LE strings (not printable or NUL).
+SEPARATOR = ~PRINTABLE
+SEPARATOR[0] = False
+
+MIN_LENGTH = 4
+KEEP_LENGTH = 7
+CHUNK_SIZE = 1024 * 1024
+SEPARATOR_WINDOW = 64 * 1024
+
 
 class ScanStrings(strelka.Scanner):
     """Collects strings from files.
 
     Collects strings from files (similar to the output of the Unix 'strings'
-    utility).
+    utility). Strings are runs of at least four printable ASCII characters.
+    Unless the file is UTF-8 text (see enable_raw), short strings that look
+    like garbage (no run of three letters or digits, or closing brackets
+    before opening brackets) are discarded.
 
     Options:
         limit: Maximum number of strings to collect, starting from the
             beginning of the file. If this value is 0, then all strings are
             collected.
             Defaults to 0 (unlimited).
+        enable_raw: Boolean that determines if the file is decoded as UTF-8
+            and collected as 'raw'. UTF-8 files are not filtered.
+            Defaults to False.
+        wide: Boolean that determines if UTF-16LE strings are collected as
+            'wide_strings' (only supported by the numpy engine).
+            Defaults to False.
+        engine: Engine used to collect strings, 'numpy' (classifies bytes
+            with lookup tables and stops reading once limit is reached) or
+            'regex'.
+            Defaults to 'numpy'.
     """
     def init(self):
         self.strings_regex = re.compile(br'[^\x00-\x1F\x7F-\xFF]{4,}')
-        self.always_keep_regex = re.compile(r'0x|qr|/js', re.IGNORECASE)
-
-    def _has_class_run(self, s: str, n: int) -> bool:
-        prev = None
-        run = 0
-
-        for c in s:
-            if c.islower():
-                cls = "l"
-            elif c.isupper():
-                cls = "u"
-            elif c.isdigit():
-                cls = "d"
-            else:
-                cls = "o"
-
-            if cls == prev:
-                run += 1
-            else:
-                prev = cls
-                run = 1
-
-            # Any run of three consecutive lowercase, uppercase, or digits is sufficient
-            if cls != "o" and run >= n:
-                return True
-
-        return False
-
-    def _delimiters_in_order(self, s: str) -> bool:
-        seen = set()
-
-        for c in s:
-            if c in "([{":
-                seen.add(c)
-            elif c == ")" and "(" not in seen:
-                return False
-            elif c == "]" and "[" not in seen:
-                return False
-            elif c == "}" and "{" not in seen:
-                return False
-
-        return True
-
-    def _keep_string(self, s: str) -> bool:
-        if len(s) >= 7:
-            return True
-
-        if self.always_keep_regex.search(s):
-            return True
-
-        if not self._has_class_run(s, n=3):
-            return False
-
-        return self._delimiters_in_order(s)
 
     def _has_class_run(self, s: str, n: int) -> bool:
         prev = None
@@ -112,7 +89,7 @@ class ScanStrings(strelka.Scanner):
         return True
 
     def _keep_string(self, s: str) -> bool:
-        if len(s) >= 7:
+        if len(s) >= KEEP_LENGTH:
             return True
 
         if not self._has_class_run(s, n=3):
@@ -120,13 +97,121 @@ class ScanStrings(strelka.Scanner):
 
         return self._delimiters_in_order(s)
 
+    @staticmethod
+    def _runs(chars, mask, keep_all):
+        """Finds strings in an array of characters.
+
+        Args:
+            chars: Array of character codes (one per character).
+            mask: Boolean array of characters that may be part of a string.
+            keep_all: Boolean that determines if short strings are kept
+                without filtering (see _keep_string).
+        Returns:
+            Arrays of start and end indexes of strings.
+        """
+        edges = numpy.diff(mask.astype(numpy.int8), prepend=0, append=0)
+        run_starts = numpy.flatnonzero(edges == 1)
+        run_ends = numpy.flatnonzero(edges == -1)
+        lengths = run_ends - run_starts
+        long_enough = lengths >= MIN_LENGTH
+        (starts, ends, lengths) = (run_starts[long_enough],
+                                   run_ends[long_enough],
+                                   lengths[long_enough])
+        if keep_all or not len(starts):
+            return starts, ends
+
+        # Only strings shorter than KEEP_LENGTH are filtered. Their
+        # characters are gathered into a padded matrix (one row per string)
+        # so that every string is checked at once.
+        short = numpy.flatnonzero(lengths < KEEP_LENGTH)
+        columns = numpy.arange(KEEP_LENGTH - 1)
+        valid = columns < lengths[short, None]
+        index = numpy.minimum(starts[short, None] + columns, len(chars) - 1)
+        matrix = numpy.where(valid, chars[index], 0)
+
+        # A run of three letters or three digits.
+        classes = CLASSES[matrix]
+        has_run = ((classes[:, :-2] != 0)
+                   & (classes[:, :-2] == classes[:, 1:-1])
+                   & (classes[:, 1:-1] == classes[:, 2:])).any(axis=1)
+
+        # No closing bracket before the first matching opening bracket.
+        in_order = numpy.ones(len(short), dtype=bool)
+        for (opening, closing) in (b'()', b'[]', b'{}'):
+            opened = numpy.cumsum(matrix == opening, axis=1)
+            in_order &= ~((matrix == closing) & (opened == 0)).any(axis=1)
+
+        keep = numpy.ones(len(starts), dtype=bool)
+        keep[short] = has_run & in_order
+        return starts[keep], ends[keep]
+
+    def _collect(self, data, limit, keep_all, wide):
+        """Collects ASCII and UTF-16LE strings in chunks.
+
+        Chunks end after a byte that cannot be part of any string, so no
+        string spans two chunks. Collection stops once limit unique strings
+        of each kind were found.
+        """
+        strings = {}
+        wide_strings = {}
+        view = numpy.frombuffer(data, dtype=numpy.uint8)
+        offset = 0
+
+        while offset < len(view):
+            end = min(offset + CHUNK_SIZE, len(view))
+            while end < len(view):
+                window = view[end:end + SEPARATOR_WINDOW]
+                separators = numpy.flatnonzero(SEPARATOR[window])
+                if len(separators):
+                    end += int(separators[0]) + 1
+                    break
+                end += len(window)
+            chunk = view[offset:end]
+
+            if not limit or len(strings) < limit:
+                (starts, ends) = self._runs(chunk, PRINTABLE[chunk], keep_all)
+                for (s, e) in zip((starts + offset).tolist(), (ends + offset).tolist()):
+                    strings.setdefault(data[s:e].decode('ascii'), 0)
+                    if limit and len(strings) >= limit:
+                        break
+
+            if wide and (not limit or len(wide_strings) < limit):
+                found = []
+                for alignment in (0, 1):
+                    low = chunk[alignment::2]
+                    high = chunk[alignment + 1::2]
+                    low = low[:len(high)]
+                    (starts, ends) = self._runs(
+                        low,
+                        PRINTABLE[low] & (high == 0),
+                        keep_all,
+                    )
+                    found.extend(zip(
+                        (starts * 2 + offset + alignment).tolist(),
+                        (ends * 2 + offset + alignment).tolist(),
+                    ))
+                # Strings from both alignments are collected by offset.
+                for (s, e) in sorted(found):
+                    wide_strings.setdefault(data[s:e].decode('utf-16le'), 0)
+                    if limit and len(wide_strings) >= limit:
+                        break
+
+            if limit and len(strings) >= limit \
+                    and (not wide or len(wide_strings) >= limit):
+                break
+            offset = end
+
+        return list(strings), list(wide_strings)
+
     def scan(self, data, file, options, expire_at):
         limit = options.get('limit', 0)
         enable_raw = options.get('enable_raw', False)
+        wide = options.get('wide', False)
+        engine = options.get('engine', 'numpy')
         successful_decode = False
 
         if enable_raw:
-            try: 
+            try:
                 raw = data.decode("utf-8")
                 if isinstance(raw, str):
                     successful_decode = True
@@ -136,6 +221,18 @@ class ScanStrings(strelka.Scanner):
             except ValueError:
                 self.flags.append(f"value_error_{file.uid}")
 
+        if engine == 'numpy':
+            (strings, wide_strings) = self._collect(
+                data,
+                limit,
+                successful_decode,
+                wide,
+            )
+            self.event['strings'] = strings
+            if wide:
+                self.event['wide_strings'] = wide_strings
+            return
+
         # All strings are ASCII decodable per the regex, safe to decode.
         # Use a temporary dict to deduplicate while preserving order.
         strings = list({s.decode("ascii"): 0 for s in self.strings_regex.findall(data)})
@@ -1,7 +1,3 @@
-import copy
-from datetime import datetime
-import glob
-import hashlib
 import logging
 import math
 import os
@@ -9,7 +5,7 @@ import time
 
 import yara
 
-from strelka import strelka, yara_extern
+from strelka import rules, strelka, yara_extern
 
 def trace_scanner(scanner, msg, extra=None):
     if 'ENABLE_SCANNER_TRACE_LOGGING' in os.environ:
@@ -23,8 +19,9 @@ class ScanYara(strelka.Scanner):
     """Scans files with YARA.
 
     Attributes:
-        compiled_yara: Compiled YARA file derived from YARA rule file(s)
-            in location.
+        rule_sets: Dictionary of locations to their compiled YARA rules
+            (see strelka.rules). Rules are reloaded in the background when
+            the backend configuration sets "yara.reload_interval".
 
     Options:
         location: Location of the YARA rules file or directory.
@@ -32,9 +29,16 @@ class ScanYara(strelka.Scanner):
         meta: List of YARA rule meta identifiers
             (e.g. 'Author') that should be logged.
             Defaults to empty list.
+        merged: Boolean that determines if custom YARA rules are matched
+            together with the rules in location in a single pass, using
+            rules compiled by the backend during compile and sync.
+            Defaults to False.
+
+    Matches are tagged with their origin: 'base' for rules in location and
+    'custom' for custom YARA rules.
     """
     def init(self):
-        self.compiled_yara = None
+        self.rule_sets = {}
 
     def scan(self, data, file, options, expire_at):
         location = options.get('location', '/etc/yara/')
@@ -50,37 +54,38 @@ class ScanYara(strelka.Scanner):
             # custom yara was provided - use it to evaluate this file
             compiled_custom_yara_all = options['compiled_custom_yara_all']
 
+        # merged base and custom yara was provided - use it instead of
+        # matching the base and custom rules separately
+        compiled_merged_yara = options.get('compiled_merged_yara')
+
         # Support some common external variables (backcompat)
-        # The file and data extractions are not available with pre-compiled yara;
-        # in this case, all externals values will be an empty string
-        externals = copy.copy(yara_extern.EXTERNAL_VARS)
-        externals['filename'] = file.name
-        externals['file_name'] = file.name
-        extension = file.name.split('.')[-1]
-        if extension:
-            externals['extension'] = '.' + file.name.split('.')[-1]
-            externals['filetype'] = extension
-            externals['file_type'] = extension
-        externals['md5'] = hashlib.md5(data).hexdigest()
-        externals['sha1'] = hashlib.sha1(data).hexdigest()
-        externals['sha256'] = hashlib.sha256(data).hexdigest()
+        # Pre-compiled yara (custom and merged rules) receives them when matching
+        externals = yara_extern.file_externals(file)
+
+        # The backend may have matched the base rules while tasting the file
+        # (see Backend.taste_yara), in which case they are not matched again.
+        combined_matches = None
+        combined = file.artifacts.cached('yara.combined')
+        if combined is not None and combined[0] == location \
+                and compiled_merged_yara is None:
+            combined_matches = combined[1]
 
         try:
-            if self.compiled_yara is None and os.path.exists(location):
-                start_compilation_time = datetime.now()
-                if os.path.isdir(location):
-                    globbed_yara_paths = glob.iglob(f'{location}/**/*.yar*', recursive=True)
-                    yara_filepaths = {f'namespace_{i}':entry for (i, entry) in enumerate(globbed_yara_paths)}
-                    if yara_filepaths:
-                        self.compiled_yara = yara.compile(filepaths=yara_filepaths, externals=externals)
-                else:
-                    self.compiled_yara = yara.compile(filepath=location, externals=externals)
-                end_compilation_time = datetime.now()
-                compilation_time_ms = (end_compilation_time - start_compilation_time).total_seconds() * 1000
+            if combined_matches is None and compiled_merged_yara is None \
+                    and location not in self.rule_sets and os.path.exists(location):
+                yara_cfg = self.backend_cfg.get('yara') or {}
+                rule_set = rules.RuleSet(
+                    [(location, 'namespace')],
+                    externals=yara_extern.EXTERNAL_VARS,
+                    cache_directory=yara_cfg.get('cache_directory'),
+                )
+                rule_set.watch(yara_cfg.get('reload_interval', 0))
+                self.rule_sets[location] = rule_set
+                compilation_time_ms = rule_set.compilation_ms
                 trace_scanner(self.name, 'compiled yara', extra={
                     'strelka_id': options['strelka_id'],
                     'yara_compilation_took_ms': compilation_time_ms,
-                    'custom_yara': compiled_custom_yara_all != ''
+                    'custom_yara': compiled_custom_yara_all != '' or compiled_merged_yara is not None
                 })
                 self.event['compilation_ms'] = compilation_time_ms
 
@@ -97,15 +102,28 @@ class ScanYara(strelka.Scanner):
 
             timeout = math.ceil(expire_at - time.time())
 
-            if self.compiled_yara is not None:
-                yara_matches = self.compiled_yara.match(data=data, timeout=timeout)
-
-            if compiled_custom_yara_all:
+            if combined_matches is not None:
+                yara_matches = [(m, 'base') for m in combined_matches]
+            elif compiled_merged_yara is not None:
+                yara_matches = [
+                    (m, 'custom' if m.namespace == 'custom' else 'base')
+                    for m in compiled_merged_yara.match(data=data, externals=externals, timeout=timeout)
+                ]
+            elif location in self.rule_sets and self.rule_sets[location].rules is not None:
+                yara_matches = [
+                    (m, 'base')
+                    for m in self.rule_sets[location].rules.match(data=data, externals=externals, timeout=timeout)
+                ]
+
+            if compiled_custom_yara_all and compiled_merged_yara is None:
                 timeout = math.ceil(expire_at - time.time())
-                yara_matches = compiled_custom_yara_all.match(data=data, timeout=timeout)
+                yara_matches.extend(
+                    (m, 'custom')
+                    for m in compiled_custom_yara_all.match(data=data, externals=externals, timeout=timeout)
+                )
 
-            for match in yara_matches:
-                event = { 'name': match.rule, 'tags': [], 'meta': {} }
+            for (match, origin) in yara_matches:
+                event = { 'name': match.rule, 'tags': [], 'meta': {}, 'origin': origin }
                 if match.tags:
                     for tag in match.tags:
                         if not tag in event['tags']:
@@ -0,0 +1,185 @@
+"""Event sinks for bulk scans.
+
+Sinks receive events (JSON strings or dictionaries, as produced by
+strelka.format_event) and write them to files. JsonlSink writes one event per
+line; ParquetSink batches events into Arrow record batches and writes them as
+Parquet, promoting commonly queried fields to columns.
+
+Events are written with a key (e.g. a checkpoint entry for the scanned file).
+write and close return the keys whose events were written to finished files,
+so callers can checkpoint files only after their events are durable.
+"""
+import json
+import os
+import sys
+import uuid
+
+
+class JsonlSink(object):
+    """Writes events as JSON lines.
+
+    Attributes:
+        path: Path of the file that events are appended to (defaults to
+            stdout).
+    """
+    def __init__(self, path=None):
+        self.f = open(path, 'a') if path else sys.stdout
+
+    def write(self, events, key=None):
+        """Writes events and returns the keys that were written."""
+        for event in events:
+            if not isinstance(event, str):
+                event = json.dumps(event)
+            self.f.write(event + '\n')
+        self.f.flush()
+        return [] if key is None else [key]
+
+    def close(self):
+        if self.f is not sys.stdout:
+            self.f.close()
+        return []
+
+
+class ParquetSink(object):
+    """Writes events as Parquet files.
+
+    Events are buffered and every batch_size rows are written as a new part
+    file in the output directory, so multiple sinks (and resumed runs) never
+    overwrite each other. Part files are written under a hidden name (which
+    readers of the directory ignore) and renamed when they are complete, so
+    every visible part file is valid even if the process is killed.
+
+    Columns:
+        node, parent, root: File tree identifiers.
+        name, source, depth, size, scanners: File metadata.
+        flavors_mime, flavors_yara, flavors_external: File flavors.
+        md5, sha1, sha256, ssdeep, tlsh: Hashes collected by ScanHash.
+        scanner_stats: List of {name, elapsed, flags} for every scanner
+            that ran on the file.
+        event: Remainder of the event as JSON (promoted fields removed).
+
+    Attributes:
+        directory: Directory that part files are written to.
+        batch_size: Number of events buffered per part file.
+        compression: Parquet compression codec.
+    """
+    HASHES = ('md5', 'sha1', 'sha256', 'ssdeep', 'tlsh')
+
+    def __init__(self, directory, batch_size=10000, compression='zstd'):
+        # pyarrow is only required when Parquet output is requested.
+        import pyarrow
+        import pyarrow.parquet
+
+        self.pa = pyarrow
+        self.batch_size = batch_size
+        self.schema = pyarrow.schema([
+            ('node', pyarrow.string()),
+            ('parent', pyarrow.string()),
+            ('root', pyarrow.string()),
+            ('name', pyarrow.string()),
+            ('source', pyarrow.string()),
+            ('depth', pyarrow.int32()),
+            ('size', pyarrow.int64()),
+            ('scanners', pyarrow.list_(pyarrow.string())),
+            ('flavors_mime', pyarrow.list_(pyarrow.string())),
+            ('flavors_yara', pyarrow.list_(pyarrow.string())),
+            ('flavors_external', pyarrow.list_(pyarrow.string())),
+            *[(h, pyarrow.string()) for h in self.HASHES],
+            ('scanner_stats', pyarrow.list_(pyarrow.struct([
+                ('name', pyarrow.string()),
+                ('elapsed', pyarrow.float64()),
+                ('flags', pyarrow.list_(pyarrow.string())),
+            ]))),
+            ('event', pyarrow.string()),
+        ])
+
+        self.directory = directory
+        self.compression = compression
+        os.makedirs(directory, exist_ok=True)
+        self.rows = self._empty()
+        self.keys = []
+
+    def _empty(self):
+        return {field.name: [] for field in self.schema}
+
+    def _add(self, event):
+        """Splits an event into promoted columns and a JSON remainder."""
+        if isinstance(event, str):
+            event = json.loads(event)
+
+        file = event.pop('file', {})
+        tree = file.pop('tree', {})
+        flavors = file.pop('flavors', {})
+        scan = event.pop('scan', {})
+        hashes = scan.get('hash', {})
+
+        row = {
+            'node': tree.get('node'),
+            'parent': tree.get('parent'),
+            'root': tree.get('root'),
+            'name': file.pop('name', None),
+            'source': file.pop('source', None),
+            'depth': file.pop('depth', None),
+            'size': file.pop('size', None),
+            'scanners': file.pop('scanners', None),
+            'flavors_mime': flavors.pop('mime', None),
+            'flavors_yara': flavors.pop('yara', None),
+            'flavors_external': flavors.pop('external', None),
+            'scanner_stats': [],
+        }
+        for h in self.HASHES:
+            row[h] = hashes.pop(h, None)
+
+        for (key, result) in scan.items():
+            row['scanner_stats'].append({
+                'name': key,
+                'elapsed': result.pop('elapsed', None),
+                'flags': result.pop('flags', []),
+            })
+
+        # Anything that was not promoted (unknown file fields, flavors, and
+        # scanner results) stays in the JSON remainder.
+        if flavors:
+            file['flavors'] = flavors
+        if file:
+            event['file'] = file
+        event['scan'] = {k: v for (k, v) in scan.items() if v}
+        row['event'] = json.dumps(event)
+
+        for (column, value) in row.items():
+            self.rows[column].append(value)
+
+    def write(self, events, key=None):
+        """Buffers events, writing a part file when batch_size is reached.
+
+        Events passed as dictionaries are modified in place.
+
+        Returns:
+            List of keys whose events were written (empty until a part file
+            is written).
+        """
+        for event in events:
+            self._add(event)
+        if key is not None:
+            self.keys.append(key)
+        if len(self.rows['event']) >= self.batch_size:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """Writes buffered events as a part file and returns their keys."""
+        if self.rows['event']:
+            name = f'part-{uuid.uuid4()}.parquet'
+            tmp_path = os.path.join(self.directory, f'.{name}.tmp')
+            table = self.pa.Table.from_pydict(self.rows, schema=self.schema)
+            self.pa.parquet.write_table(table, tmp_path,
+                                        compression=self.compression)
+            os.replace(tmp_path, os.path.join(self.directory, name))
+            self.rows = self._empty()
+
+        (keys, self.keys) = (self.keys, [])
+        return keys
+
+    def close(self):
+        """Writes buffered events and returns their keys."""
+        return self.flush()
@@ -1,5 +1,7 @@
+import hashlib
 import json
 import logging
+import queue
 import re
 import time
 import uuid
@@ -8,6 +10,10 @@ from boltons import iterutils
 import inflection
 import interruptingcow
 
+from strelka import analyzers
+from strelka import artifacts
+from strelka import imagecache
+
 
 class RequestTimeout(Exception):
     """Raised when request times out."""
@@ -41,6 +47,8 @@ class File(object):
         pointer: String that contains the location of the file bytes in Redis.
         name: String that contains the name of the file.
         source: String that describes which scanner the file originated from.
+        artifacts: Memo of values derived from the file's data that is shared
+            by scanners (see strelka.artifacts).
     """
     def __init__(self, pointer='',
                  parent='', depth=0,
@@ -53,6 +61,7 @@ class File(object):
         self.parent = parent
         self.pointer = pointer or self.uid
         self.source = source
+        self.artifacts = None
 
     def add_flavors(self, flavors):
         """Adds flavors to the file.
@@ -78,14 +87,24 @@ class Scanner(object):
         scanner_timeout: Amount of time (in seconds) that a scanner can spend
             scanning a file. Can be overridden on a per-scanner basis
             (see scan_wrapper).
+        scan_expire_at: Time when the current scan times out.
         coordinator: Redis client connection to the coordinator.
+        image_cache: Cache of results of images with identical pixels,
+            created when a scan enables it (see scan_wrapper).
+        deferred: List of futures of analyses that the scan submitted to
+            an analyzer pool (see run_analyzer).
     """
     def __init__(self, backend_cfg, coordinator):
         """Inits scanner with scanner name and metadata key."""
         self.name = self.__class__.__name__
+        self.backend_cfg = backend_cfg
         self.key = inflection.underscore(self.name.replace('Scan', ''))
         self.scanner_timeout = backend_cfg.get('limits').get('scanner')
+        self.scan_expire_at = None
         self.coordinator = coordinator
+        self.image_cache = None
+        self.uploads = None
+        self.deferred = []
         self.init()
 
     def init(self):
@@ -122,6 +141,15 @@ class Scanner(object):
         empty) and metadata regardless of whether the scanner completed
         successfully or hit an exception.
 
+        If the 'image_cache' option is enabled and the file is an image, then
+        results are cached by the image's decoded pixels (see
+        strelka.imagecache), scoped by scanner and options. Images with
+        identical pixels (e.g. an image that was re-saved in another format)
+        are not scanned and the cached metadata and files are returned and
+        flagged with 'image_cache_hit'. Results are not cached if the scan
+        failed or its files are larger than 'image_cache_max_size' (defaults
+        to 1 MB).
+
         Args:
             data: Data associated with file that will be scanned.
             file: File associated with data that will be scanned (see File()).
@@ -139,22 +167,36 @@ class Scanner(object):
         self.files = []
         self.flags = []
         self.event = {}
+        self.deferred = []
         self.scanner_timeout = options.get('scanner_timeout',
                                            self.scanner_timeout)
-
-        try:
-            with interruptingcow.timeout(self.scanner_timeout,
-                                         ScannerTimeout):
-                self.scan(data, file, options, expire_at)
-
-        except ScannerTimeout:
-            self.flags.append('timed_out')
-        except (DistributionTimeout, RequestTimeout):
-            raise
-        except Exception:
-            logging.exception(f'{self.name}: exception while scanning'
-                              f' uid {file.uid} (see traceback below)')
-            self.flags.append('uncaught_exception')
+        self.scan_expire_at = start + self.scanner_timeout
+        if file.artifacts is None or file.artifacts.data is not data:
+            file.artifacts = artifacts.Artifacts(data)
+
+        cache_key = None
+        if options.get('image_cache', False):
+            cache_key = self._image_cache_key(file, options)
+
+        if cache_key is None or not self._image_cache_get(cache_key, expire_at):
+            self.uploads = {} if cache_key is not None else None
+            try:
+                with interruptingcow.timeout(self.scanner_timeout,
+                                             ScannerTimeout):
+                    self.scan(data, file, options, expire_at)
+
+            except ScannerTimeout:
+                self.flags.append('timed_out')
+            except (DistributionTimeout, RequestTimeout):
+                raise
+            except Exception:
+                logging.exception(f'{self.name}: exception while scanning'
+                                  f' uid {file.uid} (see traceback below)')
+                self.flags.append('uncaught_exception')
+
+            if cache_key is not None:
+                self._image_cache_put(cache_key, options)
+            self.uploads = None
 
         self.event = {
             **{'elapsed': round(time.time() - start, 6)},
@@ -167,6 +209,161 @@ class Scanner(object):
             {self.key: self.event}
         )
 
+    def _image_cache_key(self, file, options):
+        """Returns the cache scope and pixel digest of an image file.
+
+        Returns None if the file is not an image.
+        """
+        try:
+            digest = file.artifacts.get('image.digest')
+        except Exception:
+            return None
+
+        if self.image_cache is None:
+            self.image_cache = imagecache.ResultCache(self.coordinator)
+        # The request's strelka_id is excluded so that results are shared
+        # between requests.
+        scope = hashlib.sha1(json.dumps(
+            {k: v for (k, v) in options.items() if k != 'strelka_id'},
+            sort_keys=True,
+            default=str,
+        ).encode()).hexdigest()[:16]
+        return (f'{self.name}:{scope}', digest)
+
+    def _image_cache_get(self, cache_key, expire_at):
+        """Restores the cached result of an image with identical pixels, if any."""
+        try:
+            result = self.image_cache.get(*cache_key)
+        except Exception:
+            logging.exception(f'{self.name}: unable to read image cache')
+            return False
+        if result is None:
+            return False
+
+        for cached_file in result['files']:
+            extract_file = File(
+                name=cached_file['name'],
+                source=self.name,
+            )
+            extract_file.add_flavors(cached_file['flavors'])
+            for c in chunk_string(cached_file['data']):
+                self.upload_to_coordinator(
+                    extract_file.pointer,
+                    c,
+                    expire_at,
+                )
+            self.files.append(extract_file)
+        self.flags.extend(result['flags'])
+        self.flags.append('image_cache_hit')
+        self.event.update(result['event'])
+        return True
+
+    def _image_cache_put(self, cache_key, options):
+        """Caches the result of a scan that completed."""
+        if {'timed_out', 'uncaught_exception'} & set(self.flags):
+            return
+
+        files = []
+        size = 0
+        for extract_file in self.files:
+            # Files whose data was not uploaded through upload_to_coordinator
+            # cannot be restored.
+            if extract_file.pointer not in self.uploads:
+                return
+            data = b''.join(
+                c.encode() if isinstance(c, str) else bytes(c)
+                for c in self.uploads[extract_file.pointer]
+            )
+            size += len(data)
+            files.append({
+                'name': extract_file.name,
+                'flavors': extract_file.flavors,
+                'data': data,
+            })
+        if size > options.get('image_cache_max_size', 1024 * 1024):
+            return
+
+        try:
+            self.image_cache.put(*cache_key, {
+                'event': self.event,
+                'flags': self.flags,
+                'files': files,
+            })
+        except Exception:
+            logging.exception(f'{self.name}: unable to write image cache')
+
+    def run_analyzer(self, func, args, version, file, options, expire_at):
+        """Runs a slow external analyzer out of band (see strelka.analyzers).
+
+        Results of the analyzer are cached by scanner, version, and SHA256
+        of the file for 'analyzer_cache_ttl' seconds (defaults to 86400).
+        Cached results are added to the event and flagged with
+        'analyzer_cache_hit'. Otherwise, unless the 'deferred' option is
+        disabled (defaults to True), the analysis is queued in the scanner's
+        pool of 'analyzer_workers' threads (defaults to 1) that queues at
+        most 'analyzer_queue_size' analyses (defaults to 16) and the event is
+        flagged with 'analyzer_deferred'; its result is emitted by the backend
+        as a follow-up event. If the queue is full, then the analysis is
+        skipped and the event is flagged with 'analyzer_queue_full'.
+
+        Analyses must finish by a deadline that is passed to func after
+        args: the request's expiration date for deferred analyses, otherwise
+        the end of the scanner timeout.
+
+        Args:
+            func: Function that returns a dictionary of event fields;
+                problems are listed under 'flags'.
+            args: Arguments of func (followed by the deadline).
+            version: String that identifies the version of the analyzer
+                (e.g. from analyzers.fingerprint).
+            file: File that is analyzed.
+            options: Options of the scan.
+            expire_at: Expiration date of the request.
+        """
+        key = f'{self.name}:{version}:{file.artifacts.get("digest.sha256")}'
+        try:
+            result = analyzers.cached(self.coordinator, key)
+        except Exception:
+            logging.exception(f'{self.name}: unable to read analyzer cache')
+            result = None
+        if result is not None:
+            self.flags.append('analyzer_cache_hit')
+
+        elif options.get('deferred', True):
+            pool = analyzers.get_pool(
+                self.name,
+                options.get('analyzer_workers', 1),
+                options.get('analyzer_queue_size', 16),
+            )
+            try:
+                self.deferred.append(pool.submit(
+                    expire_at,
+                    analyzers.analyze,
+                    self.coordinator,
+                    key,
+                    options.get('analyzer_cache_ttl', 86400),
+                    func,
+                    *args,
+                    expire_at,
+                ))
+                self.flags.append('analyzer_deferred')
+            except queue.Full:
+                self.flags.append('analyzer_queue_full')
+            return
+
+        else:
+            result = analyzers.analyze(
+                self.coordinator,
+                key,
+                options.get('analyzer_cache_ttl', 86400),
+                func,
+                *args,
+                min(expire_at, self.scan_expire_at),
+            )
+
+        self.flags.extend(result.pop('flags', []))
+        self.event.update(result)
+
     def upload_to_coordinator(self, pointer, chunk, expire_at):
         """Uploads data to coordinator.
 
@@ -180,6 +377,9 @@ class Scanner(object):
                 the coordinator.
             expire_at: Expiration date for data stored in pointer.
         """
+        if self.uploads is not None:
+            self.uploads.setdefault(pointer, []).append(chunk)
+
         p = self.coordinator.pipeline(transaction=False)
         p.rpush(f'data:{pointer}', chunk)
         p.expireat(f'data:{pointer}', expire_at)
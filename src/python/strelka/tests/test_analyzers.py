@@ -0,0 +1,107 @@
+import concurrent.futures
+import json
+import threading
+import time
+
+from strelka import analyzers
+from strelka import strelka
+from strelka.backend import Backend
+from strelka.local import LocalCoordinator
+
+
+def analyze(data, event, deadline):
+    event.wait(10)
+    return {'flags': [], 'size': len(data), 'deadline': deadline}
+
+
+class ScanAnalyzer(strelka.Scanner):
+    def scan(self, data, file, options, expire_at):
+        self.run_analyzer(analyze, (data, options['event']), 'v1', file, options, expire_at)
+
+
+def test_analyzers_deferred():
+    """
+    Pass: Analyses run out of band, are cached, and are skipped when the queue is full.
+    Failure: Analyses block the scan, are not cached, or are queued without bound.
+    """
+    coordinator = LocalCoordinator()
+    scanner = ScanAnalyzer({'limits': {'scanner': 10}}, coordinator)
+    event = threading.Event()
+    options = {'event': event, 'analyzer_queue_size': 1}
+
+    (_, result) = scanner.scan_wrapper(b'first', strelka.File(), options, time.time() + 10)
+    assert result['analyzer']['flags'] == ['analyzer_deferred']
+    future = scanner.deferred[0]
+
+    # The first analysis is running and the second fills the queue.
+    while not future.running():
+        time.sleep(0.01)
+    scanner.scan_wrapper(b'second', strelka.File(), options, time.time() + 10)
+    (_, result) = scanner.scan_wrapper(b'third', strelka.File(), options, time.time() + 10)
+    assert result['analyzer']['flags'] == ['analyzer_queue_full']
+    assert scanner.deferred == []
+
+    event.set()
+    assert future.result(10)['size'] == 5
+
+    (_, result) = scanner.scan_wrapper(b'first', strelka.File(), options, time.time() + 10)
+    assert result['analyzer']['flags'] == ['analyzer_cache_hit']
+    assert result['analyzer']['size'] == 5
+
+
+def test_analyzers_deadline():
+    """
+    Pass: Deferred analyses are given the request's deadline and analyses in the scan the scanner's.
+    Failure: Analyses may run past the request or the scanner timeout.
+    """
+    scanner = ScanAnalyzer({'limits': {'scanner': 1}}, LocalCoordinator())
+    event = threading.Event()
+    event.set()
+    expire_at = time.time() + 10
+
+    scanner.scan_wrapper(b'first', strelka.File(), {'event': event}, expire_at)
+    assert scanner.deferred[0].result(10)['deadline'] == expire_at
+
+    start = time.time()
+    (_, result) = scanner.scan_wrapper(b'second', strelka.File(),
+                                       {'event': event, 'deferred': False}, expire_at)
+    assert start < result['analyzer']['deadline'] <= time.time() + 1
+
+
+def test_analyzers_emit(tmp_path):
+    """
+    Pass: Results of deferred analyses are emitted when they finish, until the request expires.
+    Failure: Emitting waits for analyses or emits results of expired requests.
+    """
+    (tmp_path / 'taste').mkdir()
+    coordinator = LocalCoordinator()
+    backend = Backend({
+        'limits': {'scanner': 10},
+        'tasting': {'mime_db': None, 'yara_rules': str(tmp_path / 'taste')},
+        'scanners': {},
+    }, coordinator)
+
+    (running, expired) = (concurrent.futures.Future(), concurrent.futures.Future())
+    backend.deferred = [({'name': 'running'}, 'analyzer', running)]
+    backend.emit_deferred('root', time.time() + 10)
+    backend.deferred = [({'name': 'expired'}, 'analyzer', expired)]
+    backend.emit_deferred('root', time.time() - 1)
+    assert coordinator.lrange('event:root', 0, -1) == []
+
+    running.set_result({'flags': [], 'size': 5})
+    expired.set_result({'flags': [], 'size': 5})
+    events = [json.loads(e) for e in coordinator.lrange('event:root', 0, -1)]
+    assert [e['file']['name'] for e in events] == ['running']
+    assert events[0]['scan']['analyzer']['size'] == 5
+
+
+def test_analyzers_fingerprint(tmp_path):
+    """
+    Pass: Fingerprints are memoized and change after rules change and the TTL passes.
+    Failure: Fingerprints are computed on every call or never change.
+    """
+    (tmp_path / 'rule.yml').write_text('rule')
+    fingerprint = analyzers.fingerprint(str(tmp_path))
+    (tmp_path / 'other.yml').write_text('rule')
+    assert analyzers.fingerprint(str(tmp_path)) == fingerprint
+    assert analyzers.fingerprint(str(tmp_path), ttl=0) != fingerprint
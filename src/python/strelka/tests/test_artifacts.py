@@ -0,0 +1,73 @@
+import time
+
+import interruptingcow
+import pytest
+
+from strelka import artifacts
+from strelka import strelka
+
+
+def test_artifacts():
+    """
+    Pass: Artifacts are computed once and served from the memo afterwards.
+    Failure: Unable to compute artifacts or hits and misses are miscounted.
+    """
+    memo = artifacts.Artifacts(b'test')
+
+    assert memo.get('digest.md5') == '098f6bcd4621d373cade4e832627b4f6'
+    assert memo.get('digest.md5') == '098f6bcd4621d373cade4e832627b4f6'
+    assert memo.get('text.utf8') == 'test'
+    assert memo.stats() == {'hits': 1, 'misses': 2}
+
+
+def test_artifacts_error():
+    """
+    Pass: Producer errors are memoized and raised to every caller.
+    Failure: The producer runs more than once or the error is not raised.
+    """
+    memo = artifacts.Artifacts(b'not a zip')
+
+    for _ in range(2):
+        with pytest.raises(Exception):
+            memo.get('zip.index')
+    assert memo.stats() == {'hits': 1, 'misses': 1}
+
+
+def test_artifacts_arguments():
+    """
+    Pass: Artifacts requested with different arguments are memoized separately.
+    Failure: Arguments are not passed to producers or share one memo entry.
+    """
+    fitz = pytest.importorskip('fitz')
+    document = fitz.open()
+    document.new_page(width=72, height=72)
+    memo = artifacts.Artifacts(document.tobytes())
+
+    pixmap = memo.get('pdf.pixmap', 0, 72)
+    assert memo.get('pdf.pixmap', 0, 72) is pixmap
+    assert (pixmap.width, pixmap.height) == (72, 72)
+    assert memo.get('pdf.pixmap', 0, 144).width == 144
+
+
+def test_artifacts_timeout():
+    """
+    Pass: Producers interrupted by a timeout are computed again by the next caller.
+    Failure: The timeout is memoized and raised to callers that were not interrupted.
+    """
+    calls = []
+
+    def slow(memo, seconds):
+        calls.append(seconds)
+        time.sleep(seconds)
+        return len(memo.data)
+
+    artifacts.PRODUCERS['test.slow'] = slow
+    try:
+        memo = artifacts.Artifacts(b'test')
+        with pytest.raises(strelka.ScannerTimeout):
+            with interruptingcow.timeout(0.1, strelka.ScannerTimeout):
+                memo.get('test.slow', 1)
+        assert memo.get('test.slow', 1) == 4
+        assert calls == [1, 1]
+    finally:
+        del artifacts.PRODUCERS['test.slow']
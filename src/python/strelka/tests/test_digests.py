@@ -0,0 +1,29 @@
+import hashlib
+import mmap
+import tempfile
+
+from strelka import digests
+
+
+def test_digests():
+    """
+    Pass: Digests computed in one pass (serially, on worker threads, and over
+        memory-mapped data) match hashlib.
+    Failure: Unable to compute digests or a digest does not match hashlib.
+    """
+    data = bytes(range(256)) * 4096
+    expected = {
+        'md5': hashlib.md5(data).hexdigest(),
+        'sha1': hashlib.sha1(data).hexdigest(),
+        'sha256': hashlib.sha256(data).hexdigest(),
+    }
+
+    assert digests.digest(data, list(expected)) == expected
+    assert digests.digest(memoryview(data), list(expected),
+                          chunk_size=1000, parallel_size=0) == expected
+
+    with tempfile.TemporaryFile() as f:
+        f.write(data)
+        f.flush()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            assert digests.digest(mm, list(expected), parallel_size=0) == expected
@@ -0,0 +1,107 @@
+import io
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from strelka import imagecache
+from strelka import strelka
+from strelka.local import LocalCoordinator
+
+
+def make_image(seed, format='PNG', noise=0):
+    rng = np.random.default_rng(seed)
+    image = Image.fromarray(rng.integers(0, 255, (8, 8, 3), dtype=np.uint8))
+    pixels = np.asarray(image.resize((128, 128), Image.BILINEAR), dtype=np.int16)
+    pixels = pixels + np.random.default_rng(seed + 1).integers(-noise, noise + 1, pixels.shape)
+    with io.BytesIO() as f:
+        Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(f, format=format)
+        return f.getvalue()
+
+
+def make_qr(text):
+    code = cv2.QRCodeEncoder.create().encode(text)
+    code = cv2.resize(code, None, fx=4, fy=4, interpolation=cv2.INTER_NEAREST)
+    image = np.full((600, 800), 240, np.uint8)
+    image[100:100 + code.shape[0], 200:200 + code.shape[1]] = code
+    with io.BytesIO() as f:
+        Image.fromarray(image).save(f, format='PNG')
+        return f.getvalue()
+
+
+def reencode(data, format):
+    with io.BytesIO() as f:
+        Image.open(io.BytesIO(data)).save(f, format=format)
+        return f.getvalue()
+
+
+class ScanCount(strelka.Scanner):
+    def init(self):
+        self.count = 0
+
+    def scan(self, data, file, options, expire_at):
+        self.count += 1
+        self.event['count'] = self.count
+        self.event['data'] = data
+        extract_file = strelka.File(name='child', source=self.name)
+        self.upload_to_coordinator(extract_file.pointer, b'child data', expire_at)
+        self.files.append(extract_file)
+
+
+def test_image_cache():
+    """
+    Pass: Results are served to identical digests in scope from both tiers.
+    Failure: Results are missed or served across scopes or digests.
+    """
+    coordinator = LocalCoordinator()
+    digest = imagecache.pixel_digest(make_image(1))
+    imagecache.ResultCache(coordinator).put('scope', digest, {'raw': b'text'})
+
+    cache = imagecache.ResultCache(coordinator)
+    assert cache.get('scope', digest) == {'raw': b'text'}
+    assert cache.get('scope', imagecache.pixel_digest(make_image(2))) is None
+    assert cache.get('other', digest) is None
+    # Served from the in-process tier after the coordinator is flushed.
+    coordinator.flushdb()
+    assert cache.get('scope', digest) == {'raw': b'text'}
+
+
+def test_image_cache_scanner():
+    """
+    Pass: Re-encoded images are served from the cache with their files and
+        images with different pixels are scanned.
+    Failure: Re-encoded images are scanned again, files are not restored,
+        or the result of a different image is served.
+    """
+    coordinator = LocalCoordinator()
+    scanner = ScanCount({'limits': {'scanner': 10}}, coordinator)
+    for (i, data) in enumerate([make_image(1), reencode(make_image(1), 'BMP')]):
+        options = {'image_cache': True, 'strelka_id': str(i)}
+        (files, event) = scanner.scan_wrapper(data, strelka.File(name='test'),
+                                              options, time.time() + 10)
+    assert scanner.count == 1
+    assert event['count']['count'] == 1
+    assert event['count']['flags'] == ['image_cache_hit']
+    assert coordinator.lrange(f'data:{files[0].pointer}', 0, -1) == [b'child data']
+
+    scanner.scan_wrapper(b'not an image', strelka.File(name='test'), options, time.time() + 10)
+    scanner.scan_wrapper(make_image(2), strelka.File(name='test'), options, time.time() + 10)
+    scanner.scan_wrapper(make_image(1, 'JPEG', noise=4), strelka.File(name='test'), options, time.time() + 10)
+    assert scanner.count == 4
+
+
+def test_image_cache_scanner_qr():
+    """
+    Pass: Images that differ only in their QR codes are each scanned.
+    Failure: The result of one QR code is served for another.
+    """
+    (first, second) = (make_qr('https://example.com/a'), make_qr('https://example.com/b'))
+
+    scanner = ScanCount({'limits': {'scanner': 10}}, LocalCoordinator())
+    for data in (first, second):
+        (_, event) = scanner.scan_wrapper(data, strelka.File(name='test'),
+                                          {'image_cache': True}, time.time() + 10)
+        assert event['count']['data'] == data
+    assert scanner.count == 2
+    assert event['count']['flags'] == []
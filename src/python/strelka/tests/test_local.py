@@ -0,0 +1,102 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import zipfile
+
+import yaml
+
+from strelka import local
+from strelka.local import LocalCoordinator
+
+
+def test_local_coordinator_lists():
+    """
+    Pass: List commands behave like their Redis equivalents.
+    Failure: Values are not stored as bytes or are popped out of order.
+    """
+    coordinator = LocalCoordinator()
+
+    p = coordinator.pipeline(transaction=False)
+    p.rpush('data:1', b'a')
+    p.rpush('data:1', 'b')
+    p.expireat('data:1', time.time() + 60)
+    assert p.execute() == [1, 2, True]
+
+    assert coordinator.lpop('data:1') == b'a'
+    assert coordinator.lpop('data:1') == b'b'
+    assert coordinator.lpop('data:1') is None
+    assert coordinator.exists('data:1') == 0
+
+
+def test_local_coordinator_expiration():
+    """
+    Pass: Expired keys are not returned.
+    Failure: Expired keys are returned.
+    """
+    coordinator = LocalCoordinator()
+
+    coordinator.set('yara_cache_key:1', 'key')
+    assert coordinator.get('yara_cache_key:1') == b'key'
+
+    coordinator.expireat('yara_cache_key:1', time.time() - 1)
+    assert coordinator.get('yara_cache_key:1') is None
+
+
+def make_config(tmp_path):
+    taste = tmp_path / 'taste'
+    taste.mkdir()
+    (taste / 'taste.yara').write_text('rule zip_file { strings: $a = { 50 4B 03 04 } condition: $a at 0 }')
+    return {
+        'limits': {'distribution': 60, 'scanner': 30, 'max_depth': 5, 'time_to_live': 0, 'max_files': 0},
+        'tasting': {'mime_db': None, 'yara_rules': str(taste)},
+        'scanners': {
+            'ScanFooter': [{'positive': {'flavors': ['*']}, 'priority': 5}],
+            'ScanZip': [{'positive': {'flavors': ['zip_file']}, 'priority': 5}],
+        },
+    }
+
+
+def make_zip():
+    with io.BytesIO() as f:
+        with zipfile.ZipFile(f, 'w') as z:
+            z.writestr('child.txt', b'child data')
+        return f.getvalue()
+
+
+def test_local_scan_bytes(tmp_path):
+    """
+    Pass: Root and child events are returned in order.
+    Failure: Events are missing or not linked to the root.
+    """
+    events = local.LocalBackend(make_config(tmp_path)).scan_bytes(make_zip(), name='test.zip')
+
+    assert [e['file']['name'] for e in events] == ['test.zip', 'child.txt']
+    (root, child) = events
+    assert 'zip_file' in root['file']['flavors']['yara']
+    assert root['scan']['zip']['total']['extracted'] == 1
+    assert child['file']['tree']['parent'] == root['file']['tree']['node']
+    assert child['scan']['footer']['footer'] == 'child data'
+
+
+def test_local_oneshot(tmp_path):
+    """
+    Pass: strelka-backend --oneshot prints the events of a file as JSON lines.
+    Failure: The command fails or prints anything other than events.
+    """
+    config = tmp_path / 'backend.yaml'
+    config.write_text(yaml.safe_dump(make_config(tmp_path)))
+    path = tmp_path / 'test.zip'
+    path.write_bytes(make_zip())
+
+    bin_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'bin')
+    process = subprocess.run(
+        [sys.executable, os.path.join(bin_dir, 'strelka-backend'), '-c', str(config), '--oneshot', str(path)],
+        stdout=subprocess.PIPE,
+        env={**os.environ, 'PYTHONPATH': os.path.join(os.path.dirname(__file__), '..', '..')},
+        check=True,
+    )
+    events = [json.loads(line) for line in process.stdout.splitlines()]
+    assert [e['file']['name'] for e in events] == [str(path), 'child.txt']
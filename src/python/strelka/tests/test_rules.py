@@ -0,0 +1,69 @@
+import os
+import time
+
+from strelka import rules
+from strelka.backend import Backend
+from strelka.local import LocalCoordinator
+
+
+def test_rule_set_reload(tmp_path):
+    """
+    Pass: Changed rule files are recompiled and cached by source hash.
+    Failure: Unable to compile, reload, or cache rules.
+    """
+    rule_dir = tmp_path / 'rules'
+    cache_dir = tmp_path / 'cache'
+    rule_dir.mkdir()
+    (rule_dir / 'a.yara').write_text('rule a { condition: true }')
+
+    rule_set = rules.RuleSet([(str(rule_dir), 'namespace')],
+                             cache_directory=str(cache_dir))
+    assert [m.rule for m in rule_set.rules.match(data=b'')] == ['a']
+    assert not rule_set.reload()
+
+    (rule_dir / 'b.yara').write_text('rule b { condition: true }')
+    assert rule_set.reload()
+    assert sorted(m.rule for m in rule_set.rules.match(data=b'')) == ['a', 'b']
+    assert len(os.listdir(cache_dir)) == 2
+
+    # Invalid rules keep the current rules.
+    (rule_dir / 'c.yara').write_text('rule c {')
+    try:
+        rule_set.reload()
+    except Exception:
+        pass
+    assert sorted(m.rule for m in rule_set.rules.match(data=b'')) == ['a', 'b']
+
+
+def test_merged_yara_base_reload(tmp_path):
+    """
+    Pass: Merged rules are only loaded while the base rules they were compiled from are current.
+    Failure: Merged rules keep matching base rules that were reloaded.
+    """
+    (tmp_path / 'taste').mkdir()
+    (tmp_path / 'base').mkdir()
+    (tmp_path / 'base' / 'base.yara').write_text('rule old { condition: true }')
+    backend = Backend({
+        'limits': {'scanner': 10},
+        'tasting': {'mime_db': None, 'yara_rules': str(tmp_path / 'taste')},
+        'yara': {'reload_interval': 0.05},
+        'scanners': {'ScanYara': [{
+            'positive': {'flavors': ['*']},
+            'options': {'location': str(tmp_path / 'base'), 'merged': True},
+        }]},
+    }, LocalCoordinator())
+
+    (merged, base_hash) = backend.compile_merged_yara('rule custom { condition: true }', 'root', 'key')
+    backend.coordinator.set('yara:compiled_merged:key', merged)
+    backend.coordinator.set('yara:merged_base:key', base_hash)
+    backend.coordinator.set('yara:hash:key', 'custom hash')
+
+    location = str(tmp_path / 'base')
+    (compiled, count, _) = backend.load_custom_yara('key', 'compiled_merged', backend.merged_base_hash(location))
+    assert count == 2
+    assert backend.load_custom_yara('key', 'compiled_merged', backend.merged_base_hash(location))[2]
+
+    (tmp_path / 'base' / 'base.yara').write_text('rule new { condition: true }')
+    time.sleep(0.1)
+    assert backend.load_custom_yara('key', 'compiled_merged', backend.merged_base_hash(location)) == (None, 0, False)
+    backend.taste_rules.stop()
@@ -0,0 +1,48 @@
+import random
+import time
+
+import pytest
+
+from strelka import strelka
+
+pytest.importorskip('entropy')
+from strelka.scanners.scan_entropy import ScanEntropy  # noqa: E402
+
+
+def run_scanner(data, options):
+    scanner = ScanEntropy({'limits': {'scanner': 10}}, None)
+    (_, event) = scanner.scan_wrapper(data, strelka.File(name='test'),
+                                      {'windowed': True, **options}, time.time() + 10)
+    return event['entropy']['windows']
+
+
+def test_scan_entropy_windows():
+    """
+    Pass: Trailing bytes are measured and contiguous high entropy windows form one region.
+    Failure: The partial trailing window is dropped or the region is truncated.
+    """
+    payload = random.Random(0).randbytes(700)
+    windows = run_scanner(b'\x00' * 8192 + payload, {'window_size': 256, 'threshold': 6})
+
+    assert windows['total'] == 35
+    assert not windows['sampled']
+    assert windows['high_entropy_regions'] == [{
+        'offset': 8192,
+        'size': 700,
+        'entropy': windows['high_entropy_regions'][0]['entropy'],
+    }]
+
+
+def test_scan_entropy_windows_sampled():
+    """
+    Pass: Sampled windows separated by unsampled data are reported as separate regions.
+    Failure: Regions cover data that was not sampled.
+    """
+    windows = run_scanner(random.Random(0).randbytes(256 * 100),
+                          {'window_size': 256, 'max_windows': 10, 'threshold': 6})
+
+    assert windows['sampled']
+    assert windows['high_entropy_windows'] == 10
+    assert len(windows['high_entropy_regions']) == 10
+    assert {r['size'] for r in windows['high_entropy_regions']} == {256}
+    assert windows['high_entropy_regions'][-1]['offset'] == 256 * 99
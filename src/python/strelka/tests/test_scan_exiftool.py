@@ -0,0 +1,86 @@
+import os
+import sys
+
+import pytest
+
+from strelka.scanners.scan_exiftool import ExiftoolSession
+
+# Answers commands like exiftool -stay_open: arguments are read one per
+# line until -executeNUM, then the output and {readyNUM} are written.
+EXIFTOOL = f'''#!{sys.executable}
+import sys
+import time
+
+args = []
+for line in sys.stdin:
+    arg = line.rstrip('\\n')
+    if arg.startswith('-execute'):
+        if args == ['exit']:
+            sys.exit(1)
+        if args == ['sleep']:
+            time.sleep(10)
+        sys.stdout.write(' '.join(args) + '\\n')
+        sys.stdout.write('{{ready' + arg[len('-execute'):] + '}}\\n')
+        sys.stdout.flush()
+        args = []
+    elif args == ['-stay_open'] and arg == 'False':
+        sys.exit(0)
+    else:
+        args.append(arg)
+'''
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    exiftool = tmp_path / 'exiftool'
+    exiftool.write_text(EXIFTOOL)
+    exiftool.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{tmp_path}{os.pathsep}{os.environ["PATH"]}')
+    session = ExiftoolSession()
+    yield session
+    session.close()
+
+
+def test_exiftool_session(session):
+    """
+    Pass: Commands are answered by one process until their output is complete.
+    Failure: Output is truncated or a process is started per command.
+    """
+    assert session.execute(['-j', 'first'], 5) == b'-j first\n'
+    process = session.process
+    assert session.execute(['-j', 'second'], 5) == b'-j second\n'
+    assert session.process is process
+
+    session.close()
+    assert process.returncode == 0
+    assert session.process is None
+
+
+def test_exiftool_session_timeout(session):
+    """
+    Pass: A command that times out kills the process and the next command restarts it.
+    Failure: The timeout is not raised or the next command reads stale output.
+    """
+    assert session.execute(['first'], 5) == b'first\n'
+    process = session.process
+    with pytest.raises(TimeoutError):
+        session.execute(['sleep'], 0.5)
+    assert session.process is None
+    assert process.returncode is not None
+
+    assert session.execute(['second'], 5) == b'second\n'
+
+
+def test_exiftool_session_restart(session):
+    """
+    Pass: A process that exits is reported and restarted on the next command.
+    Failure: The exit is not reported or the session stays broken.
+    """
+    with pytest.raises(OSError):
+        session.execute(['exit'], 5)
+    assert session.execute(['first'], 5) == b'first\n'
+
+    # A process that exits between commands is restarted.
+    session.process.kill()
+    session.process.wait()
+    assert session.execute(['second'], 5) == b'second\n'
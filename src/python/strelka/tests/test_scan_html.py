@@ -0,0 +1,44 @@
+import time
+
+from strelka import strelka
+from strelka.scanners.scan_html import ScanHtml
+
+HTML = b'''<html><head><title>Sign in</title></head><body>
+<a href="https://example.com/a">a</a><a href="https://example.com/a">a</a><a>b</a>
+<img src="data:image/png;base64,QUJD"><img src="logo.png">
+<form action="/login" method="post"><input type="text" name="user"><input type="text" name="user"></form>
+<iframe src="frame.html" width="1"></iframe>
+<span class="a  b" style="color: red">x</span><span class="a b" style="color: red">y</span>
+<div><div>QUJDRA==</div></div>
+<script type="text/JavaScript">var a = 1;</script>
+</body></html>'''
+
+
+def run_scanner(data, options):
+    scanner = ScanHtml({'limits': {'scanner': 10}}, None)
+    scanner.upload_to_coordinator = lambda pointer, chunk, expire_at: None
+    (files, event) = scanner.scan_wrapper(data, strelka.File(name='test'),
+                                          options, time.time() + 10)
+    event['html'].pop('elapsed')
+    return event['html'], [(f.name, f.flavors) for f in files]
+
+
+def test_scan_html_engines():
+    """
+    Pass: The lxml engine collects the same metadata and files as the soup
+        engine with the lxml parser, regardless of chunk size.
+    Failure: Metadata or extracted files differ between engines.
+    """
+    soup = run_scanner(HTML, {'parser': 'lxml'})
+    assert run_scanner(HTML, {'engine': 'lxml'}) == soup
+    assert run_scanner(HTML, {'engine': 'lxml', 'chunk_size': 16}) == soup
+
+    (event, files) = soup
+    assert event['title'] == 'Sign in'
+    assert event['hyperlinks'] == ['https://example.com/a', 'logo.png']
+    assert event['inputs'] == [{'type': 'text', 'name': 'user', 'value': None}]
+    assert event['spans'] == [{'class': ['a', 'b'], 'style': 'color: red'}]
+    assert event['total'] == {'scripts': 1, 'forms': 1, 'inputs': 2,
+                              'frames': 1, 'extracted': 4, 'spans': 2}
+    assert [name for (name, _) in files] == [
+        'base64_hyperlink', 'script_0', 'base64_div', 'base64_div']
@@ -0,0 +1,34 @@
+import time
+
+from strelka import artifacts, strelka
+from strelka.scanners.scan_javascript import ScanJavascript
+
+JS = br'''// comment
+var a = "x\"y", b = 'z', c = /ab+c/gi, d = 1.5e3 / 2 / 1;
+let t = `a${b + `n${c}`}d`;
+function f(x) { return x / 2 } if (a) { } /re/.test(a);
+x = y => ({ k: null, v: true }); a >>>= 0x1F; a = b ? "x" : 'z';
+'''
+
+
+def run_scanner(data, options):
+    scanner = ScanJavascript({'limits': {'scanner': 10}}, None)
+    file = strelka.File(name='test')
+    file.artifacts = artifacts.Artifacts(data)
+    (_, event) = scanner.scan_wrapper(data, file, options, time.time() + 10)
+    event['javascript'].pop('elapsed')
+    return event['javascript']
+
+
+def test_scan_javascript_lexer():
+    """
+    Pass: The lexer collects the same tokens as esprima.
+    Failure: Tokens differ between esprima and the lexer.
+    """
+    for beautify in (False, True):
+        esprima = run_scanner(JS, {'beautify': beautify})
+        lexer = run_scanner(JS, {'beautify': beautify, 'lexer_size': 0})
+        assert lexer == esprima
+
+    assert esprima['regular_expressions'] == ['/ab+c/gi', '/re/']
+    assert esprima['strings'] == ['x\\"y', 'z', 'x']
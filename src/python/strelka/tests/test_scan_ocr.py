@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+
+import fitz
+
+from strelka import strelka
+from strelka.scanners.scan_ocr import ScanOcr
+
+
+def make_tesseract(tmp_path, monkeypatch, delay, returncode=0):
+    log = tmp_path / 'tesseract.log'
+    tesseract = tmp_path / 'tesseract'
+    tesseract.write_text(f'''#!{sys.executable}
+import sys
+import time
+sys.stdin.buffer.read()
+with open({str(log)!r}, 'a') as f:
+    f.write('page\\n')
+time.sleep({delay})
+sys.stdout.write('text\\n')
+sys.exit({returncode})
+''')
+    tesseract.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{tmp_path}{os.pathsep}{os.environ["PATH"]}')
+    return log
+
+
+def make_pdf(pages):
+    document = fitz.open()
+    for i in range(pages):
+        document.new_page().insert_text((72, 72), f'page {i}')
+    return document.tobytes()
+
+
+def run_scanner(data, options, scanner=None):
+    if scanner is None:
+        scanner = ScanOcr({'limits': {'scanner': 10}}, None)
+    file = strelka.File(name='test')
+    file.add_flavors({'mime': ['application/pdf']})
+    (_, event) = scanner.scan_wrapper(data, file, {
+        'engine': 'cli',
+        'pdf_to_png': True,
+        'pdf_pages': 0,
+        **options,
+    }, time.time() + 10)
+    return event['ocr']
+
+
+def test_scan_ocr_pages(tmp_path, monkeypatch):
+    """
+    Pass: Pages are recognized concurrently and their text is collected in order.
+    Failure: Pages are missing from the text.
+    """
+    make_tesseract(tmp_path, monkeypatch, 0)
+    event = run_scanner(make_pdf(3), {'threads': 2})
+    assert event['flags'] == []
+    assert event['raw'] == b'text\ntext\ntext'
+
+
+def test_scan_ocr_pdf_pages(tmp_path, monkeypatch):
+    """
+    Pass: Only the first page is recognized by default and pages are flagged as truncated only past a set limit.
+    Failure: Pages are truncated without a limit or the flag is missing.
+    """
+    make_tesseract(tmp_path, monkeypatch, 0)
+    event = run_scanner(make_pdf(3), {'pdf_pages': None})
+    assert event['flags'] == []
+    assert event['raw'] == b'text'
+
+    event = run_scanner(make_pdf(3), {'pdf_pages': 2})
+    assert event['flags'] == ['pages_truncated']
+    assert event['raw'] == b'text\ntext'
+
+    event = run_scanner(make_pdf(2), {'pdf_pages': 2})
+    assert event['flags'] == []
+
+
+def test_scan_ocr_timeout(tmp_path, monkeypatch):
+    """
+    Pass: A scanner timeout returns without waiting for queued pages, which are not recognized.
+    Failure: The scan waits for every page or queued pages are recognized.
+    """
+    log = make_tesseract(tmp_path, monkeypatch, 2, returncode=1)
+    scanner = ScanOcr({'limits': {'scanner': 1}}, None)
+    start = time.time()
+    event = run_scanner(make_pdf(6), {'threads': 2}, scanner=scanner)
+    assert event['flags'] == ['pages_truncated', 'timed_out']
+    assert time.time() - start < 2
+
+    # Only the pages that were running at the timeout are recognized and
+    # their flags are not added after the scan.
+    time.sleep(2.5)
+    assert log.read_text() == 'page\npage\n'
+    assert event['flags'] == ['pages_truncated', 'timed_out']
+    assert scanner.flags == ['pages_truncated', 'timed_out']
@@ -0,0 +1,105 @@
+import time
+
+import fitz
+
+from strelka import strelka
+from strelka.scanners.scan_pdf import ScanPdf
+
+
+def make_pdf(pages):
+    document = fitz.open()
+    for i in range(pages):
+        page = document.new_page()
+        page.insert_text((72, 72), f'page {i}')
+        page.insert_link({
+            'kind': fitz.LINK_URI,
+            'from': fitz.Rect(0, 0, 50, 50),
+            'uri': f'https://example.com/{i}',
+        })
+    return document.tobytes()
+
+
+def run_scanner(data, options):
+    scanner = ScanPdf({'limits': {'scanner': 30}}, None)
+    uploads = {}
+    scanner.upload_to_coordinator = lambda pointer, chunk, expire_at: uploads.setdefault(pointer, []).append(chunk)
+    (files, event) = scanner.scan_wrapper(data, strelka.File(name='test'),
+                                          options, time.time() + 30)
+    event['pdf'].pop('elapsed')
+    event['pdf']['annotated_uris'].sort()
+    return event['pdf'], [(f.name, ''.join(map(str, uploads.get(f.pointer, [])))) for f in files]
+
+
+def test_scan_pdf_processes():
+    """
+    Pass: Documents processed in worker processes produce the same metadata
+        and files as documents processed in the scanner's process.
+    Failure: Metadata or extracted files differ, or the pool fails.
+    """
+    data = make_pdf(30)
+    options = {'extract_text': True, 'range_size': 8}
+
+    (event, files) = run_scanner(data, options)
+    assert event['flags'] == ['extracted_text']
+    assert len(event['annotated_uris']) == 30
+    assert files[-1][0] == 'text' and 'page 29' in files[-1][1]
+    assert run_scanner(data, {**options, 'processes': 2}) == (event, files)
+
+
+def test_scan_pdf_budget():
+    """
+    Pass: Pages and xrefs beyond the budget are not processed and flagged.
+    Failure: The budget is not enforced or not flagged.
+    """
+    (event, files) = run_scanner(make_pdf(10), {
+        'extract_text': True,
+        'max_pages': 4,
+        'max_xrefs': 5,
+    })
+
+    assert event['flags'] == ['xrefs_truncated', 'pages_truncated', 'extracted_text']
+    assert 'page 3' in files[-1][1] and 'page 4' not in files[-1][1]
+
+
+def test_scan_pdf_duplicates():
+    """
+    Pass: Identical objects are extracted once and duplicates are recorded
+        as references to the extracted file.
+    Failure: Duplicate objects are extracted or not recorded.
+    """
+    document = fitz.open()
+    for i in range(3):
+        page = document.new_page()
+        page.insert_text((72, 72), 'same text')
+    data = document.tobytes(garbage=0)
+
+    (event, files) = run_scanner(data, {})
+    names = [name for (name, _) in files]
+    assert event['total']['duplicates'] == 2
+    assert [d['duplicate_of'] for d in event['duplicates']] == [names[0]] * 2
+    assert len(set(data for (_, data) in files)) == len(files)
+
+    (event, files) = run_scanner(data, {'max_duplicates': 1})
+    assert event['total']['duplicates'] == 2
+    assert len(event['duplicates']) == 1
+    assert event['flags'] == ['duplicates_truncated']
+
+
+def test_scan_pdf_text_timeout():
+    """
+    Pass: Text that was uploaded before the scanner timed out is listed as a file.
+    Failure: Uploaded text is not returned as a file.
+    """
+    scanner = ScanPdf({'limits': {'scanner': 30}}, None)
+    uploads = {}
+
+    def upload(pointer, chunk, expire_at):
+        uploads.setdefault(pointer, []).append(chunk)
+        if isinstance(chunk, str):
+            raise strelka.ScannerTimeout
+
+    scanner.upload_to_coordinator = upload
+    (files, event) = scanner.scan_wrapper(make_pdf(2), strelka.File(name='test'),
+                                          {'extract_text': True}, time.time() + 30)
+    assert files[-1].name == 'text'
+    assert 'page 1' in uploads[files[-1].pointer][0]
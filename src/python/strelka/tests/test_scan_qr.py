@@ -0,0 +1,84 @@
+import concurrent.futures
+import io
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw
+
+from strelka.scanners import scan_qr
+
+
+def make_image(text, size=(600, 800), module=4, angle=0, blur=0, quality=None):
+    code = cv2.QRCodeEncoder.create().encode(text)
+    code = cv2.resize(code, None, fx=module, fy=module, interpolation=cv2.INTER_NEAREST)
+    image = np.full(size, 240, np.uint8)
+    image[100:100 + code.shape[0], 200:200 + code.shape[1]] = code
+    if angle:
+        center = (200 + code.shape[1] / 2, 100 + code.shape[0] / 2)
+        matrix = cv2.getRotationMatrix2D(center, angle, 1)
+        image = cv2.warpAffine(image, matrix, size[::-1], borderValue=240)
+    if blur:
+        image = cv2.GaussianBlur(image, (0, 0), blur)
+    if quality:
+        buffer = io.BytesIO()
+        Image.fromarray(image).save(buffer, 'JPEG', quality=quality)
+        return Image.open(buffer)
+    return Image.fromarray(image)
+
+
+def test_scan_qr_decode():
+    """
+    Pass: QR codes are decoded with and without a pool, and images without
+        finder patterns are skipped by the prefilter.
+    Failure: A QR code is not decoded or a blank image passes the prefilter.
+    """
+    detector = cv2.wechat_qrcode.WeChatQRCode()
+    image = make_image('https://example.com/qr')
+    blank = Image.new('RGB', (800, 600), (240, 240, 240))
+
+    assert scan_qr._qr_likely(np.asarray(image))
+    assert not scan_qr._qr_likely(np.asarray(blank.convert('L')))
+
+    assert scan_qr._decode_qr(image, detector) == {'https://example.com/qr'}
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        assert scan_qr._decode_qr(image, detector, pool=pool, window=2,
+                                  deadline=time.time() + 10) == {'https://example.com/qr'}
+        assert scan_qr._decode_qr(blank, detector, pool=pool, window=2) == set()
+
+
+def test_scan_qr_prefilter():
+    """
+    Pass: Rotated, blurred, and compressed QR codes pass the prefilter and are decoded.
+    Failure: A QR code is skipped by the prefilter.
+    """
+    detector = cv2.wechat_qrcode.WeChatQRCode()
+    for module in range(3, 9):
+        for angle in (0, 30, 45):
+            for quality in (None, 30):
+                image = make_image('https://example.com/qr', module=module, angle=angle,
+                                   blur=1, quality=quality)
+                assert scan_qr._qr_likely(np.asarray(image)), (module, angle, quality)
+
+    image = make_image('https://example.com/qr', module=3, angle=45, blur=1, quality=30)
+    assert scan_qr._decode_qr(image, detector, prefilter=True) == {'https://example.com/qr'}
+
+
+def test_scan_qr_prefilter_negative():
+    """
+    Pass: Images without QR codes (noise, blurred noise, text, and checkerboards) are rejected by the prefilter.
+    Failure: An image without a QR code passes the prefilter.
+    """
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, (600, 800), dtype=np.uint8)
+    blurred = cv2.GaussianBlur(noise, (0, 0), 3)
+    text = Image.new('L', (800, 600), 255)
+    draw = ImageDraw.Draw(text)
+    for y in range(10, 590, 14):
+        draw.text((10, y), ''.join(chr(c) for c in rng.integers(33, 127, 120)), fill=0)
+    checkerboard = np.kron(np.indices((75, 100)).sum(axis=0) % 2 * 255,
+                           np.ones((8, 8))).astype(np.uint8)
+
+    for (name, image) in [('noise', noise), ('blurred', blurred),
+                          ('text', np.asarray(text)), ('checkerboard', checkerboard)]:
+        assert not scan_qr._qr_likely(image), name
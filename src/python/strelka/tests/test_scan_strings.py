@@ -0,0 +1,38 @@
+import random
+import time
+
+from strelka import strelka
+from strelka.scanners.scan_strings import ScanStrings
+
+
+def run_scanner(data, options):
+    scanner = ScanStrings({'limits': {'scanner': 10}}, None)
+    (_, event) = scanner.scan_wrapper(data, strelka.File(name='test'),
+                                      options, time.time() + 10)
+    return event['strings']
+
+
+def test_scan_strings_engines():
+    """
+    Pass: The numpy engine collects the same strings as the regex engine.
+    Failure: Strings differ between engines.
+    """
+    rng = random.Random(0)
+    alphabet = bytes(range(0x20, 0x7F)) + b'\x00\n\xff()[]{}' * 5
+    for _ in range(50):
+        data = bytes(rng.choice(alphabet) for _ in range(rng.randint(0, 2000)))
+        for options in ({}, {'limit': 5}, {'enable_raw': True}):
+            regex = run_scanner(data, {'engine': 'regex', **options})
+            numpy = run_scanner(data, options)
+            assert regex.get('strings') == numpy.get('strings')
+
+
+def test_scan_strings_wide():
+    """
+    Pass: UTF-16LE strings are collected at both alignments.
+    Failure: Wide strings are missing or incorrect.
+    """
+    data = b'\x01' + 'Hello World'.encode('utf-16le') + b'\xff' \
+        + 'abc1234'.encode('utf-16le')
+    event = run_scanner(data, {'wide': True})
+    assert event['wide_strings'] == ['Hello World', 'abc1234']
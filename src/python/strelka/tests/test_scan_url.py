@@ -0,0 +1,52 @@
+import time
+
+from strelka import strelka
+from strelka.scanners.scan_url import ScanUrl
+
+
+def run_scanner(data, options):
+    scanner = ScanUrl({'limits': {'scanner': 10}}, None)
+    (_, event) = scanner.scan_wrapper(data, strelka.File(name='test'),
+                                      options, time.time() + 10)
+    return event['url']
+
+
+def test_scan_url_duplicates():
+    """
+    Pass: URLs are collected once, in order of first match, and files over 4 MB are skipped.
+    Failure: URLs are duplicated or reordered, or large files are scanned.
+    """
+    data = b'https://b.example.com/ a.example.org https://b.example.com/. a.example.org ' * 1000
+    event = run_scanner(data, {})
+    assert event['urls'] == [b'https://b.example.com', b'a.example.org']
+
+    assert 'urls' not in run_scanner(b'example.com ' * 400000, {})
+
+
+def test_scan_url_entities():
+    """
+    Pass: HTML entities are decoded before URLs are collected.
+    Failure: URLs are truncated at entities or duplicated.
+    """
+    data = b'href="https://example.com/sso?a=1&amp;b=2" https://example.com/sso?a=1&b=2'
+    event = run_scanner(data, {})
+    assert event['urls'] == [b'https://example.com/sso?a=1&b=2']
+
+
+def test_scan_url_regex_set():
+    """
+    Pass: Named regexes are matched in one pass and collected per name.
+    Failure: Matches are missing, duplicated, or collected under the wrong name.
+    """
+    data = b'bob@example.com sent 10.0.0.1 to abc.onion and bob@example.com'
+    event = run_scanner(data, {'regex_set': {
+        'email': r'[\w.+-]+@[\w-]+\.[\w.]+',
+        'ip': r'\b(\d{1,3})(?:\.(\d{1,3})){3}\b',
+        'onion': r'\b[a-z2-7]{3,56}\.onion\b',
+    }})
+    assert event['matches'] == {
+        'email': [b'bob@example.com'],
+        'ip': [b'10.0.0.1'],
+        'onion': [b'abc.onion'],
+    }
+
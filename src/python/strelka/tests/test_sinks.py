@@ -0,0 +1,107 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+import yaml
+
+from strelka import sinks
+
+
+def test_parquet_sink(tmp_path):
+    """
+    Pass: Promoted fields are written as columns and the rest as JSON.
+    Failure: Unable to write or read back the Parquet file.
+    """
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    event = {
+        'file': {
+            'depth': 0,
+            'name': 'test.txt',
+            'size': 5,
+            'flavors': {'mime': ['text/plain']},
+            'scanners': ['ScanHash', 'ScanUrl'],
+            'tree': {'node': 'a', 'root': 'a'},
+        },
+        'scan': {
+            'hash': {'elapsed': 0.1, 'md5': 'b1946ac92492d2347c6235b4d2611184'},
+            'url': {'elapsed': 0.2, 'flags': ['test'], 'urls': ['example.com']},
+        },
+    }
+
+    sink = sinks.ParquetSink(str(tmp_path), batch_size=1)
+    sink.write([json.dumps(event)])
+    sink.close()
+
+    rows = pq.read_table(str(tmp_path)).to_pylist()
+    assert len(rows) == 1
+    assert rows[0]['size'] == 5
+    assert rows[0]['flavors_mime'] == ['text/plain']
+    assert rows[0]['md5'] == 'b1946ac92492d2347c6235b4d2611184'
+    assert rows[0]['scanner_stats'][1] == {'name': 'url', 'elapsed': 0.2, 'flags': ['test']}
+    assert json.loads(rows[0]['event']) == {'scan': {'url': {'urls': ['example.com']}}}
+
+
+def test_parquet_sink_keys(tmp_path):
+    """
+    Pass: Keys are returned only once their events are in a complete part file.
+    Failure: Keys are returned for buffered events or part files are unreadable before close.
+    """
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    def event(name):
+        return {'file': {'name': name, 'tree': {'node': name}}, 'scan': {}}
+
+    sink = sinks.ParquetSink(str(tmp_path), batch_size=2)
+    assert sink.write([event('a')], 'a') == []
+    assert sink.write([], 'skipped') == []
+    assert sink.write([event('b')], 'b') == ['a', 'skipped', 'b']
+    assert sink.write([event('c')], 'c') == []
+
+    # A killed process leaves only complete part files behind.
+    assert [r['name'] for r in pq.read_table(str(tmp_path)).to_pylist()] == ['a', 'b']
+
+    assert sink.close() == ['c']
+    assert sorted(r['name'] for r in pq.read_table(str(tmp_path)).to_pylist()) == ['a', 'b', 'c']
+
+
+def test_parquet_corpus_resume(tmp_path):
+    """
+    Pass: A resumed strelka-corpus run scans only files that are not checkpointed.
+    Failure: Checkpointed files are scanned again or their events are missing.
+    """
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    (tmp_path / 'taste').mkdir()
+    config = tmp_path / 'backend.yaml'
+    config.write_text(yaml.safe_dump({
+        'limits': {'distribution': 60, 'scanner': 30, 'max_depth': 5, 'time_to_live': 0, 'max_files': 0},
+        'tasting': {'mime_db': None, 'yara_rules': str(tmp_path / 'taste')},
+        'scanners': {'ScanFooter': [{'positive': {'flavors': ['*']}, 'priority': 5}]},
+    }))
+    corpus = tmp_path / 'corpus'
+    corpus.mkdir()
+    output = tmp_path / 'events'
+    checkpoint = tmp_path / 'checkpoint'
+
+    def run():
+        subprocess.run(
+            [sys.executable, os.path.join(os.path.dirname(__file__), '..', '..', 'bin', 'strelka-corpus'),
+             '-c', str(config), '-f', 'parquet', '-o', str(output), '-k', str(checkpoint),
+             '-p', '1', '--batch-size', '2', str(corpus)],
+            env={**os.environ, 'PYTHONPATH': os.path.join(os.path.dirname(__file__), '..', '..')},
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+
+    for name in ['a', 'b', 'c']:
+        (corpus / name).write_bytes(name.encode())
+    run()
+    (corpus / 'd').write_bytes(b'd')
+    run()
+
+    assert len(checkpoint.read_text().splitlines()) == 4
+    names = sorted(os.path.basename(r['name']) for r in pq.read_table(str(output)).to_pylist())
+    assert names == ['a', 'b', 'c', 'd']
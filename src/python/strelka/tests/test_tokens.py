@@ -0,0 +1,27 @@
+from pygments import lexers
+
+from strelka import tokens
+
+
+def test_tokens():
+    """
+    Pass: Token values are collected into fields, deduplicated, and capped.
+    Failure: Values are missing, duplicated, or exceed the limit.
+    """
+    lexer = lexers.get_lexer_by_name('php')
+    data = b'<?php $a = "x"; $b = \'x\'; $c = "\xc3\xa9"; echo $a; ?>'
+    fields = {
+        'Token.Literal.String.Double': 'strings',
+        'Token.Literal.String.Single': 'strings',
+        'Token.Name.Variable': 'variables',
+    }
+
+    (values, full) = tokens.collect(lexer, data, fields)
+    assert values['strings'] == ['x', '\\xe9']
+    assert values['variables'] == ['$a', '$b', '$c']
+    assert 'Token.Name.Variable' in values['tokens']
+    assert full == []
+
+    (values, full) = tokens.collect(lexer, data, fields, limit=2)
+    assert values['variables'] == ['$a', '$b']
+    assert full == ['strings', 'variables']
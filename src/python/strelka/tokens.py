@@ -0,0 +1,61 @@
+"""Aggregates pygments tokens into event fields.
+
+Script scanners that use pygments lexers collect the unique values of some
+token types into event fields. collect consumes the lexer's token stream
+directly, maps token types to fields through a table, deduplicates values
+with ordered dictionaries, and caps the number of values per field.
+
+Values are formatted as they were when tokens were serialized with
+pygments.formatters.RawTokenFormatter (ASCII representation without
+surrounding quotes or whitespace), so events are unchanged.
+"""
+
+
+def format_value(value):
+    """Formats a token value like RawTokenFormatter output."""
+    return ascii(value).strip('\'"').strip()
+
+
+def collect(lexer, data, fields, limit=0):
+    """Collects unique token values into fields.
+
+    Args:
+        lexer: Pygments lexer used to tokenize data.
+        data: Data (bytes or string) to tokenize.
+        fields: Dictionary of token types (e.g. 'Token.Keyword') to names of
+            fields that collect their values. Several token types may map to
+            the same field.
+        limit: Maximum number of values collected per field. If this value is
+            0, then all values are collected. Once every field is full,
+            tokenization stops.
+    Returns:
+        Dictionary of field names (and 'tokens', the token types seen) to
+        lists of unique values, and a list of fields that reached the limit.
+    """
+    tokens = {}
+    values = {name: {} for name in ['tokens', *fields.values()]}
+    full = set()
+    # Token types are hashed by identity, so their names are cached.
+    names = {}
+
+    for (ttype, value) in lexer.get_tokens(data):
+        name = names.get(ttype)
+        if name is None:
+            name = names[ttype] = str(ttype)
+
+        value = format_value(value)
+        if not value:
+            continue
+        tokens.setdefault(name)
+
+        field = fields.get(name)
+        if field is None or field in full:
+            continue
+        values[field].setdefault(value)
+        if limit and len(values[field]) >= limit:
+            full.add(field)
+            if len(full) == len(values) - 1:
+                break
+
+    values['tokens'] = tokens
+    return {name: list(v) for (name, v) in values.items()}, sorted(full)
@@ -115,3 +115,27 @@ EXTERNAL_VARS = {
     'zonealarm': '',
     'zoner': '',
 }
+
+
+def file_externals(file):
+    """Returns external variables populated from a file.
+
+    Support some common external variables (backcompat). Values that cannot
+    be derived from the file are empty strings.
+
+    Args:
+        file: File whose name and artifacts populate the variables
+            (see strelka.File).
+    Returns:
+        Dictionary of external variables.
+    """
+    externals = dict(EXTERNAL_VARS)
+    externals['filename'] = file.name
+    externals['file_name'] = file.name
+    extension = file.name.split('.')[-1]
+    if extension:
+        externals['extension'] = '.' + extension
+        externals['filetype'] = extension
+        externals['file_type'] = extension
+    externals.update(file.artifacts.digests(['md5', 'sha1', 'sha256']))
+    return externals